@@ -22,6 +22,11 @@ MatchEngine, MobileEngine, MulticolorEngine and WineEngine are general image mat
       install_requires=[
           'requests>=2.7.0,<3.0'
       ],
+      extras_require={
+          'numpy': ['numpy'],
+          'pandas': ['numpy', 'pandas'],
+          'arrow': ['numpy', 'pyarrow'],
+      },
       entry_points="""
       # -*- Entry points: -*-
       """,
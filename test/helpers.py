@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import threading
+
+from tineyeservices import MatchEngineRequest, MulticolorEngineRequest
+
+
+def response(method, result=None, errors=None):
+    """ Return an API response with `result`, failed if there are `errors`. """
+    return {'status': 'fail' if errors else 'ok', 'error': errors or [], 'method': method,
+            'result': result if result is not None else []}
+
+
+def indexed(params, name):
+    """ Return the values of the `name[0]`, `name[1]`, ... parameters of a call in order. """
+    values = []
+    while '%s[%i]' % (name, len(values)) in params:
+        values.append(params['%s[%i]' % (name, len(values))])
+    return values
+
+
+class FakeResponse(object):
+    """ The HTTP response to a ping, for fakes replacing the transport. """
+
+    status_code = 200
+
+    def json(self):
+        return response('ping')
+
+
+class RecordingRequest(object):
+    """
+    Mixin answering API calls locally instead of sending them.
+
+    Each call is recorded in `calls` as a `(method, params, file_params)`
+    tuple, with the extra keyword arguments among the params as the API
+    gets them, then answered by `respond`. Subclasses override `respond` to
+    return the response dictionary, or to raise as a failed call would. By
+    default every call succeeds with an empty result.
+
+    Copies made by `with_deadline` or `with_priority` share the calls.
+    """
+
+    def __init__(self, **kwargs):
+        super(RecordingRequest, self).__init__(**kwargs)
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def _request(self, method, params, file_params=None, **kwargs):
+        params = dict(params, **kwargs)
+        with self.lock:
+            self.calls.append((method, params, file_params))
+        return self.respond(method, params, file_params)
+
+    def respond(self, method, params, file_params):
+        return response(method)
+
+    def methods(self):
+        """ Return the method of each call, in order. """
+        with self.lock:
+            return [method for method, params, file_params in self.calls]
+
+    def writes(self):
+        """ Return the `(method, filepaths)` of each call, in order. """
+        with self.lock:
+            return [(method, indexed(params, 'filepaths')) for method, params, file_params in self.calls]
+
+    def reset(self):
+        """ Forget the calls made so far. """
+        with self.lock:
+            del self.calls[:]
+
+
+class FakeMatchEngineRequest(RecordingRequest, MatchEngineRequest):
+    pass
+
+
+class FakeMulticolorEngineRequest(RecordingRequest, MulticolorEngineRequest):
+    pass
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import sys
+import unittest
+
+import numpy
+
+from tineyeservices.arrays import (
+    COLOR_MATCH_FIELDS, COUNT_COLOR_FIELDS, EXTRACT_COLOR_FIELDS, check_result_format,
+    color_result_array, color_result_dataframe, format_search_response, match_result_array,
+    match_result_dataframe, match_result_table, pandas, pyarrow)
+
+sys.path.append('../')
+
+extract_result = [
+    {'color': [141, 125, 83], 'rank': 1, 'weight': '76.37', 'name': 'Clay Creek', 'class': 'Grey'},
+    {'color': 'ffffff', 'rank': 2, 'weight': 23.63, 'name': 'White', 'class': 'White'}]
+
+count_result = [
+    {'color': [255, 255, 255], 'num_images_partial_area': '2', 'num_images_full_area': 1,
+     'name': 'White', 'class': 'White'}]
+
+search_result = [
+    {'filepath': 'match1.png', 'score': '97.2', 'overlay': 'overlay/query.png/match1.png',
+     'match_percent': '90.0', 'query_overlap_percent': 85.5, 'target_overlap_percent': '80.1'},
+    {'filepath': 'match2.png', 'score': 45.0, 'overlay': 'overlay/query.png/match2.png'}]
+
+color_search_result = [
+    {'filepath': 'red.png', 'score': '88.5', 'metadata': {'keywords': ['red']}},
+    {'filepath': 'pink.png', 'score': 61.0}]
+
+
+class TestArrays(unittest.TestCase):
+    """ Test conversion of color results to arrays. """
+
+    def test_check_result_format(self):
+        check_result_format('json')
+        self.assertRaises(ValueError, check_result_format, 'xml')
+
+    def test_color_result_array(self):
+        colors = color_result_array(extract_result, EXTRACT_COLOR_FIELDS)
+        self.assertEqual(colors['color'].dtype, numpy.uint8)
+        self.assertEqual(colors['color'].tolist(), [[141, 125, 83], [255, 255, 255]])
+        self.assertEqual(colors['rank'].tolist(), [1, 2])
+        self.assertEqual(colors['weight'].tolist(), [76.37, 23.63])
+        self.assertEqual(colors['name'].tolist(), ['Clay Creek', 'White'])
+
+        counts = color_result_array(count_result, COUNT_COLOR_FIELDS)
+        self.assertEqual(counts['num_images_partial_area'].tolist(), [2.0])
+        self.assertEqual(counts['num_images_full_area'].tolist(), [1.0])
+
+        # Empty results keep their fields
+        self.assertEqual(len(color_result_array([], COUNT_COLOR_FIELDS)), 0)
+
+    @unittest.skipIf(pandas is None, 'pandas is not installed')
+    def test_color_result_dataframe(self):
+        frame = color_result_dataframe(extract_result, EXTRACT_COLOR_FIELDS)
+        self.assertEqual(list(frame.columns), ['red', 'green', 'blue', 'rank', 'weight', 'name', 'class'])
+        self.assertEqual(frame['red'].tolist(), [141, 255])
+        self.assertEqual(frame['weight'].tolist(), [76.37, 23.63])
+
+    def test_match_result_array(self):
+        matches = match_result_array(search_result)
+        self.assertEqual(matches['score'].dtype, numpy.float32)
+        self.assertEqual(matches['filepath'].tolist(), ['match1.png', 'match2.png'])
+        numpy.testing.assert_allclose(matches['score'], [97.2, 45.0], rtol=1e-6)
+        # Fields the engine did not send are NaN
+        self.assertTrue(numpy.isnan(matches['match_percent'][1]))
+
+        matches = match_result_array(color_search_result, COLOR_MATCH_FIELDS)
+        self.assertEqual(matches.dtype.names, ('filepath', 'score', 'metadata'))
+        self.assertEqual(matches['metadata'].tolist(), [{'keywords': ['red']}, None])
+
+        self.assertEqual(len(match_result_array([])), 0)
+
+    @unittest.skipIf(pandas is None, 'pandas is not installed')
+    def test_match_result_dataframe(self):
+        frame = match_result_dataframe(color_search_result, COLOR_MATCH_FIELDS)
+        self.assertEqual(list(frame.columns), ['filepath', 'score', 'metadata'])
+        self.assertEqual(frame['score'].dtype, numpy.float32)
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_match_result_table(self):
+        table = match_result_table(search_result)
+        self.assertEqual(table.schema.field('score').type, pyarrow.float32())
+        self.assertEqual(table.column('filepath').to_pylist(), ['match1.png', 'match2.png'])
+        self.assertEqual(table.column('match_percent').to_pylist()[0], 90.0)
+
+        # Metadata is stored as JSON
+        table = match_result_table(color_search_result, COLOR_MATCH_FIELDS)
+        self.assertEqual(table.column('metadata').to_pylist(), ['{"keywords": ["red"]}', None])
+
+    def test_format_search_response(self):
+        response = {'status': 'ok', 'error': [], 'method': 'search', 'result': list(search_result)}
+        self.assertIs(format_search_response(response, 'json'), response)
+        numpy_response = format_search_response(dict(response), 'numpy')
+        self.assertEqual(numpy_response['result']['filepath'].tolist(), ['match1.png', 'match2.png'])
+
+        # Failed responses are returned as is
+        failed = {'status': 'fail', 'error': ['Missing image'], 'method': 'search', 'result': []}
+        self.assertEqual(format_search_response(failed, 'numpy')['result'], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from tineyeservices import DuplicateClusterJob
+from tineyeservices.cluster import UnionFind
+from test.helpers import FakeMatchEngineRequest, response
+
+sys.path.append('../')
+
+# Scores between the images of a collection, in both directions
+SCORES = {('a.jpg', 'b.jpg'): 90, ('b.jpg', 'c.jpg'): 85, ('d.jpg', 'e.jpg'): 70}
+
+
+class CollectionRequest(FakeMatchEngineRequest):
+    """ Answer list and search calls from the SCORES table. """
+
+    def respond(self, method, params, file_params):
+        if method == 'list':
+            filepaths = ['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg', 'e.jpg', 'f.jpg']
+            return response(method, filepaths[params['offset']:params['offset'] + params['limit']])
+        filepath = params['filepath']
+        result = [{'filepath': filepath, 'score': 100}]
+        for (first, second), score in SCORES.items():
+            if filepath in (first, second) and score >= params['min_score']:
+                result.append({'filepath': second if filepath == first else first, 'score': score})
+        return response(method, result[:params['limit']])
+
+    def searches(self):
+        """ Return the filepaths searched. """
+        with self.lock:
+            return [params['filepath'] for method, params, file_params in self.calls if method == 'search']
+
+
+class TestUnionFind(unittest.TestCase):
+    """ Test UnionFind class. """
+
+    def test_union(self):
+        groups = UnionFind()
+        groups.union('a.jpg', 'b.jpg')
+        groups.union('c.jpg', 'd.jpg')
+        groups.add('e.jpg')
+        self.assertEqual(groups.find('a.jpg'), groups.find('b.jpg'))
+        self.assertNotEqual(groups.find('a.jpg'), groups.find('c.jpg'))
+        self.assertEqual(groups.group_size('e.jpg'), 1)
+
+        # Joining two groups
+        groups.union('b.jpg', 'd.jpg')
+        self.assertEqual(groups.find('a.jpg'), groups.find('c.jpg'))
+        self.assertEqual(groups.group_size('a.jpg'), 4)
+
+        clusters = sorted(sorted(group) for group in groups.groups(min_size=2))
+        self.assertEqual(clusters, [['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg']])
+        self.assertEqual(len(groups.groups()), 2)
+
+
+class TestDuplicateClusterJob(unittest.TestCase):
+    """ Test DuplicateClusterJob class. """
+
+    def setUp(self):
+        self.api = CollectionRequest()
+
+    def test_run(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'clusters.jsonl')
+            job = DuplicateClusterJob(self.api, min_score=80, max_workers=2)
+            clusters = job.run(output_path=path)
+            self.assertEqual(sorted(clusters), [['a.jpg', 'b.jpg', 'c.jpg']])
+            self.assertEqual(job.searched, 6)
+            self.assertEqual(job.skipped, 0)
+            with open(path) as fp:
+                self.assertEqual([json.loads(line) for line in fp], clusters)
+        finally:
+            shutil.rmtree(directory)
+
+        # A lower score joins the images below the first threshold
+        clusters = DuplicateClusterJob(CollectionRequest(), min_score=60).run()
+        self.assertEqual(sorted(clusters), [['a.jpg', 'b.jpg', 'c.jpg'], ['d.jpg', 'e.jpg']])
+
+    def test_skip_clustered(self):
+        job = DuplicateClusterJob(self.api, min_score=80, skip_clustered=True, max_workers=1)
+        self.assertEqual(job.run(), [['a.jpg', 'b.jpg', 'c.jpg']])
+        # b.jpg joined the cluster of a.jpg before its turn came
+        self.assertEqual(job.skipped, 1)
+        self.assertEqual(job.searched, 5)
+        self.assertNotIn('b.jpg', self.api.searches())
+
+        # A second run starts over rather than skipping every image
+        self.assertEqual(job.run(), [['a.jpg', 'b.jpg', 'c.jpg']])
+        self.assertEqual((job.searched, job.skipped), (5, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
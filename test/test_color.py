@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import sys
+import unittest
+
+from tineyeservices.color import colors_to_array, normalize_color, normalize_colors, normalize_weights, numpy
+
+sys.path.append('../')
+
+
+class TestColor(unittest.TestCase):
+    """ Test color normalization. """
+
+    def test_normalize_color(self):
+        self.assertEqual(normalize_color('255, 112, 223'), '255,112,223')
+        self.assertEqual(normalize_color('#DF4F23'), 'df4f23')
+        self.assertEqual(normalize_color((223, 79, 35)), '223,79,35')
+
+        # Malformed colors
+        for color in ['256,0,0', '1,2', 'DF4F2', 'GF4F23', (1, 2), (1, 2, 300), (1.5, 2, 3), (True, 0, 0)]:
+            self.assertRaises(ValueError, normalize_color, color)
+        self.assertRaises(TypeError, normalize_color, 12)
+        self.assertRaises(TypeError, normalize_color, True)
+
+    def test_normalize_colors(self):
+        colors = normalize_colors(['255,255,235', '12FA3B', [0, 0, 0]])
+        self.assertEqual(colors, ['255,255,235', '12fa3b', '0,0,0'])
+        self.assertRaises(TypeError, normalize_colors, '255,255,235')
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_normalize_arrays(self):
+        colors = normalize_colors(numpy.array([[255, 255, 235], [18, 250, 59]], dtype=numpy.uint8))
+        self.assertEqual(colors, ['255,255,235', '18,250,59'])
+        self.assertRaises(ValueError, normalize_colors, numpy.array([[255, 255, 256]]))
+        self.assertRaises(ValueError, normalize_colors, numpy.array([1, 2, 3]))
+        self.assertRaises(ValueError, normalize_colors, numpy.array([[True, False, True]]))
+        self.assertRaises(ValueError, normalize_color, (numpy.bool_(True), 0, 0))
+
+    def test_normalize_weights(self):
+        self.assertEqual(normalize_weights([1, '2', 0.5]), ['1', '2', '0.5'])
+        self.assertRaises(ValueError, normalize_weights, ['heavy'])
+        self.assertRaises(ValueError, normalize_weights, [-1])
+
+        # Weights must cover every color, but may be left out entirely
+        self.assertEqual(normalize_weights([], ['ffffff', '000000']), [])
+        self.assertRaises(ValueError, normalize_weights, ['1'], ['ffffff', '000000'])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_colors_to_array(self):
+        colors = colors_to_array(['255,255,235', '12FA3B', (0, 0, 0)])
+        self.assertEqual(colors.dtype, numpy.uint8)
+        self.assertEqual(colors.tolist(), [[255, 255, 235], [18, 250, 59], [0, 0, 0]])
+        self.assertEqual(colors_to_array([]).shape, (0, 3))
+
+if __name__ == '__main__':
+    unittest.main()
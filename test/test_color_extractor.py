@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import sys
+import unittest
+
+import requests
+
+from tineyeservices import BulkColorExtractor, Image
+from tineyeservices.color_extractor import ColorStore
+from test.helpers import FakeMulticolorEngineRequest, response
+
+sys.path.append('../')
+
+
+class ExtractRequest(FakeMulticolorEngineRequest):
+    """
+    Answer extract_image_colors calls with one color per image, failing for
+    URLs containing 'bad' and failing to connect for 'down'.
+    """
+
+    def respond(self, method, params, file_params):
+        source = self.source(params, file_params)
+        if 'down' in str(source):
+            raise requests.ConnectionError('Connection refused')
+        if 'bad' in str(source):
+            return response(method, errors=['Could not download image'])
+        return response(method, [{'color': [255, 235, 0], 'weight': 80.5, 'rank': 1, 'class': 'Yellow'}])
+
+    def source(self, params, file_params):
+        """ Return the image bytes or URL a call extracts colors from. """
+        if file_params:
+            return bytes(list(file_params.values())[0][1])
+        return params['urls[0]']
+
+    def sources(self):
+        """ Return the `(source, limit)` of each call. """
+        with self.lock:
+            return [(self.source(params, file_params), params['limit'])
+                    for method, params, file_params in self.calls]
+
+
+class TestColorStore(unittest.TestCase):
+    """ Test ColorStore class. """
+
+    def test_store(self):
+        store = ColorStore(':memory:')
+        self.assertEqual(store.get('banana.jpg'), None)
+
+        response = {'status': 'ok', 'result': [{'color': [255, 235, 0], 'weight': 80.5}]}
+        store.put('banana.jpg', response)
+        self.assertEqual(store.get('banana.jpg'), response)
+        self.assertEqual(len(store), 1)
+
+        # Replacing a palette
+        store.put('banana.jpg', {'status': 'ok', 'result': []})
+        self.assertEqual(store.get('banana.jpg')['result'], [])
+        self.assertEqual(len(store), 1)
+        store.close()
+
+
+class TestBulkColorExtractor(unittest.TestCase):
+    """ Test BulkColorExtractor class. """
+
+    def setUp(self):
+        self.api = ExtractRequest()
+        self.store = ColorStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_key(self):
+        extractor = BulkColorExtractor(self.api, limit=10)
+        image = Image.from_bytes(b'banana', collection_filepath='banana.jpg')
+        # Images with data are keyed by content, whatever their filepath
+        self.assertEqual(extractor.key(image),
+                         extractor.key(Image.from_bytes(b'banana', collection_filepath='other.jpg')))
+        self.assertNotEqual(extractor.key(image), extractor.key(Image.from_bytes(b'melon')))
+        self.assertEqual(extractor.key('http://localhost/a.jpg'),
+                         extractor.key(Image(url='http://localhost/a.jpg')))
+        # Other options make other palettes
+        self.assertNotEqual(extractor.key(image), BulkColorExtractor(self.api, limit=5).key(image))
+
+    def test_extract(self):
+        extractor = BulkColorExtractor(self.api, store=self.store, max_workers=2, limit=10)
+        images = [Image.from_bytes(b'banana', collection_filepath='banana.jpg'),
+                  'http://localhost/melon.jpg', 'http://localhost/bad.jpg', 'http://localhost/down.jpg']
+        results = dict((image if isinstance(image, str) else image.collection_filepath, (response, error))
+                       for image, response, error in extractor.extract(images))
+
+        self.assertEqual(results['banana.jpg'][0]['result'][0]['color'], [255, 235, 0])
+        self.assertEqual(results['http://localhost/melon.jpg'][0]['status'], 'ok')
+        self.assertEqual(results['http://localhost/bad.jpg'][0]['status'], 'fail')
+        self.assertIsInstance(results['http://localhost/down.jpg'][1], requests.ConnectionError)
+        self.assertIn((b'banana', 10), self.api.sources())
+        # Only palettes that were extracted are stored
+        self.assertEqual(len(self.store), 2)
+
+        # A second run only sends the images without a stored palette
+        self.api.reset()
+        results = list(extractor.extract(images))
+        self.assertEqual(len(results), 4)
+        self.assertEqual(sorted(source for source, _ in self.api.sources()),
+                         ['http://localhost/bad.jpg', 'http://localhost/down.jpg'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import math
+import os
+import sys
+import unittest
+from unittest import mock
+
+from tineyeservices import Image
+from tineyeservices.matchengine_request import numpy
+from test.helpers import FakeMatchEngineRequest, indexed, response
+
+sys.path.append('../')
+
+
+class CollectionRequest(FakeMatchEngineRequest):
+    """
+    Answer the calls made by compare_matrix: images whose data starts with
+    'bad' fail to be added, and every pair of images scores 50.
+    """
+
+    def __init__(self, **kwargs):
+        super(CollectionRequest, self).__init__(**kwargs)
+        self.collection = []
+
+    def respond(self, method, params, file_params):
+        if method == 'add':
+            errors = []
+            for filepath, (_, data) in zip(indexed(params, 'filepaths'), indexed(file_params, 'images')):
+                if bytes(data).startswith(b'bad'):
+                    errors.append('%s: Image too small.' % filepath)
+                else:
+                    self.collection.append(filepath)
+            return response(method, errors=errors)
+        if method == 'count':
+            return response(method, [len(self.collection)])
+        if method == 'search':
+            return response(method, [{'filepath': f, 'score': 100 if f == params['filepath'] else 50}
+                                     for f in self.collection])
+        if method == 'compare':
+            return response(method, [{'score': 50}])
+        if method == 'delete':
+            del self.collection[:]
+        return response(method)
+
+
+# Use the default batch sizes and workers rather than a profile tuned on this host
+@mock.patch.dict(os.environ, {'TINEYESERVICES_PROFILES': os.devnull})
+@unittest.skipIf(numpy is None, 'compare_matrix requires numpy')
+class TestCompareMatrix(unittest.TestCase):
+    """ Test MatchEngineRequest.compare_matrix offline. """
+
+    def test_auto(self):
+        api = CollectionRequest()
+        images = [Image.from_bytes(b'image %i' % i) for i in range(4)]
+        api.compare_matrix(images, method='auto')
+        self.assertEqual(api.methods(), ['compare'] * 6)
+
+        # Enough images for the collection to take fewer calls
+        api.reset()
+        images.append(Image.from_bytes(b'image 4'))
+        scores = api.compare_matrix(images, method='auto')
+        self.assertEqual(api.methods(), ['add', 'count'] + ['search'] * 5 + ['delete'])
+        self.assertEqual(scores[0, 4], 50)
+        self.assertEqual(api.collection, [])
+
+    def test_failed_add(self):
+        api = CollectionRequest()
+        images = [Image.from_bytes(b'image 0'), Image.from_bytes(b'bad image'), Image.from_bytes(b'image 2')]
+        scores = api.compare_matrix(images, method='collection')
+
+        # The image that was not added is neither searched nor scored
+        self.assertEqual(api.methods().count('search'), 2)
+        self.assertEqual(scores[0, 2], 50)
+        self.assertTrue(math.isnan(scores[0, 1]))
+        self.assertTrue(math.isnan(scores[1, 2]))
+        self.assertEqual(scores[1, 1], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
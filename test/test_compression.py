@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import gzip
+import json
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+from tineyeservices import Compression, MulticolorEngineRequest
+
+sys.path.append('../')
+
+
+class Handler(BaseHTTPRequestHandler):
+    """ Echo the request parameters back, gzipped when the client accepts it. """
+
+    def respond(self, params):
+        body = json.dumps({'status': 'ok', 'error': [], 'method': self.path,
+                           'result': [params, self.headers.get('Accept-Encoding')] * 50}).encode('utf-8')
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.respond(dict(parse_qsl(urlparse(self.path).query)))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        self.respond(dict(parse_qsl(body.decode('utf-8'))))
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCompression(unittest.TestCase):
+    """ Test Compression class. """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.api = MulticolorEngineRequest(api_url='http://127.0.0.1:%i/rest/' % self.server.server_port)
+
+    def test_responses(self):
+        self.api.compression = Compression(compress_responses=['list'])
+        response = self.api.list(limit=5)
+        self.assertEqual(response['result'][0]['limit'], '5')
+        self.assertTrue('gzip' in response['result'][1])
+        self.assertTrue(self.api.compression.saved('list')['response_bytes_saved'] > 0)
+
+        response = self.api.count()
+        self.assertEqual(response['result'][1], 'identity')
+        self.assertEqual(self.api.compression.saved('count')['response_bytes_saved'], 0)
+
+    def test_requests(self):
+        self.api.compression = Compression(compress_requests=['update_metadata'], min_size=100)
+        metadata = [json.dumps({'keywords': ['whale'] * 20}) for i in range(10)]
+        filepaths = ['image%i.jpg' % i for i in range(10)]
+        response = self.api.update_metadata(filepaths, metadata)
+        self.assertEqual(response['result'][0]['metadata[9]'], metadata[9])
+        self.assertTrue(self.api.compression.saved()['request_bytes_saved'] > 0)
+
+        # Small bodies are sent as is
+        self.api.update_metadata(['image.jpg'], ['{}'])
+        self.assertEqual(self.api.compression.stats['update_metadata']['requests'], 2)
+
+        self.assertRaises(ValueError, Compression, request_encoding='lzma')
+
+
+if __name__ == '__main__':
+    unittest.main()
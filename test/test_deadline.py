@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+import math
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+from urllib.parse import urlparse
+
+import requests
+
+from tineyeservices import (
+    Deadline, DuplicateClusterJob, Image, MatchEngineRequest, MetadataMirror, MetadataUpdater,
+    MulticolorEngineRequest, PaletteIndex, TinEyeServiceDeadlineExceeded)
+from tineyeservices.palette_index import numpy
+from tineyeservices.parallel import DeadlineIterator, map_with_deadline
+
+sys.path.append('../')
+
+
+class SlowSession(object):
+    """
+    Stand in for requests, answering each call after `delay` seconds and
+    timing out like requests does when the read timeout is shorter.
+    """
+
+    def __init__(self, delay=0, result=None):
+        self.delay = delay
+        self.result = result or (lambda url, params: [])
+        self.timeouts = []
+        self.urls = []
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        self.urls.append(url)
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and read_timeout < self.delay:
+            time.sleep(read_timeout)
+            raise requests.ReadTimeout('Read timed out')
+        time.sleep(self.delay)
+        response = requests.Response()
+        response.status_code = 200
+        method = urlparse(url).path.strip('/').split('/')[-1]
+        response._content = json.dumps({'status': 'ok', 'error': [], 'method': method,
+                                        'result': self.result(url, params)}).encode('utf-8')
+        return response
+
+    post = get
+
+
+class SessionMixin(object):
+    """ Send every call through `self.session`. """
+
+    def _send(self, session, method, params, file_params, auth, timeout):
+        return super(SessionMixin, self)._send(self.session, method, params, file_params, auth, timeout)
+
+
+class SlowMatchEngineRequest(SessionMixin, MatchEngineRequest):
+    pass
+
+
+class SlowMulticolorEngineRequest(SessionMixin, MulticolorEngineRequest):
+    pass
+
+
+# Use the default batch sizes and workers rather than a profile tuned on this host
+@mock.patch.dict(os.environ, {'TINEYESERVICES_PROFILES': os.devnull})
+class TestDeadline(unittest.TestCase):
+    """ Test Deadline class and its use by the request classes. """
+
+    def test_timeout(self):
+        deadline = Deadline(10, connect_timeout=2)
+        connect, read = deadline.timeout()
+        self.assertEqual(connect, 2)
+        self.assertTrue(9 < read <= 10)
+        # A shorter per call timeout wins
+        self.assertEqual(deadline.timeout(1), (1, 1))
+        # Each timeout of a (connect, read) tuple is bounded
+        self.assertEqual(deadline.timeout((0.5, 3)), (0.5, 3))
+        connect, read = deadline.timeout((5, None))
+        self.assertEqual(connect, 2)
+        self.assertTrue(9 < read <= 10)
+
+        deadline = Deadline(0)
+        self.assertTrue(deadline.expired)
+        self.assertRaises(TinEyeServiceDeadlineExceeded, deadline.timeout)
+
+    def test_request_timeout(self):
+        api = SlowMatchEngineRequest()
+        api.session = SlowSession()
+        bounded = api.with_deadline(5, connect_timeout=1)
+        self.assertIsNone(api.deadline)
+
+        bounded.ping()
+        connect, read = api.session.timeouts[-1]
+        self.assertEqual(connect, 1)
+        self.assertTrue(4 < read <= 5)
+
+        # Without a deadline the timeout is passed as is
+        api.ping(timeout=3)
+        self.assertEqual(api.session.timeouts[-1], 3)
+
+    def test_expired(self):
+        api = SlowMatchEngineRequest()
+        api.session = SlowSession(delay=0.5)
+        bounded = api.with_deadline(0.2)
+
+        # A call cut short by the deadline
+        start = time.monotonic()
+        self.assertRaises(TinEyeServiceDeadlineExceeded, bounded.ping)
+        self.assertTrue(time.monotonic() - start < 0.45)
+
+        # Later calls fail without being sent
+        self.assertRaises(TinEyeServiceDeadlineExceeded, bounded.count)
+        self.assertEqual(len(api.session.urls), 1)
+
+    def test_iter_list(self):
+        api = SlowMatchEngineRequest()
+        api.session = SlowSession(delay=0.1, result=lambda url, params: ['%s' % params['offset']] * 2)
+        filepaths = []
+        with self.assertRaises(TinEyeServiceDeadlineExceeded):
+            for filepath in api.with_deadline(0.25).iter_list(page_size=2):
+                filepaths.append(filepath)
+        self.assertEqual(filepaths, ['0', '0', '2', '2'])
+
+    def test_map_with_deadline(self):
+        def call(delay):
+            # A call that does not stop at the deadline, like a slow response
+            time.sleep(delay)
+            return delay
+
+        start = time.monotonic()
+        results = map_with_deadline(call, [0, 0.8, 0.8], Deadline(0.2), max_workers=2,
+                                    expired=lambda delay: 'expired')
+        # Calls still running at the deadline are not waited for
+        self.assertLess(time.monotonic() - start, 0.6)
+        self.assertEqual(results, [0, 'expired', 'expired'])
+        self.assertEqual(map_with_deadline(call, [0, 0.01], None), [0, 0.01])
+
+    def test_count_facets(self):
+        api = SlowMulticolorEngineRequest()
+        api.session = SlowSession(delay=0.2)
+        calls = [('count_metadata', {'count_metadata': ['{"facet": %i}' % i]}) for i in range(4)]
+        responses = api.with_deadline(0.3).count_facets(calls, max_workers=2)
+
+        self.assertEqual([r['status'] for r in responses], ['ok', 'ok', 'fail', 'fail'])
+        self.assertTrue(responses[2]['deadline_exceeded'])
+        self.assertEqual(responses[3]['method'], 'count_metadata')
+        self.assertNotIn('deadline_exceeded', responses[0])
+
+    def test_compare_matrix(self):
+        api = SlowMatchEngineRequest()
+        api.session = SlowSession(delay=0.2, result=lambda url, params: [{'score': '50'}])
+        images = [Image.from_bytes(b'image %i' % i) for i in range(3)]
+        scores = api.with_deadline(0.3).compare_matrix(images, max_workers=1)
+
+        # One compare fits in the deadline, the other pairs are unknown
+        self.assertEqual(scores[0, 1], 50)
+        self.assertTrue(math.isnan(scores[0, 2]))
+        self.assertTrue(math.isnan(scores[2, 1]))
+        self.assertEqual(scores[2, 2], 100)
+
+
+    def test_deadline_iterator(self):
+        def pages():
+            yield 1
+            raise TinEyeServiceDeadlineExceeded('Deadline of 1s exceeded')
+
+        items = DeadlineIterator(pages(), Deadline(10))
+        self.assertEqual(list(items), [1])
+        self.assertTrue(items.cut_short)
+
+        items = DeadlineIterator([1, 2], Deadline(0))
+        self.assertEqual(list(items), [])
+        self.assertTrue(items.cut_short)
+
+        items = DeadlineIterator([1, 2])
+        self.assertEqual(list(items), [1, 2])
+        self.assertFalse(items.cut_short)
+
+    def test_cluster_job(self):
+        def result(url, params):
+            if url.endswith('/list/'):
+                return ['%i.jpg' % i for i in range(20)] if params['offset'] == 0 else []
+            return [{'filepath': '0.jpg', 'score': '90'}]
+
+        api = SlowMatchEngineRequest()
+        api.session = SlowSession(delay=0.1, result=result)
+        job = DuplicateClusterJob(api.with_deadline(0.45), max_workers=2)
+        clusters = job.run()
+
+        # The searches done by the deadline are clustered, the others not sent
+        self.assertTrue(job.deadline_exceeded)
+        self.assertEqual(len(clusters), 1)
+        self.assertIn('0.jpg', clusters[0])
+        self.assertLess(len(clusters[0]), 20)
+        self.assertLess(len(api.session.urls), 21)
+
+    def test_populate(self):
+        def result(url, params):
+            if url.endswith('/list/'):
+                return ['%i.jpg' % i for i in range(10)] if params['offset'] == 0 else []
+            return [{'filepath': params['filepaths[0]'], 'metadata': {}}]
+
+        api = SlowMulticolorEngineRequest()
+        api.session = SlowSession(delay=0.1, result=result)
+        mirror = MetadataMirror()
+        mirror.set('9.jpg', {'id': 9})
+        mirror.populate(api.with_deadline(0.35), batch_size=1, max_workers=1)
+
+        self.assertTrue(mirror.deadline_exceeded)
+        self.assertIn('0.jpg', mirror)
+        # Filepaths not fetched by the deadline are kept
+        self.assertEqual(mirror.get('9.jpg'), {'id': 9})
+        self.assertLess(len(api.session.urls), 11)
+
+    def test_metadata_updater(self):
+        api = SlowMulticolorEngineRequest()
+        api.session = SlowSession(delay=0.1)
+        updater = MetadataUpdater(api.with_deadline(0.25), batch_size=1, max_workers=1)
+        results = list(updater.update(('%i.jpg' % i, {'id': i}) for i in range(10)))
+
+        # No batch is sent once the deadline has passed
+        self.assertTrue(updater.deadline_exceeded)
+        self.assertLess(len(api.session.urls), 4)
+        self.assertLess(len(results), 5)
+        for filepaths, response, error in results:
+            self.assertTrue(error is None or isinstance(error, TinEyeServiceDeadlineExceeded))
+        self.assertGreater(updater.stats['sent'], 0)
+
+    @unittest.skipIf(numpy is None, 'PaletteIndex requires numpy')
+    def test_palette_index(self):
+        api = SlowMulticolorEngineRequest()
+        api.session = SlowSession(delay=0.2, result=lambda url, params: [
+            {'color': [255, 235, 0], 'weight': 80.5, 'rank': 1, 'class': 'Yellow'}])
+        index = PaletteIndex(request=api.with_deadline(0.3))
+        index.add_from_collection(['%i.jpg' % i for i in range(4)], max_workers=2)
+
+        self.assertTrue(index.deadline_exceeded)
+        self.assertEqual(sorted(index.filepaths), ['0.jpg', '1.jpg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
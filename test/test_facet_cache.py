@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import sys
+import time
+import unittest
+
+from tineyeservices import FacetCache
+from test.helpers import FakeMulticolorEngineRequest, response
+
+sys.path.append('../')
+
+
+class CountRequest(FakeMulticolorEngineRequest):
+    """ Answer count calls, with the number of calls made so far as the count. """
+
+    def respond(self, method, params, file_params):
+        if method == 'count_collection_colors':
+            return response(method, [{'color': params['count_colors[0]'],
+                                      'num_images_partial_area': 1, 'num_images_full_area': 0}])
+        return response(method, [{'count': len(self.calls)}])
+
+
+class TestFacetCache(unittest.TestCase):
+    """ Test FacetCache class. """
+
+    def setUp(self):
+        self.cache = FacetCache(ttl=60)
+        self.api = CountRequest(facet_cache=self.cache)
+
+    def test_key(self):
+        # Equivalent JSON queries share a key
+        self.assertEqual(
+            self.cache.key('count_metadata', {'metadata': '{"a": 1, "b": 2}'}, {}),
+            self.cache.key('count_metadata', {'metadata': '{"b":2,"a":1}'}, {}))
+        self.assertNotEqual(
+            self.cache.key('count_metadata', {'metadata': '{"a": 1}'}, {}),
+            self.cache.key('count_metadata', {'metadata': '{"a": 2}'}, {}))
+
+    def test_count_metadata(self):
+        first = self.api.count_metadata_metadata('{"keywords": "whale"}', ['{"color": "red"}'])
+        second = self.api.count_metadata_metadata('{"keywords":"whale"}', ['{"color":"red"}'])
+        self.assertEqual(first, second)
+        self.assertEqual(self.api.methods(), ['count_metadata'])
+        self.assertEqual(self.cache.stats, {'hits': 1, 'misses': 1})
+
+        # Cached responses are copies
+        second['result'].append('changed')
+        self.assertEqual(len(self.api.count_metadata_metadata(
+            '{"keywords": "whale"}', ['{"color": "red"}'])['result']), 1)
+
+    def test_count_collection_colors(self):
+        response = self.api.count_collection_colors_metadata('', ['#FF0000'], result_format='numpy')
+        self.assertEqual(response['result']['num_images_partial_area'][0], 1)
+        response = self.api.count_collection_colors_metadata('', ['ff0000'])
+        self.assertEqual(response['result'][0]['color'], 'ff0000')
+        self.assertEqual(self.api.methods(), ['count_collection_colors'])
+
+    def test_invalidate_on_write(self):
+        self.api.count_metadata_metadata('', ['{"color": "red"}'])
+        self.api.update_metadata(['banana.jpg'], [{'color': 'red'}])
+        self.assertEqual(len(self.cache), 0)
+        self.api.count_metadata_metadata('', ['{"color": "red"}'])
+        self.assertEqual(self.api.methods(), ['count_metadata', 'update_metadata', 'count_metadata'])
+
+    def test_generation(self):
+        key = self.cache.key('count_metadata', {'metadata': ''}, {})
+        generation = self.cache.generation
+        self.cache.invalidate()
+        # A response fetched before the write is not cached
+        self.cache.put(key, {'status': 'ok'}, generation)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_expiry(self):
+        cache = FacetCache(ttl=0.01, max_entries=2)
+        cache.put('a', {'status': 'ok'})
+        time.sleep(0.02)
+        self.assertEqual(cache.get('a'), None)
+
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(sorted(cache.entries), ['a', 'c'])
+
+    def test_count_facets(self):
+        responses = self.api.count_facets([
+            ('count_metadata_metadata', {'metadata': '', 'count_metadata': ['{"a": 1}']}),
+            ('count_collection_colors_metadata', {'metadata': '', 'count_colors': ['255,0,0']})])
+        self.assertEqual(responses[0]['method'], 'count_metadata')
+        self.assertEqual(responses[1]['result'][0]['color'], '255,0,0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,9 +3,12 @@
 
 import os
 import sys
+import hashlib
+import io
 import unittest
 
-from tineyeservices import Image
+from tineyeservices import Image, ImageBatch, MatchEngineRequest
+from tineyeservices.arrays import numpy
 
 imagepath = os.path.abspath("test/images")
 sys.path.append('../')
@@ -41,5 +44,75 @@ class TestImage(unittest.TestCase):
         except ValueError as e:
             self.assertEqual(e.args[0], 'Image object needs either data or a URL.')
 
+    def test_lazy_image(self):
+        image = Image(filepath='%s/banana.jpg' % imagepath, lazy=True)
+        self.assertEqual(image._data, None)
+        self.assertEqual(image.collection_filepath, '%s/banana.jpg' % imagepath)
+        self.assertEqual(image.data, Image(filepath='%s/banana.jpg' % imagepath).data)
+
+        # Missing files are only noticed when the data is used
+        image = Image(filepath='%s/missing.jpg' % imagepath, lazy=True)
+        self.assertRaises(IOError, getattr, image, 'data')
+
+    def test_digest(self):
+        image = Image(filepath='%s/banana.jpg' % imagepath)
+        self.assertEqual(image.digest, hashlib.sha1(image.data).hexdigest())
+        image.data = b'other'
+        self.assertEqual(image.digest, hashlib.sha1(b'other').hexdigest())
+        self.assertEqual(Image(url='https://tineye.com/images/meloncat.jpg').digest, None)
+
+        # Images have no __dict__
+        self.assertRaises(AttributeError, setattr, image, 'size', 10)
+
+    def test_image_batch(self):
+        filepaths = ['%s/banana.jpg' % imagepath, '%s/banana_small.jpg' % imagepath]
+        images = [Image(filepath=filepath) for filepath in filepaths]
+        for batch in [ImageBatch(images), ImageBatch.from_files(filepaths, ['a.jpg', 'b.jpg'])]:
+            self.assertEqual(len(batch), 2)
+            self.assertEqual(batch.nbytes, sum(len(image.data) for image in images))
+            self.assertEqual([bytes(image.data) for image in batch], [image.data for image in images])
+            self.assertEqual([image.digest for image in batch], [image.digest for image in images])
+            # Images share the batch buffer
+            self.assertTrue(batch[1].data.obj is batch.buffer)
+        self.assertEqual(batch[0].collection_filepath, 'a.jpg')
+        self.assertRaises(ValueError, ImageBatch, [Image(url='https://tineye.com/images/meloncat.jpg')])
+
+    def test_in_memory(self):
+        data = open('%s/banana.jpg' % imagepath, 'rb').read()
+
+        view = memoryview(bytearray(data))
+        image = Image.from_bytes(view, collection_filepath='banana.jpg')
+        self.assertTrue(image.data is view)
+        self.assertEqual(image.collection_filepath, 'banana.jpg')
+        self.assertEqual(image.digest, hashlib.sha1(data).hexdigest())
+        self.assertRaises(TypeError, Image.from_bytes, 'banana.jpg')
+        # Images without a collection filepath cannot be added
+        self.assertRaises(ValueError, MatchEngineRequest().add_image, [Image.from_bytes(data)])
+
+        fp = io.BytesIO(data)
+        fp.seek(10)
+        image = Image.from_file(fp)
+        self.assertEqual(bytes(image.data), data[10:])
+        # The file is read to the end and can still be written to
+        self.assertEqual(fp.tell(), len(data))
+        fp.write(b'more')
+        with open('%s/banana.jpg' % imagepath, 'rb') as fp:
+            image = Image.from_file(fp, metadata='{"keywords": "banana"}')
+        self.assertEqual(image.data, data)
+        self.assertEqual(image.collection_filepath, 'banana.jpg')
+        self.assertEqual(image.metadata, '{"keywords": "banana"}')
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_from_array(self):
+        pixels = numpy.zeros((18, 16, 3), dtype=numpy.uint8)
+        pixels[:, :, 0] = 255
+        image = Image.from_array(pixels, collection_filepath='red.png')
+        self.assertEqual(image._data, None)
+        self.assertEqual(image.check(), ('png', 16, 18))
+        self.assertTrue(image.data.startswith(b'\x89PNG'))
+
+        self.assertEqual(Image.from_array(numpy.zeros((2, 3), dtype=numpy.uint8)).check(), ('png', 3, 2))
+        self.assertRaises(ValueError, getattr, Image.from_array(numpy.zeros((2, 3))), 'data')
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import io
+import os
+import struct
+import sys
+import unittest
+import zlib
+
+from tineyeservices import Image
+from tineyeservices.image_header import check_images, sniff_file, sniff_header
+
+imagepath = os.path.abspath(os.path.join(os.path.dirname(__file__), 'images'))
+sys.path.append('../')
+
+
+def png(width, height):
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(b'\x00' * (3 * width + 1) * height)) +
+            chunk(b'IEND', b''))
+
+
+class TestImageHeader(unittest.TestCase):
+    """ Test image header sniffing. """
+
+    def test_sniff(self):
+        info = sniff_file(os.path.join(imagepath, 'banana.jpg'))
+        self.assertEqual(info, ('jpeg', 300, 331))
+        self.assertEqual(sniff_file(os.path.join(imagepath, 'banana.png')).format, 'png')
+        self.assertEqual(sniff_header(io.BytesIO(png(4, 3))), ('png', 4, 3))
+        self.assertEqual(sniff_file(b'GIF89a\x05\x00\x07\x00' + b'\x00' * 10 + b'\x3b'), ('gif', 5, 7))
+
+    def test_trailing_data(self):
+        data = open(os.path.join(imagepath, 'banana.jpg'), 'rb').read()
+        self.assertEqual(sniff_file(data + b'\x00' * 1000), ('jpeg', 300, 331))
+        self.assertEqual(sniff_file(png(4, 3) + b'trailing data'), ('png', 4, 3))
+        self.assertEqual(sniff_file(b'GIF89a\x05\x00\x07\x00' + b'\x00' * 10 + b'\x3b\r\n'), ('gif', 5, 7))
+
+    def test_invalid(self):
+        data = open(os.path.join(imagepath, 'banana.jpg'), 'rb').read()
+        self.assertRaises(ValueError, sniff_file, b'')
+        self.assertRaises(ValueError, sniff_file, data[:20])
+        self.assertRaises(ValueError, sniff_file, data[:len(data) // 2])
+        self.assertRaises(ValueError, sniff_file, png(4, 3)[:-12])
+        self.assertRaises(ValueError, sniff_file, png(0, 3))
+        self.assertRaises(ValueError, sniff_file, os.path.join(imagepath, 'index.html'))
+
+    def test_image_check(self):
+        image = Image(filepath=os.path.join(imagepath, 'banana_small.jpg'), lazy=True)
+        self.assertEqual(image.check(), ('jpeg', 16, 18))
+        self.assertEqual(image._data, None)
+        self.assertEqual(Image(url='http://localhost/banana.jpg').check(), None)
+
+    def test_check_images(self):
+        images = [Image(filepath=os.path.join(imagepath, f), lazy=True) for f in sorted(os.listdir(imagepath))]
+        images[0].data
+        images.append(Image(url='http://localhost/banana.jpg'))
+        results = list(check_images(images, max_workers=2, chunk_size=3))
+        self.assertEqual([result[0] for result in results], images)
+        invalid = [os.path.basename(image.filepath) for image, info, error in results if error is not None]
+        self.assertEqual(invalid, ['index.html'])
+        self.assertEqual(results[0][1].format, 'jpeg')
+        self.assertEqual(results[-1][1:], (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
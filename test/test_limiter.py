@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from tineyeservices import HostLimiter, MatchEngineRequest, TinEyeServiceDeadlineExceeded
+from test.helpers import FakeResponse
+
+sys.path.append('../')
+
+API_URL = 'http://localhost/rest/'
+
+
+def hold_slot(directory, ready, release):
+    """ Hold a slot in another process until `release` is set. """
+    limiter = HostLimiter(API_URL, max_in_flight=2, directory=directory)
+    with limiter.slot():
+        ready.set()
+        release.wait(10)
+
+
+class CountingRequest(MatchEngineRequest):
+    """ Answer each call after a short delay, recording how many are in flight at once. """
+
+    def __init__(self, **kwargs):
+        super(CountingRequest, self).__init__(**kwargs)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+
+    def _send_request(self, session, method, params, file_params, auth, timeout):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        time.sleep(0.02)
+        with self.lock:
+            self.in_flight -= 1
+        return FakeResponse()
+
+
+class TestHostLimiter(unittest.TestCase):
+    """ Test HostLimiter class. """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.limiter = HostLimiter(API_URL, max_in_flight=2, directory=self.directory)
+
+    def tearDown(self):
+        self.limiter.close()
+        shutil.rmtree(self.directory)
+
+    def test_acquire(self):
+        first = self.limiter.acquire()
+        second = self.limiter.acquire()
+        self.assertEqual(sorted([first, second]), [0, 1])
+        self.assertEqual(self.limiter.in_flight(), 2)
+        self.assertIsNone(self.limiter.acquire(timeout=0.05))
+        self.assertRaises(TimeoutError, self.limiter.slot(timeout=0).__enter__)
+
+        self.limiter.release(first)
+        with self.limiter.slot() as slot:
+            self.assertEqual(slot, first)
+        self.limiter.release(second)
+        self.assertEqual(self.limiter.in_flight(), 0)
+        self.assertEqual(self.limiter.stats['requests'], 3)
+        self.assertEqual(self.limiter.stats['waits'], 2)
+
+    def test_other_process(self):
+        context = multiprocessing.get_context('fork')
+        ready = context.Event()
+        release = context.Event()
+        process = context.Process(target=hold_slot, args=(self.directory, ready, release))
+        # The limiter has files open when the process is forked
+        self.limiter.in_flight()
+        process.start()
+        try:
+            self.assertTrue(ready.wait(10))
+            self.assertEqual(self.limiter.in_flight(), 1)
+            slot = self.limiter.acquire()
+            self.assertIsNone(self.limiter.acquire(timeout=0.05))
+            self.limiter.release(slot)
+        finally:
+            release.set()
+            process.join(10)
+        self.assertEqual(self.limiter.in_flight(), 0)
+
+    def test_request(self):
+        api = CountingRequest(api_url=API_URL)
+        api.limiter = self.limiter
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(lambda i: api.ping(), range(16)))
+        self.assertEqual(len(responses), 16)
+        self.assertEqual(api.peak, 2)
+        self.assertEqual(self.limiter.stats['requests'], 16)
+
+    def test_deadline(self):
+        api = CountingRequest(api_url=API_URL)
+        api.limiter = self.limiter
+        slots = [self.limiter.acquire(), self.limiter.acquire()]
+        self.assertRaises(TinEyeServiceDeadlineExceeded, api.with_deadline(0.05).ping)
+        for slot in slots:
+            self.limiter.release(slot)
+        api.with_deadline(1).ping()
+
+
+if __name__ == '__main__':
+    unittest.main()
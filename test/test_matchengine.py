@@ -5,7 +5,7 @@ import os
 import sys
 import unittest
 
-from tineyeservices import MatchEngineRequest
+from tineyeservices import DuplicateClusterJob, MatchEngineRequest
 from tineyeservices import Image
 from tineyeservices.exception import TinEyeServiceError, TinEyeServiceWarning
 
@@ -166,6 +166,46 @@ class TestMatchEngine(unittest.TestCase):
         self.assertEqual(r['error'], [])
         self.assertEqual(len(r['result']), 1)
 
+    def test_compare_matrix(self):
+        images = [Image(filepath='%s/banana.jpg' % imagepath),
+                  Image(filepath='%s/banana_flip.jpg' % imagepath),
+                  Image(filepath='%s/white.jpg' % imagepath)]
+
+        # Pairwise compare
+        scores = self.request.compare_matrix(images, check_horizontal_flip=True)
+        self.assertEqual(scores.shape, (3, 3))
+        self.assertEqual(scores[0, 0], 100)
+        self.assertTrue(scores[0, 1] > 0)
+        self.assertEqual(scores[0, 1], scores[1, 0])
+        self.assertEqual(scores[0, 2], 0)
+
+        # Temporary collection, which must be cleaned up afterwards
+        scores = self.request.compare_matrix(images, check_horizontal_flip=True, method='collection')
+        self.assertTrue(scores[0, 1] > 0)
+        self.assertEqual(scores[0, 1], scores[1, 0])
+        self.assertEqual(scores[0, 2], 0)
+
+        r = self.request.list()
+        self.assertEqual(r['result'], [])
+
+    def test_cluster(self):
+        images = [Image(filepath='%s/banana.jpg' % imagepath, collection_filepath='banana.jpg'),
+                  Image(filepath='%s/banana_small.jpg' % imagepath, collection_filepath='banana_small.jpg'),
+                  Image(filepath='%s/white.jpg' % imagepath, collection_filepath='white.jpg')]
+        r = self.request.add_image(images)
+        self.assertEqual(r['status'], 'ok')
+
+        job = DuplicateClusterJob(self.request, min_score=10, page_size=2)
+        clusters = job.run()
+        self.assertEqual(clusters, [['banana.jpg', 'banana_small.jpg']])
+        self.assertEqual(job.searched, 3)
+
+        # Skipping images that are already clustered
+        job = DuplicateClusterJob(self.request, min_score=10, skip_clustered=True, max_workers=1)
+        clusters = job.run()
+        self.assertEqual(clusters, [['banana.jpg', 'banana_small.jpg']])
+        self.assertEqual(job.skipped, 1)
+
     def test_count(self):
         # No images
         r = self.request.count()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+import sys
+import unittest
+
+from tineyeservices import MetadataMirror
+from test.helpers import FakeMulticolorEngineRequest, indexed, response
+
+sys.path.append('../')
+
+
+class CollectionRequest(FakeMulticolorEngineRequest):
+    """ Answer list and get_metadata calls from a dictionary of metadata trees. """
+
+    def __init__(self, trees, **kwargs):
+        super(CollectionRequest, self).__init__(**kwargs)
+        self.trees = trees
+
+    def respond(self, method, params, file_params):
+        if method == 'list':
+            return response(method, sorted(self.trees)[params['offset']:params['offset'] + params['limit']])
+        return response(method, [{'filepath': f, 'metadata': self.trees[f]}
+                                 for f in indexed(params, 'filepaths') if f in self.trees])
+
+
+class TestMetadataMirror(unittest.TestCase):
+    """ Test MetadataMirror class. """
+
+    def test_lookup(self):
+        mirror = MetadataMirror()
+        mirror.set('banana.jpg', json.dumps({"keywords": ["whale", "shark"], "id": 1}))
+        mirror.set('flip.jpg', {"keywords": ["whale"]})
+
+        self.assertEqual(mirror.get('banana.jpg')['id'], 1)
+        self.assertEqual(mirror.get('missing.jpg'), None)
+        self.assertEqual(sorted(mirror.get_many(['banana.jpg', 'missing.jpg'])), ['banana.jpg'])
+
+        self.assertEqual(mirror.filter(keywords='whale'), set(['banana.jpg', 'flip.jpg']))
+        self.assertEqual(mirror.filter(keywords='whale', id=1), set(['banana.jpg']))
+        self.assertEqual(mirror.filter(keywords='octopus'), set())
+
+        # Replacing metadata updates the keyword index
+        mirror.set('banana.jpg', {"keywords": ["octopus"]})
+        self.assertEqual(mirror.filter(keywords='whale'), set(['flip.jpg']))
+        self.assertEqual(mirror.filter(keywords='octopus'), set(['banana.jpg']))
+
+    def test_record_write(self):
+        mirror = MetadataMirror()
+        ok = {'status': 'ok', 'error': [], 'result': []}
+        mirror.record_write(ok, ['a.jpg', 'b.jpg'], ['{"keywords": ["whale"]}', None])
+        self.assertTrue('a.jpg' in mirror)
+        self.assertFalse('b.jpg' in mirror)
+
+        # Failed writes make the state unknown
+        mirror.record_write({'status': 'warn', 'error': ['a.jpg: failed']}, ['a.jpg'], ['{}'])
+        self.assertFalse('a.jpg' in mirror)
+
+        # Deletes
+        mirror.set('c.jpg', {"keywords": ["whale"]})
+        mirror.record_write(ok, ['c.jpg'])
+        self.assertEqual(len(mirror), 0)
+        self.assertEqual(mirror.filter(keywords='whale'), set())
+
+    def test_populate(self):
+        request = CollectionRequest({
+            'banana.jpg': {'keywords': {'': ['whale', 'shark'], 'action': 'search', 'type': 'string'},
+                           'product': {'brand': {'': 'acme', 'action': 'search', 'type': 'string'}}},
+            'flip.jpg': {'keywords': {'': ['whale'], 'action': 'search', 'type': 'string'}}})
+        mirror = MetadataMirror()
+        mirror.set('deleted.jpg', {"keywords": ["whale"]})
+        mirror.populate(request, batch_size=1)
+
+        # Trees are mirrored in the form sent with add_image
+        self.assertEqual(mirror.get('banana.jpg'),
+                         {'keywords': ['whale', 'shark'], 'product': {'brand': 'acme'}})
+        self.assertEqual(mirror.filter(**{'product.brand': 'acme'}), set(['banana.jpg']))
+        # Images no longer in the collection are dropped
+        self.assertEqual(mirror.filter(keywords='whale'), set(['banana.jpg', 'flip.jpg']))
+        self.assertFalse('deleted.jpg' in mirror)
+
+        del request.trees['flip.jpg']
+        mirror.populate(request, filepaths=['flip.jpg'])
+        self.assertEqual(len(mirror), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
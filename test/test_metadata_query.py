@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+import sys
+import unittest
+
+from tineyeservices import MetadataQueryBuilder
+from tineyeservices.metadata_query import UnknownMetadataKey
+from test.helpers import FakeMulticolorEngineRequest, response
+
+sys.path.append('../')
+
+search_metadata = [{'metadata': {
+    'keywords': {'': ['whale', 'shark'], 'type': 'string', 'count': '2'},
+    'product': {'brand': {'': ['acme'], 'type': 'string'}, 'price': {'type': 'uint'}}}}]
+return_metadata = [{'metadata': {'id': {'count': '1', '': None, 'type': 'uint'}}}]
+
+
+class SchemaRequest(FakeMulticolorEngineRequest):
+    """ Answer the schema calls. """
+
+    def respond(self, method, params, file_params):
+        return response(method, search_metadata if method == 'get_search_metadata' else return_metadata)
+
+
+class TestMetadataQueryBuilder(unittest.TestCase):
+    """ Test MetadataQueryBuilder class. """
+
+    def setUp(self):
+        self.api = SchemaRequest()
+        self.builder = MetadataQueryBuilder(self.api, refresh_after=3600)
+
+    def test_query(self):
+        query = self.builder.query({'keywords': 'whale'})
+        self.assertEqual(query, '{"keywords":"whale"}')
+        self.assertEqual(json.loads(self.builder.query('{"product": {"brand": "acme", "price": 10}}')),
+                         {'product': {'brand': 'acme', 'price': 10}})
+
+        # The schema is fetched once and compiled queries are reused
+        self.assertTrue(self.builder.query({'keywords': 'whale'}) is query)
+        self.assertEqual(len(self.api.calls), 2)
+
+    def test_invalid_query(self):
+        self.assertRaises(ValueError, self.builder.query, {'keywrods': 'whale'})
+        self.assertRaises(ValueError, self.builder.query, {'product': {'colour': 'red'}})
+        self.assertRaises(ValueError, self.builder.query, {'product': {'price': 'cheap'}})
+        self.assertRaises(ValueError, self.builder.query, '["whale"]')
+
+    def test_refresh(self):
+        builder = MetadataQueryBuilder(self.api, refresh_after=0)
+        builder.query({'keywords': 'whale'})
+        self.assertEqual(len(self.api.calls), 2)
+
+        # Only unknown keys fetch the schema again before failing
+        self.assertRaises(UnknownMetadataKey, builder.query, {'keywrods': 'whale'})
+        self.assertEqual(len(self.api.calls), 4)
+        self.assertRaises(json.JSONDecodeError, builder.query, '{"keywords": ')
+        self.assertRaises(ValueError, builder.query, {'product': {'price': 'cheap'}})
+        self.assertEqual(len(self.api.calls), 4)
+
+    def test_operators(self):
+        query = {'_or_operator_': [{'keywords': 'whale'}, {'product': {'brand': 'acme'}}]}
+        self.assertEqual(json.loads(self.builder.query(query)), query)
+        self.assertEqual(json.loads(self.builder.query({'product': {'_not_operator_': {'brand': 'acme'}}})),
+                         {'product': {'_not_operator_': {'brand': 'acme'}}})
+        # Queries inside operators are checked too
+        self.assertRaises(ValueError, self.builder.query, {'_or_operator_': [{'keywrods': 'whale'}]})
+        self.assertRaises(ValueError, self.builder.query, {'_and_operator_': ['whale']})
+        self.assertRaises(ValueError, self.builder.query, {'_xor_operator_': [{'keywords': 'whale'}]})
+
+    def test_return_metadata(self):
+        self.assertEqual(self.builder.return_metadata(['id']), '["id"]')
+        self.assertRaises(ValueError, self.builder.return_metadata, ['ids'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import hashlib
+import sys
+import unittest
+
+import requests
+
+from tineyeservices import MetadataUpdater
+from tineyeservices.metadata_updater import MetadataHashStore, serialize_metadata
+from test.helpers import FakeMulticolorEngineRequest, indexed, response
+
+sys.path.append('../')
+
+
+def digest(serialized):
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+class UpdateRequest(FakeMulticolorEngineRequest):
+    """
+    Answer update_metadata calls, failing batches with a filepath starting
+    with 'bad' and failing to connect for 'down' filepaths.
+    """
+
+    def respond(self, method, params, file_params):
+        filepaths = indexed(params, 'filepaths')
+        if any(filepath.startswith('down') for filepath in filepaths):
+            raise requests.ConnectionError('Connection refused')
+        return response(method, errors=['%s: Failed to update metadata.' % f
+                                        for f in filepaths if f.startswith('bad')])
+
+    def updates(self):
+        """ Return the metadata sent by each call, by filepath. """
+        with self.lock:
+            return [dict(zip(indexed(params, 'filepaths'), indexed(params, 'metadata')))
+                    for method, params, file_params in self.calls]
+
+
+class TestMetadataUpdater(unittest.TestCase):
+    """ Test MetadataUpdater class. """
+
+    def setUp(self):
+        self.api = UpdateRequest()
+        self.store = MetadataHashStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_serialize_metadata(self):
+        # Strings are already serialized
+        self.assertEqual(serialize_metadata('{"keywords": ["whale"]}'), '{"keywords": ["whale"]}')
+
+        # Compact and stable regardless of key order
+        self.assertEqual(serialize_metadata({'keywords': ['whale'], 'id': 1}), '{"id":1,"keywords":["whale"]}')
+        self.assertEqual(serialize_metadata({'id': 1, 'keywords': ['whale']}),
+                         serialize_metadata({'keywords': ['whale'], 'id': 1}))
+
+    def test_update(self):
+        updater = MetadataUpdater(self.api, store=self.store, batch_size=2, max_workers=1)
+        rows = [('a.jpg', {'keywords': ['whale'], 'id': 1}), ('b.jpg', '{"id": 2}'), ('bad.jpg', {'id': 3})]
+        results = list(updater.update(rows))
+
+        self.assertEqual(sorted(filepaths for filepaths, _, _ in results), [['a.jpg', 'b.jpg'], ['bad.jpg']])
+        self.assertEqual(updater.stats, {'sent': 2, 'skipped': 0, 'failed': 1})
+        # Metadata is sent serialized, strings as they are
+        self.assertEqual(self.api.updates()[0],
+                         {'a.jpg': '{"id":1,"keywords":["whale"]}', 'b.jpg': '{"id": 2}'})
+        # Hashes are only stored for batches that succeeded
+        self.assertEqual(self.store.get('a.jpg'), digest('{"id":1,"keywords":["whale"]}'))
+        self.assertEqual(self.store.get('b.jpg'), digest('{"id": 2}'))
+        self.assertEqual(self.store.get('bad.jpg'), None)
+        self.assertEqual(len(self.store), 2)
+
+    def test_skip_unchanged(self):
+        self.store.put('a.jpg', digest('{"id":1}'))
+        updater = MetadataUpdater(self.api, store=self.store, max_workers=1)
+        rows = [('a.jpg', {'id': 1}), ('b.jpg', {'id': 2}), ('c.jpg', {'id': 3})]
+        list(updater.update(rows))
+        self.assertEqual(updater.stats, {'sent': 2, 'skipped': 1, 'failed': 0})
+        self.assertEqual(sorted(self.api.updates()[0]), ['b.jpg', 'c.jpg'])
+
+        # A second run only sends the rows whose metadata changed
+        self.api.reset()
+        updater = MetadataUpdater(self.api, store=self.store, max_workers=1)
+        list(updater.update([('a.jpg', {'id': 1}), ('b.jpg', {'id': 20}), ('c.jpg', {'id': 3})]))
+        self.assertEqual(self.api.updates(), [{'b.jpg': '{"id":20}'}])
+        self.assertEqual(updater.stats, {'sent': 1, 'skipped': 2, 'failed': 0})
+        self.assertEqual(self.store.get('b.jpg'), digest('{"id":20}'))
+
+        # Without a store every row is sent
+        updater = MetadataUpdater(self.api)
+        list(updater.update([('a.jpg', {'id': 1})]))
+        self.assertEqual(updater.stats['sent'], 1)
+
+    def test_errors(self):
+        updater = MetadataUpdater(self.api, store=self.store, batch_size=1, retries=2, backoff=0)
+        results = list(updater.update([('down.jpg', {'id': 1}), ('a.jpg', {'id': 2})]))
+
+        errors = dict((filepaths[0], error) for filepaths, _, error in results)
+        self.assertIsInstance(errors['down.jpg'], requests.ConnectionError)
+        self.assertEqual(errors['a.jpg'], None)
+        # Connection errors are retried before the batch is given up
+        self.assertEqual(len([call for call in self.api.updates() if 'down.jpg' in call]), 3)
+        self.assertEqual(updater.stats, {'sent': 1, 'skipped': 0, 'failed': 1})
+        self.assertEqual(self.store.get('down.jpg'), None)
+
+if __name__ == '__main__':
+    unittest.main()
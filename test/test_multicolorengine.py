@@ -147,11 +147,20 @@ class TestMulticolorEngine(unittest.TestCase):
         self.assertEqual(r['error'], [])
         self.assertEqual(len(r['result']), 1)
 
-        # Colors without enough weights
+        # Colors without enough weights are rejected before the request is sent
         try:
             self.request.search_color(['243,249,22', 'aaaaaa', 'ffffff'], ['2'])
-        except TinEyeServiceError as e:
-            self.assertEqual(e.args[0], ['Please specify the same number of weights as colors.'])
+        except ValueError as e:
+            self.assertEqual(e.args[0], 'Please specify the same number of weights as colors.')
+
+        # Malformed colors are rejected before the request is sent
+        self.assertRaises(ValueError, self.request.search_color, ['243,249,256'])
+        self.assertRaises(ValueError, self.request.search_color, ['aaaaa'])
+
+        # Colors as tuples
+        r = self.request.search_color([(243, 249, 22)])
+        self.assertEqual(r['status'], 'ok')
+        self.assertEqual(len(r['result']), 1)
 
         # Colors and weights
         r = self.request.search_color(['243,249,22', 'ffffff'], ['1', '2', '3'])
@@ -282,6 +291,12 @@ class TestMulticolorEngine(unittest.TestCase):
         self.assertTrue('num_images_full_area' in r['result'][0])
         self.assertTrue('num_images_partial_area' in r['result'][0])
 
+        # As a numpy structured array
+        r = self.request.count_collection_colors(count_colors=['123, 235, 27'], result_format='numpy')
+        self.assertEqual(r['status'], 'ok')
+        self.assertEqual(r['result']['color'].tolist(), [[123, 235, 27]])
+        self.assertEqual(r['result']['name'].tolist(), ['Lawn Green'])
+
     def test_extract_image_colors(self):
         images = [Image(filepath='%s/banana.jpg' % imagepath, collection_filepath='banana.jpg')]
         r = self.request.add_image(images)
@@ -303,6 +318,13 @@ class TestMulticolorEngine(unittest.TestCase):
         self.assertTrue(len(r['result']) > 5)
         self.assertEqual(len(r['result'][0]['color']), 6)
 
+        # Image upload, numpy
+        r = self.request.extract_image_colors_image([images[0]], limit=5, result_format='numpy')
+        self.assertEqual(r['status'], 'ok')
+        self.assertEqual(len(r['result']), 5)
+        self.assertEqual(r['result']['color'].shape, (5, 3))
+        self.assertTrue(r['result']['weight'][0] > 0)
+
         # URL, rgb
         r = self.request.extract_image_colors_url(['https://tineye.com/images/meloncat.jpg'])
         self.assertEqual(r['status'], 'ok')
@@ -381,6 +403,21 @@ class TestMulticolorEngine(unittest.TestCase):
         self.assertTrue(r_metadata['action'], 'search')
         self.assertTrue(r_metadata['type'], 'string')
 
+    def test_update_metadata(self):
+        images = [Image(filepath='%s/banana.jpg' % imagepath, collection_filepath='banana.jpg', metadata=metadata)]
+        r = self.request.add_image(images)
+        self.assertEqual(r['status'], 'ok')
+
+        r = self.request.update_metadata(['banana.jpg'], [json.dumps({"keywords": ["squid"]})])
+        self.assertEqual(r['status'], 'ok')
+        self.assertEqual(r['method'], 'update_metadata')
+
+        r = self.request.get_metadata(['banana.jpg'])
+        self.assertTrue('squid' in r['result'][0]['metadata']['keywords'][''])
+
+        # Filepaths and metadata must line up
+        self.assertRaises(ValueError, self.request.update_metadata, ['banana.jpg'], [])
+
     def test_get_search_metadata(self):
         # Try getting metadata when there are no images
         try:
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import os
+import sys
+import unittest
+
+from requests.models import RequestEncodingMixin
+
+from tineyeservices.multipart import MultipartEncoder
+
+sys.path.append('../')
+
+fields = {
+    'images[0]': ('banana.jpg', b'\xff\xd8' + b'x' * 100000),
+    'images[1]': ('folder/"quoted".jpg', memoryview(bytearray(b'image data'))),
+    'image': ('text.jpg', 'text')}
+
+
+class TestMultipartEncoder(unittest.TestCase):
+    """ Test MultipartEncoder class. """
+
+    def test_body(self):
+        # Same body as requests builds with files=
+        body, content_type = RequestEncodingMixin._encode_files(
+            dict((name, (filename, bytes(data) if isinstance(data, memoryview) else data))
+                 for name, (filename, data) in fields.items()), {})
+        encoder = MultipartEncoder(fields, boundary=content_type.split('boundary=')[1])
+        self.assertEqual(encoder.content_type, content_type)
+        self.assertEqual(len(encoder), len(body))
+        self.assertEqual(encoder.read(), body)
+        self.assertEqual(encoder.read(10), b'')
+
+    def test_chunks(self):
+        encoder = MultipartEncoder(fields)
+        chunks = list(encoder)
+        self.assertTrue(all(len(chunk) <= 64 * 1024 for chunk in chunks))
+        body = b''.join(chunks)
+
+        # Image bytes are not copied
+        self.assertTrue(any(chunk.obj is fields['images[1]'][1].obj for chunk in chunks))
+
+        self.assertEqual(encoder.seek(100), 100)
+        self.assertEqual(encoder.read(), body[100:])
+        encoder.seek(-10, os.SEEK_END)
+        self.assertEqual(encoder.tell(), len(body) - 10)
+        self.assertEqual(encoder.read(), body[-10:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from tineyeservices import PaletteIndex
+
+sys.path.append('../')
+
+
+class TestPaletteIndex(unittest.TestCase):
+    """ Test PaletteIndex class. """
+
+    def setUp(self):
+        self.index = PaletteIndex(palette_size=4)
+        self.index.add('yellow.jpg', ['255,235,0', 'ffffff'], [80, 20], {'keywords': ['fruit']})
+        self.index.add('blue.jpg', [(0, 0, 255)], [1], {'keywords': ['sky']})
+        self.index.add('mixed.jpg', [(0, 0, 255), (250, 230, 10)], [1, 1])
+
+    def test_search(self):
+        r = self.index.search(['255,240,0'])
+        self.assertEqual([m['filepath'] for m in r], ['yellow.jpg', 'mixed.jpg', 'blue.jpg'])
+        self.assertTrue(r[0]['score'] > r[1]['score'] > r[2]['score'])
+
+        # Min score and limit
+        r = self.index.search(['255,240,0'], min_score=10, limit=1)
+        self.assertEqual([m['filepath'] for m in r], ['yellow.jpg'])
+
+        # Metadata prefiltering
+        r = self.index.search(['255,240,0'], metadata={'keywords': 'sky'})
+        self.assertEqual([m['filepath'] for m in r], ['blue.jpg'])
+        r = self.index.search(['255,240,0'], metadata=lambda m: m is None)
+        self.assertEqual([m['filepath'] for m in r], ['mixed.jpg'])
+        r = self.index.search(['255,240,0'], metadata={'keywords': 'fruit', 'id': 1})
+        self.assertEqual(r, [])
+        r = self.index.search(['255,240,0'], metadata={})
+        self.assertEqual([m['filepath'] for m in r], ['yellow.jpg', 'blue.jpg'])
+
+        # Only the filtered images are scored
+        scores = self.index.scores(['255,240,0'])
+        self.assertEqual(self.index.scores(['255,240,0'], rows=[2, 0]).tolist(), [scores[2], scores[0]])
+
+    def test_update(self):
+        # Replacing a palette
+        self.index.add('blue.jpg', ['255,240,0'], [1])
+        r = self.index.search(['255,240,0'], limit=1)
+        self.assertEqual(r[0]['filepath'], 'blue.jpg')
+        self.assertEqual(len(self.index), 3)
+
+        # Removing a palette
+        self.index.remove('yellow.jpg')
+        self.assertFalse('yellow.jpg' in self.index)
+        self.assertEqual(sorted(m['filepath'] for m in self.index.search(['000000'])),
+                         ['blue.jpg', 'mixed.jpg'])
+        self.assertEqual(self.index.search(['000000'], metadata={'keywords': 'fruit'}), [])
+
+        # Replacing metadata updates the prefilter
+        self.index.add('blue.jpg', ['255,240,0'], [1], {'keywords': ['sea', 'sky'], 'id': 2})
+        r = self.index.search(['000000'], metadata={'keywords': 'sea', 'id': 2})
+        self.assertEqual([m['filepath'] for m in r], ['blue.jpg'])
+
+        # Palettes longer than the palette size are truncated
+        self.index.add('many.jpg', ['000000', '111111', '222222', '333333', '444444'], [1, 1, 1, 1, 1])
+        self.assertTrue('many.jpg' in self.index)
+
+    def test_zero_weights(self):
+        self.assertRaises(ValueError, self.index.search, ['255,240,0'], weights=[0])
+
+    def test_save(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'palettes.npz')
+            self.index.sigma = 20.0
+            self.index.save(path)
+            index = PaletteIndex.load(path)
+            self.assertEqual(index.sigma, 20.0)
+            self.assertEqual(index.search(['255,240,0']), self.index.search(['255,240,0']))
+            self.assertEqual(index.metadata, self.index.metadata)
+            self.assertEqual(index.search(['255,240,0'], metadata={'keywords': 'sky'}),
+                             self.index.search(['255,240,0'], metadata={'keywords': 'sky'}))
+            self.assertEqual(index.filepaths, self.index.filepaths)
+            self.assertEqual(PaletteIndex.load(path, sigma=40.0).sigma, 40.0)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
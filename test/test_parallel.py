@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import sys
+import threading
+import time
+import unittest
+
+import requests
+
+from tineyeservices.parallel import call_with_retries, imap_unordered, iter_batches
+
+sys.path.append('../')
+
+
+class TestParallel(unittest.TestCase):
+    """ Test parallel helpers. """
+
+    def test_iter_batches(self):
+        self.assertEqual(list(iter_batches(range(5), max_count=2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(iter_batches([], max_count=2)), [])
+
+        # Byte budget, an oversized item gets a batch of its own
+        items = ['aa', 'bb', 'cccccc', 'd']
+        self.assertEqual(list(iter_batches(items, max_bytes=4, size=len)), [['aa', 'bb'], ['cccccc'], ['d']])
+        self.assertEqual(list(iter_batches(items, max_count=1, max_bytes=100, size=len)),
+                         [['aa'], ['bb'], ['cccccc'], ['d']])
+
+    def test_call_with_retries(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise requests.ConnectionError('Connection refused')
+            return 'ok'
+        self.assertEqual(call_with_retries(flaky, retries=3, backoff=0), 'ok')
+        self.assertEqual(len(calls), 3)
+
+        # Out of retries
+        del calls[:]
+        self.assertRaises(requests.ConnectionError, call_with_retries, flaky, retries=1, backoff=0)
+        self.assertEqual(len(calls), 2)
+
+        # Other errors are not retried
+        def broken():
+            calls.append(1)
+            raise ValueError('Bad input')
+        del calls[:]
+        self.assertRaises(ValueError, call_with_retries, broken, backoff=0)
+        self.assertEqual(len(calls), 1)
+
+    def test_imap_unordered(self):
+        results = imap_unordered(lambda x: x * 2, range(20), max_workers=4)
+        self.assertEqual(sorted((item, result) for item, result, error in results),
+                         [(x, x * 2) for x in range(20)])
+
+        # Errors are returned rather than raised
+        def fail(x):
+            if x == 3:
+                raise ValueError('three')
+            return x
+        errors = [(item, error) for item, result, error in imap_unordered(fail, range(5)) if error]
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0][0], 3)
+        self.assertTrue(isinstance(errors[0][1], ValueError))
+
+    def test_imap_unordered_bounded(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'most': 0}
+
+        def work(x):
+            with lock:
+                state['running'] += 1
+                state['most'] = max(state['most'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+            return x
+
+        # Only two items of cost 10 fit in a budget of 20
+        results = list(imap_unordered(work, range(10), max_workers=8, cost=lambda x: 10, max_cost=20))
+        self.assertEqual(len(results), 10)
+        self.assertTrue(state['most'] <= 2)
+
+if __name__ == '__main__':
+    unittest.main()
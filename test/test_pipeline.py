@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+from tineyeservices import Pipeline
+from tineyeservices.pipeline import Stage
+from test.helpers import FakeMatchEngineRequest
+
+sys.path.append('../')
+
+imagepath = os.path.abspath(os.path.join(os.path.dirname(__file__), 'images'))
+
+
+def square(x):
+    return x * x
+
+
+# Use the default batch sizes and workers rather than a profile tuned on this host
+@mock.patch.dict(os.environ, {'TINEYESERVICES_PROFILES': os.devnull})
+class TestPipeline(unittest.TestCase):
+    """ Test Pipeline class. """
+
+    def test_map_batch(self):
+        pipeline = Pipeline(max_queued=2)\
+            .map(square, workers=3, name='square')\
+            .batch(max_count=4)\
+            .map(sum, name='sum')
+        self.assertEqual(sum(pipeline.run(range(10))), sum(x * x for x in range(10)))
+        metrics = pipeline.metrics()
+        self.assertEqual(metrics['square']['processed'], 10)
+        self.assertEqual(metrics['batch']['processed'], 3)
+        self.assertTrue(pipeline.bottleneck() in metrics)
+
+    def test_processes(self):
+        pipeline = Pipeline().map(square, workers=2, processes=True)
+        self.assertEqual(sorted(pipeline.run(range(5))), [0, 1, 4, 9, 16])
+
+    def test_errors(self):
+        pipeline = Pipeline().map(lambda x: 1 // x, workers=2, name='invert')
+        self.assertRaises(ZeroDivisionError, list, pipeline.run(range(100)))
+
+        failed = []
+        results = list(pipeline.run(range(-2, 3), on_error=lambda stage, item, e: failed.append(item)))
+        self.assertEqual(sorted(results), [-1, -1, 0, 1])
+        self.assertEqual(failed, [0])
+        self.assertEqual(pipeline.metrics()['invert']['errors'], 1)
+
+    def test_stage(self):
+        class Incomplete(Stage):
+            pass
+
+        # A stage without run fails when created, not when the pipeline runs
+        self.assertRaises(TypeError, Incomplete, 'incomplete')
+
+    def test_ingest(self):
+        api = FakeMatchEngineRequest()
+        paths = [os.path.join(imagepath, f) for f in sorted(os.listdir(imagepath))]
+        pipeline = Pipeline.ingest(api, read_workers=2, batch_size=2)
+        responses = list(pipeline.run(paths))
+        self.assertEqual(sum(len(images) for images, response in responses), len(paths))
+        batches = [len(filepaths) for method, filepaths in api.writes()]
+        self.assertEqual(sum(batches), len(paths))
+        self.assertTrue(max(batches) <= 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
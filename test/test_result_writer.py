@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from tineyeservices import ParquetResultWriter
+from tineyeservices.arrays import pyarrow
+from test.helpers import FakeMatchEngineRequest, response
+
+sys.path.append('../')
+
+
+class SearchRequest(FakeMatchEngineRequest):
+    """ Answer searches with one match per character of the URL. """
+
+    def respond(self, method, params, file_params):
+        result = [{'filepath': '%s-%i.png' % (params['url'], i), 'score': 100 - i,
+                   'overlay': 'overlay/%i' % i}
+                  for i in range(len(params['url']))]
+        if params.get('return_metadata'):
+            for i, match in enumerate(result):
+                match['metadata'] = {'id': i}
+        return response(method, result)
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class TestParquetResultWriter(unittest.TestCase):
+    """ Test ParquetResultWriter class. """
+
+    def setUp(self):
+        self.api = SearchRequest()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'matches.parquet')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append(self):
+        import pyarrow.parquet
+
+        with ParquetResultWriter(self.path, row_group_size=5) as writer:
+            self.assertEqual(writer.append(self.api.search_url('abc', result_format='arrow'), query='abc'), 3)
+            # Every search result format can be appended
+            writer.append(self.api.search_url('defg'), query='defg')
+            writer.append(self.api.search_url('hi', result_format='objects'), query='hi')
+            writer.append(self.api.search_url('j', result_format='numpy'), query='j')
+            writer.append({'status': 'ok', 'error': [], 'result': []}, query='empty')
+        self.assertEqual(writer.rows, 10)
+
+        parquet_file = pyarrow.parquet.ParquetFile(self.path)
+        self.assertEqual(parquet_file.metadata.num_rows, 10)
+        # Full row groups are written as matches come in, the rest on close
+        self.assertEqual(parquet_file.metadata.num_row_groups, 2)
+
+        table = parquet_file.read()
+        self.assertEqual(table.column_names[:3], ['query', 'filepath', 'score'])
+        self.assertEqual(table.column('query').to_pylist(), ['abc'] * 3 + ['defg'] * 4 + ['hi'] * 2 + ['j'])
+        self.assertEqual(table.column('score').type, pyarrow.float32())
+        self.assertEqual(table.column('filepath').to_pylist()[3], 'defg-0.png')
+
+        self.assertRaises(ValueError, writer.append, self.api.search_url('abc'))
+
+    def test_metadata(self):
+        import pyarrow.parquet
+
+        writer = ParquetResultWriter(self.path)
+        for result_format in ('json', 'objects', 'numpy', 'pandas', 'arrow'):
+            writer.append(self.api.search_url('ab', return_metadata='1', result_format=result_format))
+        # Matches with other columns are refused and not kept
+        self.assertRaises(ValueError, writer.append, self.api.search_url('ab'))
+        writer.close()
+
+        self.assertEqual(writer.rows, 10)
+        table = pyarrow.parquet.read_table(self.path)
+        self.assertEqual(table.column('metadata').type, pyarrow.string())
+        self.assertEqual(table.column('metadata').to_pylist(), ['{"id": 0}', '{"id": 1}'] * 5)
+
+    def test_extend(self):
+        with ParquetResultWriter(self.path) as writer:
+            writer.extend((url, self.api.search_url(url, result_format='pandas')) for url in ['a', 'bc'])
+        self.assertEqual(writer.rows, 3)
+        self.assertTrue(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+import sys
+import unittest
+
+from tineyeservices import ColorResponse, CompareResult, Image, SearchResult
+from test.helpers import FakeMatchEngineRequest, FakeMulticolorEngineRequest, response
+
+sys.path.append('../')
+
+MATCHES = [
+    {'filepath': 'match1.png', 'score': '97.2', 'overlay': 'overlay/query.png/match1.png',
+     'match_percent': '90.0', 'query_overlap_percent': '85.5', 'target_overlap_percent': '80.1'},
+    {'filepath': 'match2.png', 'score': '45.0', 'overlay': 'overlay/query.png/match2.png'}]
+
+COLORS = [
+    {'color': [255, 0, 0], 'rank': 1, 'weight': '60.5', 'name': 'Red', 'class': 'Red'},
+    {'color': 'ffffff', 'rank': 2, 'weight': '39.5', 'name': 'White', 'class': 'White'}]
+
+
+class MatchRequest(FakeMatchEngineRequest):
+    """ Answer search and compare calls with MATCHES. """
+
+    def respond(self, method, params, file_params):
+        return response(method, [dict(m) for m in MATCHES])
+
+
+class ColorRequest(FakeMulticolorEngineRequest):
+    """ Answer color calls with COLORS and search calls with MATCHES. """
+
+    def respond(self, method, params, file_params):
+        result = COLORS if method.startswith('extract') else MATCHES
+        return response(method, [dict(r) for r in result])
+
+
+class TestResults(unittest.TestCase):
+    """ Test the typed result objects. """
+
+    def setUp(self):
+        self.matchengine = MatchRequest()
+        self.multicolorengine = ColorRequest()
+
+    def test_json_default(self):
+        response = self.matchengine.search_url('http://localhost/query.png')
+        self.assertIsInstance(response, dict)
+        self.assertEqual(response['result'], MATCHES)
+
+    def test_search_objects(self):
+        response = self.matchengine.search_url('http://localhost/query.png', result_format='objects')
+        self.assertIsInstance(response, SearchResult)
+        self.assertEqual(response.status, 'ok')
+        self.assertEqual(response.method, 'search')
+
+        match = response.result[0]
+        self.assertEqual(match.filepath, 'match1.png')
+        self.assertEqual(match.score, 97.2)
+        self.assertEqual(match.target_overlap_percent, 80.1)
+        # Missing fields read as None
+        self.assertIsNone(response.result[1].match_percent)
+        with self.assertRaises(AttributeError):
+            match.unknown
+
+        # Results are wrapped once
+        self.assertIs(response.result, response['result'])
+
+    def test_dict_compatibility(self):
+        response = self.matchengine.search_image(
+            Image.from_bytes(b'data', collection_filepath='query.png'), result_format='objects')
+        self.assertEqual(response['status'], 'ok')
+        match = response['result'][0]
+        self.assertEqual(match['score'], '97.2')
+        self.assertEqual(dict(match), MATCHES[0])
+        self.assertEqual([m['filepath'] for m in response['result']], ['match1.png', 'match2.png'])
+        self.assertEqual(json.loads(json.dumps(response.to_dict()))['result'], MATCHES)
+
+    def test_slots(self):
+        response = self.matchengine.search_url('http://localhost/query.png', result_format='objects')
+        for obj in (response, response.result[0]):
+            self.assertFalse(hasattr(obj, '__dict__'))
+            with self.assertRaises(AttributeError):
+                obj.extra = 1
+
+    def test_compare_objects(self):
+        response = self.matchengine.compare_url(
+            'http://localhost/1.png', 'http://localhost/2.png', result_format='objects')
+        self.assertIsInstance(response, CompareResult)
+        self.assertEqual(response.result[0].match_percent, 90.0)
+
+    def test_multicolorengine_search_objects(self):
+        response = self.multicolorengine.search_color(['ff0000'], result_format='objects')
+        self.assertIsInstance(response, SearchResult)
+        self.assertEqual(response.result[1].score, 45.0)
+
+    def test_color_objects(self):
+        response = self.multicolorengine.extract_image_colors_url(
+            ['http://localhost/query.png'], result_format='objects')
+        self.assertIsInstance(response, ColorResponse)
+        first, second = response.result
+        self.assertEqual(first.color, (255, 0, 0))
+        self.assertEqual(second.color, (255, 255, 255))
+        self.assertEqual(first.weight, 60.5)
+        self.assertEqual(first.class_, 'Red')
+        self.assertEqual(first['class'], 'Red')
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            self.matchengine.search_url('http://localhost/query.png', result_format='xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
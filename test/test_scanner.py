@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from tineyeservices import DirectoryScanner
+
+sys.path.append('../')
+
+
+class TestDirectoryScanner(unittest.TestCase):
+    """ Test DirectoryScanner class. """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for path, size in [('a.jpg', 10), ('b.PNG', 100), ('notes.txt', 10),
+                           ('x/c.jpg', 10), ('x/y/d.gif', 1000), ('x/y/z/e.jpeg', 0)]:
+            path = os.path.join(self.root, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as fp:
+                fp.write(b'x' * size)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_scan(self):
+        scanner = DirectoryScanner(collection_filepath='relative', max_workers=2)
+        images = list(scanner.scan(self.root))
+        self.assertEqual(sorted(image.collection_filepath for image in images),
+                         ['a.jpg', 'b.PNG', 'x/c.jpg', 'x/y/d.gif', 'x/y/z/e.jpeg'])
+        self.assertEqual(scanner.stats, {'directories': 4, 'files': 6, 'images': 5})
+
+        # Images are lazy
+        self.assertTrue(all(image._data is None for image in images))
+        image = [image for image in images if image.collection_filepath == 'b.PNG'][0]
+        self.assertEqual(len(image.data), 100)
+
+    def test_filters(self):
+        scanner = DirectoryScanner(min_size=1, max_size=100, extensions=['.jpg', '.png'])
+        self.assertEqual(sorted(os.path.basename(image.filepath) for image in scanner.scan(self.root)),
+                         ['a.jpg', 'b.PNG', 'c.jpg'])
+
+        scanner = DirectoryScanner(modified_after=time.time() + 60)
+        self.assertEqual(list(scanner.scan(self.root)), [])
+
+        scanner = DirectoryScanner(collection_filepath=lambda path, root: os.path.basename(path))
+        self.assertEqual(sorted(image.collection_filepath for image in scanner.scan(os.path.join(self.root, 'x'))),
+                         ['c.jpg', 'd.gif', 'e.jpeg'])
+
+    def test_symlink_loop(self):
+        os.symlink(self.root, os.path.join(self.root, 'x', 'loop'))
+        scanner = DirectoryScanner(follow_symlinks=True)
+        self.assertEqual(len(list(scanner.scan(self.root))), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import sys
+import threading
+import time
+import unittest
+
+from tineyeservices import Deadline, MatchEngineRequest, RequestScheduler, TinEyeServiceDeadlineExceeded
+from test.helpers import FakeResponse
+
+sys.path.append('../')
+
+
+class SessionRequest(MatchEngineRequest):
+    """ Record the session each request would be sent with. """
+
+    def _send(self, session, method, params, file_params, auth, timeout):
+        self.sessions.append(session)
+        return FakeResponse()
+
+
+class TestRequestScheduler(unittest.TestCase):
+    """ Test RequestScheduler class. """
+
+    def test_with_priority(self):
+        scheduler = RequestScheduler()
+        api = SessionRequest()
+        api.sessions = []
+        batch_api = api.with_priority(scheduler, 'batch')
+        api.ping()
+        batch_api.ping()
+        api.with_priority(scheduler).ping()
+        self.assertEqual(api.scheduler, None)
+        self.assertEqual(api.sessions[1:], [scheduler.sessions['batch'], scheduler.sessions['interactive']])
+        self.assertEqual(scheduler.stats, {'interactive': 1, 'batch': 1, 'batch_waits': 0})
+        self.assertRaises(ValueError, api.with_priority(scheduler, 'urgent').ping)
+        scheduler.close()
+
+    def test_batch_gives_way(self):
+        scheduler = RequestScheduler(interactive_workers=1, batch_workers=2, busy_batch_workers=0)
+        order = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def hold(session, name):
+            order.append(name)
+            started.set()
+            release.wait(5)
+
+        def run(session, name):
+            order.append(name)
+
+        interactive = threading.Thread(target=scheduler.call, args=('interactive', hold, 'first'))
+        interactive.start()
+        started.wait(5)
+
+        # Batch work queued behind an interactive request waits for it
+        threads = [threading.Thread(target=scheduler.call, args=('batch', run, 'batch')),
+                   threading.Thread(target=scheduler.call, args=('interactive', run, 'second'))]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        self.assertEqual(order, ['first'])
+
+        release.set()
+        for thread in [interactive] + threads:
+            thread.join(5)
+        self.assertEqual(order, ['first', 'second', 'batch'])
+        self.assertEqual(scheduler.stats['batch_waits'], 1)
+
+    def test_deadline(self):
+        scheduler = RequestScheduler(batch_workers=1)
+        release = threading.Event()
+        holder = threading.Thread(target=scheduler.call, args=('batch', lambda session: release.wait(5)))
+        holder.start()
+
+        # A request waiting for a slot gives up at the deadline
+        start = time.monotonic()
+        self.assertRaises(TinEyeServiceDeadlineExceeded, scheduler.call, 'batch', lambda session: None,
+                          deadline=Deadline(0.1))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(scheduler.waiting['batch'], 0)
+
+        release.set()
+        holder.join(5)
+        self.assertEqual(scheduler.call('batch', lambda session: 'done', deadline=Deadline(1)), 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
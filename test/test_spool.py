@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from tineyeservices import Image, WriteSpool
+from test.helpers import FakeMatchEngineRequest, response
+
+sys.path.append('../')
+
+
+class FlakyRequest(FakeMatchEngineRequest):
+    """ Record the calls made, failing to connect while `down` is set. """
+
+    down = False
+
+    def _request(self, method, params, file_params=None, **kwargs):
+        if self.down:
+            raise requests.ConnectionError('Connection refused')
+        return super(FlakyRequest, self)._request(method, params, file_params, **kwargs)
+
+    def respond(self, method, params, file_params):
+        return response(method, errors=['%s: Failed to remove from index.' % value
+                                        for value in params.values() if value == 'bad.jpg'])
+
+
+# Use the default batch sizes and workers rather than a profile tuned on this host
+@mock.patch.dict(os.environ, {'TINEYESERVICES_PROFILES': os.devnull})
+class TestWriteSpool(unittest.TestCase):
+    """ Test WriteSpool class. """
+
+    def setUp(self):
+        self.api = FlakyRequest()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'spool.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_available(self):
+        with WriteSpool(self.api, self.path) as spool:
+            response = spool.delete(['a.jpg'])
+            self.assertEqual(response['status'], 'ok')
+            self.assertEqual(len(spool), 0)
+            self.assertEqual(spool.stats['sent'], 1)
+        self.assertEqual(self.api.methods(), ['delete'])
+
+    def test_spool_and_replay(self):
+        self.api.down = True
+        images = [Image.from_bytes(b'image %i' % i, collection_filepath='%i.jpg' % i,
+                                   metadata='{"id": %i}' % i) for i in range(5)]
+        with WriteSpool(self.api, self.path, batch_size=2, retry_interval=60) as spool:
+            response = spool.add_image(images)
+            self.assertTrue(response['spooled'])
+            spool.delete(['1.jpg'])
+            self.assertEqual(len(spool), 6)
+            self.assertFalse(spool.flush())
+
+        # The spool survives a restart and is replayed in order, in batches,
+        # by flush or by the background thread, whichever runs first
+        self.api.down = False
+        with WriteSpool(self.api, self.path, batch_size=2, retry_interval=60) as spool:
+            self.assertTrue(spool.flush())
+            self.assertEqual(len(spool), 0)
+            self.assertEqual(spool.stats['replayed'], 6)
+
+        methods = [method for method in self.api.methods() if method != 'ping']
+        self.assertEqual(methods, ['add', 'add', 'add', 'delete'])
+        adds = [call for call in self.api.calls if call[0] == 'add']
+        filepaths = sorted(value for call in adds for key, value in call[1].items()
+                           if key.startswith('filepaths'))
+        self.assertEqual(filepaths, ['%i.jpg' % i for i in range(5)])
+        # Image bytes are kept
+        self.assertEqual(sorted(bytes(data) for call in adds for _, data in call[2].values()),
+                         [b'image %i' % i for i in range(5)])
+
+    def test_order_while_spooled(self):
+        with WriteSpool(self.api, self.path, retry_interval=60) as spool:
+            self.api.down = True
+            spool.delete(['a.jpg'])
+            # The engine is back but earlier writes are still spooled
+            self.api.down = False
+            self.assertTrue(spool.add_url([Image(url='http://localhost/a.jpg')])['spooled'])
+            spool.flush()
+        self.assertEqual([method for method in self.api.methods() if method != 'ping'],
+                         ['delete', 'add'])
+
+    def test_replay_order(self):
+        self.api.down = True
+        with WriteSpool(self.api, self.path, batch_size=1, max_workers=4, retry_interval=60) as spool:
+            spool.delete(['a.jpg', 'b.jpg', 'c.jpg'])
+            spool.delete(['a.jpg'])
+            self.api.down = False
+            self.assertTrue(spool.flush())
+
+        # The second delete of a.jpg is only sent once the first one is done
+        deletes = [filepaths[0] for method, filepaths in self.api.writes() if method == 'delete']
+        self.assertEqual(sorted(deletes[:3]), ['a.jpg', 'b.jpg', 'c.jpg'])
+        self.assertEqual(deletes[3:], ['a.jpg'])
+
+    def test_background_replay(self):
+        errors = []
+        spool = WriteSpool(self.api, self.path, defer=True, retry_interval=0.05,
+                           on_error=lambda method, items, response: errors.append(items))
+        spool.delete(['bad.jpg'])
+        spool.delete(['good.jpg'])
+        deadline = time.time() + 5
+        while len(spool) and time.time() < deadline:
+            time.sleep(0.01)
+        spool.close()
+        self.assertEqual(spool.stats['replayed'], 2)
+        self.assertEqual(spool.stats['failed'], 1)
+        self.assertEqual(errors, [['bad.jpg']])
+
+    def test_item_errors(self):
+        errors = []
+        with WriteSpool(self.api, self.path, defer=True, retry_interval=60,
+                        on_error=lambda method, items, response: errors.append((items, response))) as spool:
+            spool.delete(['a.jpg', 'bad.jpg', 'b.jpg'])
+            self.assertTrue(spool.flush())
+            self.assertEqual(spool.stats['failed'], 1)
+            self.assertEqual(spool.stats['replayed'], 3)
+        # The batch is not sent again, as its error names the failed item
+        self.assertEqual(self.api.methods().count('delete'), 1)
+        self.assertEqual([items for items, response in errors], [['bad.jpg']])
+        self.assertEqual(errors[0][1]['error'], ['bad.jpg: Failed to remove from index.'])
+
+    def test_update_metadata_lengths(self):
+        with WriteSpool(self.api, self.path, defer=True) as spool:
+            self.assertRaises(ValueError, spool.update_metadata, ['a.jpg', 'b.jpg'], ['{}'])
+            self.assertEqual(len(spool), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from tineyeservices import Image, MatchEngineRequest, Pipeline, Tuner, TuningProfile, WriteQueue
+from tineyeservices.tuner import tuned
+from test.helpers import FakeMatchEngineRequest, response
+
+sys.path.append('../')
+
+
+class ModelRequest(FakeMatchEngineRequest):
+    """
+    Stand in for an engine where each call costs a fixed overhead plus a
+    cost per item, and only `capacity` calls are served at once.
+    """
+
+    def __init__(self, capacity=4, **kwargs):
+        super(ModelRequest, self).__init__(**kwargs)
+        self.slots = threading.Semaphore(capacity)
+        self.collection = set()
+        self.overwrites = 0
+
+    def respond(self, method, params, file_params):
+        filepaths = [value for key, value in params.items() if key.startswith('filepath')]
+        with self.slots:
+            time.sleep(0.002 + 0.0002 * len(filepaths))
+        with self.lock:
+            if method == 'add':
+                self.overwrites += len(self.collection.intersection(filepaths))
+                self.collection.update(filepaths)
+            elif method == 'delete':
+                self.collection.difference_update(filepaths)
+        return response(method)
+
+
+class TestTuner(unittest.TestCase):
+    """ Test Tuner and TuningProfile classes. """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'profiles.json')
+        self.api = ModelRequest()
+        self.images = [Image.from_bytes(b'image %i' % i) for i in range(40)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_choose(self):
+        tuner = Tuner(self.api, self.images, knee=0.9, max_latency=0.5)
+        measurements = [
+            {'batch_size': 10, 'workers': 1, 'throughput': 100, 'latency_p95': 0.1, 'failures': 0},
+            {'batch_size': 10, 'workers': 4, 'throughput': 380, 'latency_p95': 0.1, 'failures': 0},
+            {'batch_size': 50, 'workers': 4, 'throughput': 400, 'latency_p95': 0.2, 'failures': 0},
+            {'batch_size': 50, 'workers': 16, 'throughput': 410, 'latency_p95': 0.9, 'failures': 0},
+            {'batch_size': 100, 'workers': 16, 'throughput': 900, 'latency_p95': 0.1, 'failures': 3}]
+        # The cheapest setting within 90% of the best usable throughput
+        self.assertEqual(tuner.choose(measurements), measurements[1])
+        self.assertIsNone(tuner.choose(measurements[4:]))
+
+    def test_tune(self):
+        tuner = Tuner(self.api, self.images, batch_sizes=(1, 10, 20), workers=(1, 2, 4, 8))
+        profile = tuner.tune(path=self.path)
+
+        self.assertEqual(sorted(profile.settings), ['add_image', 'delete', 'search_image'])
+        self.assertEqual(sorted(profile.settings['add_image']), ['batch_size', 'workers'])
+        self.assertEqual(list(profile.settings['search_image']), ['workers'])
+        # Which setting wins depends on timing, see test_choose for the choice itself
+        self.assertIn(profile.get('add_image', 'batch_size'), (1, 10, 20))
+        self.assertIn(profile.get('search_image', 'workers'), (1, 2, 4, 8))
+        self.assertEqual(len(profile.measurements['add_image']), 12)
+        self.assertEqual(len(profile.measurements['search_image']), 4)
+        # The sample images are removed from the collection
+        self.assertEqual(self.api.collection, set())
+
+        loaded = TuningProfile.load(self.api.api_url, self.path)
+        self.assertEqual(loaded.settings, profile.settings)
+        self.assertIsNone(TuningProfile.load('http://other/rest/', self.path))
+
+    def test_sweep_add_image(self):
+        tuner = Tuner(self.api, self.images, batch_sizes=(10, 20), workers=(1, 2))
+        self.assertEqual(len(tuner.sweep('add_image')), 4)
+        # Every setting adds the samples anew rather than overwriting them
+        self.assertEqual(self.api.overwrites, 0)
+        self.assertEqual(self.api.collection, set())
+
+    def test_tuned_defaults(self):
+        TuningProfile(self.api.api_url, {
+            'add_image': {'batch_size': 42, 'workers': 3},
+            'delete': {'batch_size': 7, 'workers': 2}}).save(self.path)
+
+        with mock.patch.dict(os.environ, {'TINEYESERVICES_PROFILES': self.path}):
+            self.assertEqual(tuned(self.api, 'add_image', 'batch_size', 100), 42)
+            self.assertEqual(tuned(self.api, 'search_image', 'workers', 8), 8)
+            self.assertEqual(tuned(MatchEngineRequest(api_url='http://other/rest/'),
+                                   'add_image', 'batch_size', 100), 100)
+
+            queue = WriteQueue(self.api)
+            self.assertEqual(queue.max_counts['add_image'], 42)
+            self.assertEqual(queue.max_counts['delete'], 7)
+            queue.close()
+            # Explicit settings win
+            queue = WriteQueue(self.api, max_count=5)
+            self.assertEqual(queue.max_counts['delete'], 5)
+            queue.close()
+
+            pipeline = Pipeline.ingest(self.api)
+            self.assertEqual(pipeline.stages[1].max_count, 42)
+            self.assertEqual(pipeline.stages[2].workers, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+from tineyeservices import Image, WriteQueue
+from test.helpers import FakeMulticolorEngineRequest, indexed, response
+
+sys.path.append('../')
+
+
+class WriteRequest(FakeMulticolorEngineRequest):
+    """ Answer write calls, failing for filepaths starting with 'bad'. """
+
+    def respond(self, method, params, file_params):
+        filepaths = indexed(params, 'filepaths')
+        return response(method, errors=['%s: failed' % f for f in filepaths if f.startswith('bad')])
+
+
+# Use the default batch sizes and workers rather than a profile tuned on this host
+@mock.patch.dict(os.environ, {'TINEYESERVICES_PROFILES': os.devnull})
+class TestWriteQueue(unittest.TestCase):
+    """ Test WriteQueue class. """
+
+    def setUp(self):
+        self.api = WriteRequest()
+
+    def image(self, filepath):
+        image = Image(url='http://localhost/%s' % filepath)
+        image.data = b'data'
+        return image
+
+    def test_batching(self):
+        with WriteQueue(self.api, max_count=3, linger=10) as queue:
+            futures = [queue.add_image(self.image('%i.jpg' % i)) for i in range(7)]
+        self.assertEqual([len(filepaths) for _, filepaths in self.api.writes()], [3, 3, 1])
+        self.assertTrue(all(future.result()['status'] == 'ok' for future in futures))
+
+    def test_linger(self):
+        queue = self.api.write_queue(max_count=100, linger=0.01)
+        future = queue.delete('banana.jpg')
+        self.assertEqual(future.result(timeout=5)['status'], 'ok')
+        self.assertEqual(self.api.writes(), [('delete', ['banana.jpg'])])
+        queue.close()
+        self.assertRaises(ValueError, queue.delete, 'banana.jpg')
+
+    def test_order(self):
+        with WriteQueue(self.api, linger=10) as queue:
+            queue.add_image(self.image('a.jpg'))
+            queue.update_metadata('a.jpg', '{"keywords": "whale"}')
+            queue.delete('a.jpg')
+            queue.add_url(self.image('b.jpg'))
+        self.assertEqual(self.api.methods(),
+                         ['add', 'update_metadata', 'delete', 'add'])
+
+    def test_max_bytes(self):
+        with WriteQueue(self.api, max_bytes=10, linger=10) as queue:
+            for i in range(4):
+                queue.add_image(self.image('%i.jpg' % i))
+        self.assertEqual([len(filepaths) for _, filepaths in self.api.writes()], [2, 2])
+
+    def test_item_errors(self):
+        with WriteQueue(self.api, linger=10) as queue:
+            good = queue.delete('good.jpg')
+            bad = queue.delete('bad.jpg')
+            queue.flush()
+            self.assertEqual(good.result()['status'], 'ok')
+            self.assertEqual(good.result()['error'], [])
+            self.assertEqual(bad.result()['status'], 'fail')
+            self.assertEqual(bad.result()['error'], ['bad.jpg: failed'])
+            self.assertIsNot(good.result(), bad.result())
+        # Errors name their item, so nothing is sent again
+        self.assertEqual(len(self.api.calls), 1)
+
+    def test_split_failed(self):
+        def respond(method, params, file_params):
+            if len(indexed(params, 'filepaths')) > 1:
+                return response(method, errors=['Batch too large'])
+            return response(method)
+        self.api.respond = respond
+
+        with WriteQueue(self.api, linger=10) as queue:
+            futures = [queue.delete('a.jpg'), queue.delete('b.jpg')]
+        # A batch that failed as a whole is sent again one by one
+        self.assertEqual([filepaths for _, filepaths in self.api.writes()],
+                         [['a.jpg', 'b.jpg'], ['a.jpg'], ['b.jpg']])
+        self.assertEqual([future.result()['status'] for future in futures], ['ok', 'ok'])
+
+
+if __name__ == '__main__':
+    unittest.main()
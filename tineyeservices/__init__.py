@@ -1,9 +1,28 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2018 TinEye. All rights reserved worldwide.
 
-from .exception import TinEyeServiceException, TinEyeServiceError, TinEyeServiceWarning
-from .image import Image
+from .cluster import DuplicateClusterJob
+from .color_extractor import BulkColorExtractor
+from .compression import Compression
+from .deadline import Deadline
+from .exception import (
+    TinEyeServiceException, TinEyeServiceError, TinEyeServiceWarning, TinEyeServiceDeadlineExceeded)
+from .facet_cache import FacetCache
+from .image import Image, ImageBatch
+from .limiter import HostLimiter
 from .matchengine_request import MatchEngineRequest
+from .metadata_mirror import MetadataMirror
+from .metadata_query import MetadataQueryBuilder
+from .metadata_updater import MetadataUpdater
 from .mobileengine_request import MobileEngineRequest
 from .multicolorengine_request import MulticolorEngineRequest
+from .palette_index import PaletteIndex
+from .pipeline import Pipeline
+from .result_writer import ParquetResultWriter
+from .results import ColorResponse, ColorResult, CompareResult, Match, SearchResult
+from .scanner import DirectoryScanner
+from .scheduler import RequestScheduler
+from .spool import WriteSpool
+from .tuner import Tuner, TuningProfile
 from .wineengine_request import WineEngineRequest
+from .write_queue import WriteQueue
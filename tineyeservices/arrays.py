@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+
+from .color import colors_to_array
+from .results import ColorResponse, SearchResult
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+RESULT_FORMATS = ('json', 'objects', 'numpy', 'pandas')
+
+# Result formats accepted by the search and compare methods
+SEARCH_RESULT_FORMATS = ('json', 'objects', 'numpy', 'pandas', 'arrow')
+
+# Numeric fields of each kind of color result and their numpy types
+EXTRACT_COLOR_FIELDS = (('rank', 'i4'), ('weight', 'f8'))
+COUNT_COLOR_FIELDS = (('num_images_partial_area', 'f8'), ('num_images_full_area', 'f8'))
+
+# Text fields present on every color result
+COLOR_TEXT_FIELDS = ('name', 'class')
+
+# Fields of each kind of match and their numpy types, 'O' for strings
+MATCH_FIELDS = (
+    ('filepath', 'O'), ('score', 'f4'), ('overlay', 'O'), ('match_percent', 'f4'),
+    ('query_overlap_percent', 'f4'), ('target_overlap_percent', 'f4'))
+COLOR_MATCH_FIELDS = (('filepath', 'O'), ('score', 'f4'))
+
+
+def check_result_format(result_format, formats=RESULT_FORMATS):
+    """
+    Raise ValueError if `result_format` is not in `formats`, or ImportError
+    if it needs a missing module.
+    """
+    if result_format not in formats:
+        raise ValueError('result_format must be one of %s' % ', '.join(formats))
+    if result_format == 'numpy' and numpy is None:
+        raise ImportError("result_format='numpy' requires numpy")
+    if result_format == 'pandas' and pandas is None:
+        raise ImportError("result_format='pandas' requires pandas")
+    if result_format == 'arrow' and pyarrow is None:
+        raise ImportError("result_format='arrow' requires pyarrow")
+
+
+def _color_columns(result, fields):
+    """ Split a list of color result dictionaries into one array per field. """
+    columns = [('color', colors_to_array([item['color'] for item in result]))]
+    for name, dtype in fields:
+        # Missing values become NaN for floats, the engine may send numbers as strings
+        missing = -1 if numpy.dtype(dtype).kind == 'i' else numpy.nan
+        columns.append((name, numpy.array([item.get(name, missing) for item in result], dtype=dtype)))
+    for name in COLOR_TEXT_FIELDS:
+        columns.append((name, numpy.array([item.get(name, '') for item in result], dtype=object)))
+    return columns
+
+
+def color_result_array(result, fields):
+    """
+    Convert the `result` list of a color extraction or counting response to a
+    numpy structured array.
+
+    Arguments:
+
+    - `result`, the list of color dictionaries from the response.
+    - `fields`, the numeric fields to convert, `EXTRACT_COLOR_FIELDS` or
+      `COUNT_COLOR_FIELDS`.
+
+    Returned:
+
+    - a structured array with a uint8 `color` field of shape (3,), one field
+      per numeric field and object `name` and `class` fields.
+    """
+    columns = _color_columns(result, fields)
+    dtype = [('color', 'u1', (3,))]
+    dtype += [(name, column.dtype) for name, column in columns[1:]]
+    array = numpy.empty(len(result), dtype=dtype)
+    for name, column in columns:
+        array[name] = column
+    return array
+
+
+def color_result_dataframe(result, fields):
+    """
+    Convert the `result` list of a color extraction or counting response to a
+    pandas DataFrame with uint8 `red`, `green` and `blue` columns followed by
+    the numeric fields and the `name` and `class` columns.
+    """
+    columns = _color_columns(result, fields)
+    colors = columns[0][1]
+    data = [('red', colors[:, 0]), ('green', colors[:, 1]), ('blue', colors[:, 2])]
+    return pandas.DataFrame(dict(data + columns[1:]), columns=[name for name, _ in data + columns[1:]])
+
+
+def format_color_response(response, result_format, fields):
+    """
+    Replace the `result` of a color response with an array or DataFrame, or
+    wrap the response, as requested.
+    """
+    if result_format == 'objects':
+        return ColorResponse(response)
+    if result_format == 'json' or response.get('status') == 'fail':
+        return response
+
+    result = response.get('result') or []
+    if result_format == 'numpy':
+        response['result'] = color_result_array(result, fields)
+    else:
+        response['result'] = color_result_dataframe(result, fields)
+    return response
+
+
+def _match_columns(result, fields):
+    """ Split a list of match dictionaries into one array per field, plus `metadata` if it was returned. """
+    columns = []
+    for name, dtype in fields:
+        if dtype == 'O':
+            column = numpy.empty(len(result), dtype=object)
+            column[:] = [item.get(name, '') for item in result]
+        else:
+            column = numpy.array([item.get(name, numpy.nan) for item in result], dtype=dtype)
+        columns.append((name, column))
+    if any('metadata' in item for item in result):
+        column = numpy.empty(len(result), dtype=object)
+        column[:] = [item.get('metadata') for item in result]
+        columns.append(('metadata', column))
+    return columns
+
+
+def match_result_array(result, fields=MATCH_FIELDS):
+    """
+    Convert the `result` list of a search or compare response to a numpy
+    structured array.
+
+    Arguments:
+
+    - `result`, the list of match dictionaries from the response.
+    - `fields`, the fields to convert, `MATCH_FIELDS` or `COLOR_MATCH_FIELDS`.
+
+    Returned:
+
+    - a structured array with object `filepath` and `overlay` fields, float32
+      `score` and percentage fields, and an object `metadata` field when
+      metadata was returned.
+    """
+    columns = _match_columns(result, fields)
+    array = numpy.empty(len(result), dtype=[(name, column.dtype) for name, column in columns])
+    for name, column in columns:
+        array[name] = column
+    return array
+
+
+def match_result_dataframe(result, fields=MATCH_FIELDS):
+    """ Convert the `result` list of a search or compare response to a pandas DataFrame. """
+    columns = _match_columns(result, fields)
+    return pandas.DataFrame(dict(columns), columns=[name for name, _ in columns])
+
+
+def match_result_table(result, fields=MATCH_FIELDS):
+    """
+    Convert the `result` list of a search or compare response to a pyarrow
+    Table, with string, float32 and, when metadata was returned, a
+    `metadata` column holding each match's metadata as a JSON string so
+    that tables from different calls share one schema.
+    """
+    arrays = []
+    names = []
+    for name, column in _match_columns(result, fields):
+        if name == 'metadata':
+            column = [json.dumps(value) if value is not None else None for value in column]
+            arrays.append(pyarrow.array(column, type=pyarrow.string()))
+        elif column.dtype == object:
+            arrays.append(pyarrow.array(column, type=pyarrow.string()))
+        else:
+            arrays.append(pyarrow.array(column, type=pyarrow.float32()))
+        names.append(name)
+    return pyarrow.Table.from_arrays(arrays, names=names)
+
+
+def format_search_response(response, result_format, fields=MATCH_FIELDS, response_class=SearchResult):
+    """
+    Wrap a search or compare response in `response_class`, or replace its
+    `result` with an array, DataFrame or Table, as requested.
+    """
+    if result_format == 'objects':
+        return response_class(response)
+    if result_format == 'json' or response.get('status') == 'fail':
+        return response
+
+    result = response.get('result') or []
+    if result_format == 'numpy':
+        response['result'] = match_result_array(result, fields)
+    elif result_format == 'pandas':
+        response['result'] = match_result_dataframe(result, fields)
+    else:
+        response['result'] = match_result_table(result, fields)
+    return response
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .exception import TinEyeServiceDeadlineExceeded
+from .parallel import DeadlineIterator
+
+
+class UnionFind(object):
+    """
+    Disjoint set of hashable items with path compression and union by size.
+
+        >>> from tineyeservices.cluster import UnionFind
+        >>> groups = UnionFind()
+        >>> groups.union('a.jpg', 'b.jpg')
+        >>> groups.find('b.jpg') == groups.find('a.jpg')
+        True
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def __contains__(self, item):
+        return item in self.parent
+
+    def add(self, item):
+        """ Add `item` as its own group if it is not already present. """
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        """ Return the representative item of the group containing `item`. """
+        self.add(item)
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, item_1, item_2):
+        """ Merge the groups containing `item_1` and `item_2`. """
+        root_1 = self.find(item_1)
+        root_2 = self.find(item_2)
+        if root_1 == root_2:
+            return
+        if self.size[root_1] < self.size[root_2]:
+            root_1, root_2 = root_2, root_1
+        self.parent[root_2] = root_1
+        self.size[root_1] += self.size[root_2]
+
+    def group_size(self, item):
+        """ Return the number of items in the group containing `item`. """
+        return self.size[self.find(item)]
+
+    def groups(self, min_size=1):
+        """ Return a list of groups with at least `min_size` items, each a list of items. """
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+        return [group for group in groups.values() if len(group) >= min_size]
+
+
+class DuplicateClusterJob(object):
+    """
+    Group the images of a MatchEngine collection into clusters of near-duplicates.
+
+    Every image in the collection is searched by filepath and each match scoring
+    at least `min_score` joins the query's cluster.
+
+        >>> from tineyeservices import MatchEngineRequest, DuplicateClusterJob
+        >>> api = MatchEngineRequest(api_url='http://localhost/rest/')
+        >>> job = DuplicateClusterJob(api, min_score=80, skip_clustered=True)
+        >>> job.run(output_path='clusters.jsonl')
+        [['banana.jpg', 'banana_flip.jpg']]
+
+    Arguments:
+
+    - `request`, a MatchEngineRequest (or subclass) for the collection.
+    - `min_score`, minimum score for two images to be considered duplicates.
+    - `check_horizontal_flip`, whether to incorporate a horizontal flip check.
+    - `limit`, maximum number of matches fetched per search.
+    - `skip_clustered`, if true, images that already joined a cluster through
+      an earlier search are not searched themselves. This saves a search per
+      duplicate but can miss links between clusters.
+    - `max_workers`, maximum number of searches in flight at once.
+    - `page_size`, number of filepaths fetched per list call.
+
+    With a deadline on `request`, no search starts once it has passed and
+    `run` returns the clusters found so far, with `deadline_exceeded` set.
+    """
+
+    def __init__(
+            self, request, min_score=80, check_horizontal_flip=False, limit=100,
+            skip_clustered=False, max_workers=8, page_size=1000):
+        self.request = request
+        self.min_score = min_score
+        self.check_horizontal_flip = check_horizontal_flip
+        self.limit = limit
+        self.skip_clustered = skip_clustered
+        self.max_workers = max_workers
+        self.page_size = page_size
+        self.reset()
+
+    def __repr__(self):
+        return "DuplicateClusterJob(request=%r, min_score=%r, skip_clustered=%r)" %\
+               (self.request, self.min_score, self.skip_clustered)
+
+    def reset(self):
+        """ Forget the clusters and counters of an earlier run. """
+        self.clusters = UnionFind()
+        self.searched = 0
+        self.skipped = 0
+        self.deadline_exceeded = False
+
+    def _search(self, filepath, **kwargs):
+        response = self.request.search_filepath(
+            filepath, min_score=self.min_score, limit=self.limit,
+            check_horizontal_flip=self.check_horizontal_flip, **kwargs)
+        return filepath, response
+
+    def _merge_future(self, future):
+        try:
+            filepath, response = future.result()
+        except TinEyeServiceDeadlineExceeded:
+            self.deadline_exceeded = True
+            return
+        self._merge(filepath, response)
+
+    def _merge(self, filepath, response):
+        for match in response.get('result', []):
+            if float(match['score']) >= self.min_score:
+                self.clusters.union(filepath, match['filepath'])
+
+    def run(self, output_path=None, **kwargs):
+        """
+        Search every image in the collection and build the clusters.
+
+        Results are merged as each search completes, so with `skip_clustered`
+        set later images that already matched are not searched. Each run
+        starts from no clusters.
+
+        Arguments:
+
+        - `output_path`, if given, the clusters are written to this file as
+          JSON lines, one list of filepaths per line.
+
+        Returned:
+
+        - a list of clusters with at least two images, each a list of filepaths.
+          Only the searches done by the deadline, if any, are merged.
+        """
+        self.reset()
+        deadline = self.request.deadline
+        filepaths = DeadlineIterator(self.request.iter_list(page_size=self.page_size, **kwargs), deadline)
+        pending = set()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            for filepath in filepaths:
+                # Only keep as many searches in flight as there are workers, and
+                # merge finished ones first so skipping sees the latest matches
+                if len(pending) >= self.max_workers:
+                    done, pending = wait(pending, timeout=_remaining(deadline), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._merge_future(future)
+                    if deadline is not None and deadline.expired:
+                        filepaths.cut_short = True
+                        break
+
+                if self.skip_clustered and filepath in self.clusters \
+                        and self.clusters.group_size(filepath) > 1:
+                    self.skipped += 1
+                    continue
+                self.clusters.add(filepath)
+
+                pending.add(executor.submit(self._search, filepath, **kwargs))
+                self.searched += 1
+
+            done, pending = wait(pending, timeout=_remaining(deadline))
+            for future in done:
+                self._merge_future(future)
+        finally:
+            # Searches still running at the deadline are not waited for
+            executor.shutdown(wait=False, cancel_futures=True)
+        if filepaths.cut_short or pending:
+            self.deadline_exceeded = True
+
+        clusters = [sorted(cluster) for cluster in self.clusters.groups(min_size=2)]
+        if output_path is not None:
+            self.write(clusters, output_path)
+        return clusters
+
+    def write(self, clusters, output_path):
+        """ Write `clusters` to `output_path` as JSON lines. """
+        with open(output_path, 'w') as fp:
+            for cluster in clusters:
+                fp.write(json.dumps(cluster) + '\n')
+
+
+def _remaining(deadline):
+    return deadline.remaining() if deadline is not None else None
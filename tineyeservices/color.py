@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import functools
+import numbers
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_HEX_RE = re.compile(r'^#?([0-9a-fA-F]{6})$')
+_RGB_RE = re.compile(r'^\s*(\d{1,3})\s*,\s*(\d{1,3})\s*,\s*(\d{1,3})\s*$')
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_string(color):
+    """
+    Parse a single RGB ('255,112,223') or hex ('DF4F23') color string into
+    its normalized form and RGB channel values.
+    """
+    match = _HEX_RE.match(color.strip())
+    if match is not None:
+        hex_color = match.group(1).lower()
+        return hex_color, tuple(bytearray.fromhex(hex_color))
+
+    match = _RGB_RE.match(color)
+    if match is not None:
+        rgb = tuple(int(channel) for channel in match.groups())
+        if max(rgb) <= 255:
+            return '%i,%i,%i' % rgb, rgb
+
+    raise ValueError('Invalid color %r, expected RGB "255,112,223" or hex "DF4F23"' % color)
+
+
+def _check_rgb(color):
+    """ Validate a single sequence of three RGB channel values. """
+    if len(color) != 3:
+        raise ValueError('Invalid color %r, expected three RGB values' % (color,))
+    for channel in color:
+        if not isinstance(channel, numbers.Integral) or _is_bool(channel) or not 0 <= channel <= 255:
+            raise ValueError('Invalid color %r, RGB values must be integers from 0 to 255' % (color,))
+    return tuple(int(channel) for channel in color)
+
+
+def _is_bool(value):
+    """ Return True for Python and numpy booleans, which are not RGB values. """
+    return isinstance(value, bool) or (numpy is not None and isinstance(value, numpy.bool_))
+
+
+def _check_array(colors):
+    """ Validate an (N, 3) numpy array of RGB values and return it as uint8. """
+    if colors.ndim != 2 or colors.shape[1] != 3:
+        raise ValueError('Color arrays must have shape (N, 3), got %r' % (colors.shape,))
+    if colors.dtype.kind == 'f':
+        if not numpy.all(numpy.mod(colors, 1) == 0):
+            raise ValueError('Color arrays must contain whole RGB values')
+    elif colors.dtype.kind not in 'iu':
+        raise ValueError('Color arrays must hold integers, got dtype %s' % colors.dtype)
+    if colors.size and (colors.min() < 0 or colors.max() > 255):
+        raise ValueError('Color arrays must contain RGB values from 0 to 255')
+    return colors.astype(numpy.uint8)
+
+
+def _format_array(colors):
+    """ Format a uint8 (N, 3) array as RGB strings without a Python level loop. """
+    channels = [numpy.char.mod('%i', colors[:, i]) for i in range(3)]
+    return numpy.char.add(
+        numpy.char.add(numpy.char.add(channels[0], ','), numpy.char.add(channels[1], ',')),
+        channels[2]).tolist()
+
+
+def normalize_color(color):
+    """
+    Validate and normalize a single color.
+
+    Hex strings are lowercased and stripped of any leading '#', while RGB
+    strings and sequences become 'R,G,B' strings without spaces. The engine
+    echoes colors back in the format they were sent, so the format is kept.
+
+        >>> from tineyeservices.color import normalize_color
+        >>> normalize_color('255, 112, 223')
+        '255,112,223'
+        >>> normalize_color('#DF4F23')
+        'df4f23'
+        >>> normalize_color((223, 79, 35))
+        '223,79,35'
+
+    Arguments:
+
+    - `color`, an RGB string ('255,112,223'), hex string ('DF4F23' or '#DF4F23')
+      or a tuple or list of three integers.
+
+    Raises ValueError if the color is malformed and TypeError if it is
+    neither a string nor a sequence.
+    """
+    if isinstance(color, str):
+        return _parse_string(color)[0]
+    if isinstance(color, (tuple, list)):
+        return '%i,%i,%i' % _check_rgb(color)
+    if numpy is not None and isinstance(color, numpy.ndarray):
+        return _format_array(_check_array(color.reshape(1, -1)))[0]
+    raise TypeError('Need to pass a color string or a sequence of RGB values')
+
+
+def normalize_colors(colors):
+    """
+    Validate and normalize a list of colors, see `normalize_color`.
+
+    Strings are parsed once and cached, and numpy arrays are validated and
+    formatted without a Python level loop, so building large color queries
+    is cheap.
+
+        >>> from tineyeservices.color import normalize_colors
+        >>> normalize_colors(['255, 255, 235', '12FA3B', (0, 0, 0)])
+        ['255,255,235', '12fa3b', '0,0,0']
+
+    Arguments:
+
+    - `colors`, a list of colors as accepted by `normalize_color`, or a numpy
+      array of shape (N, 3) holding RGB values.
+
+    Raises ValueError if any color is malformed.
+    """
+    if numpy is not None and isinstance(colors, numpy.ndarray):
+        if colors.dtype.kind in 'US':
+            return [normalize_color(str(color)) for color in colors.tolist()]
+        return _format_array(_check_array(colors))
+
+    if not isinstance(colors, (list, tuple)):
+        raise TypeError('Need to pass a list of colors')
+
+    return [normalize_color(color) for color in colors]
+
+
+def normalize_weights(weights, colors=None):
+    """
+    Validate a list of color weights and return them as strings.
+
+    Arguments:
+
+    - `weights`, a list of numbers or numeric strings, or a numpy array.
+    - `colors`, the normalized colors the weights apply to. If given and
+      weights were passed, there must be at least one weight per color.
+
+    Raises ValueError if a weight is not a non-negative number.
+    """
+    if numpy is not None and isinstance(weights, numpy.ndarray):
+        weights = weights.tolist()
+
+    if not isinstance(weights, (list, tuple)):
+        raise TypeError('Need to pass a list of weights')
+
+    normalized = []
+    for weight in weights:
+        try:
+            value = float(weight)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid weight %r, expected a number' % (weight,))
+        if not value >= 0:
+            raise ValueError('Invalid weight %r, weights must not be negative' % (weight,))
+        normalized.append(weight.strip() if isinstance(weight, str) else str(weight))
+
+    if colors is not None and normalized and len(normalized) < len(colors):
+        raise ValueError('Please specify the same number of weights as colors.')
+
+    return normalized
+
+
+def colors_to_array(colors):
+    """
+    Convert colors to a numpy uint8 array of shape (N, 3). Requires numpy.
+
+    Arguments:
+
+    - `colors`, a list of colors as accepted by `normalize_color`, or a numpy
+      array of shape (N, 3) holding RGB values.
+    """
+    if numpy is None:
+        raise ImportError('colors_to_array requires numpy')
+
+    if isinstance(colors, numpy.ndarray) and colors.dtype.kind not in 'US':
+        return _check_array(colors)
+
+    if isinstance(colors, numpy.ndarray):
+        colors = colors.tolist()
+
+    if not isinstance(colors, (list, tuple)):
+        raise TypeError('Need to pass a list of colors')
+
+    rgb = []
+    for color in colors:
+        if isinstance(color, str):
+            rgb.append(_parse_string(color)[1])
+        elif isinstance(color, (tuple, list)):
+            rgb.append(_check_rgb(color))
+        else:
+            raise TypeError('Need to pass a color string or a sequence of RGB values')
+    return numpy.array(rgb, dtype=numpy.uint8).reshape(-1, 3)
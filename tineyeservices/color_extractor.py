@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+
+from .image import Image
+from .parallel import imap_unordered
+from .store import SQLiteStore
+
+
+class ColorStore(SQLiteStore):
+    """
+    SQLite backed store of extracted palettes keyed by image content, so
+    unchanged images are not sent for extraction again.
+
+    Arguments:
+
+    - `path`, the database file, created if missing. Use ':memory:' for a
+      store that only lives as long as the object.
+    """
+
+    table = 'palettes'
+
+
+class BulkColorExtractor(object):
+    """
+    Extract the palette of every image in a large set, running the
+    extractions concurrently and yielding each palette as soon as it is ready.
+
+    The engine merges all the images of an `extract_image_colors` call into a
+    single palette, so each image is extracted in its own request; the number
+    and total bytes of uploads in flight are bounded instead.
+
+        >>> from tineyeservices import MulticolorEngineRequest, BulkColorExtractor, Image
+        >>> from tineyeservices.color_extractor import ColorStore
+        >>> api = MulticolorEngineRequest(api_url='http://localhost/rest/')
+        >>> extractor = BulkColorExtractor(api, store=ColorStore('palettes.db'), limit=10)
+        >>> for image, response, error in extractor.extract(images):
+        ...     print(image.collection_filepath, response['result'])
+
+    Arguments:
+
+    - `request`, a MulticolorEngineRequest.
+    - `store`, an optional ColorStore. Palettes found in it are returned
+      without a request and new palettes are added to it.
+    - `max_workers`, maximum number of requests in flight at once.
+    - `max_pending`, maximum number of images read ahead of the requests,
+      defaults to twice `max_workers`.
+    - `max_bytes`, maximum total image bytes queued or uploading at once.
+    - `ignore_background`, `ignore_interior_background`, `limit` and
+      `color_format`, passed to the extraction calls.
+    """
+
+    def __init__(
+            self, request, store=None, max_workers=8, max_pending=None,
+            max_bytes=64 * 1024 * 1024, ignore_background=True,
+            ignore_interior_background=True, limit=32, color_format='rgb'):
+        self.request = request
+        self.store = store
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.options = {
+            'ignore_background': ignore_background,
+            'ignore_interior_background': ignore_interior_background,
+            'limit': limit,
+            'color_format': color_format}
+
+    def __repr__(self):
+        return "BulkColorExtractor(request=%r, store=%r, max_workers=%r)" %\
+               (self.request, self.store, self.max_workers)
+
+    def key(self, item):
+        """ Return the store key of an Image or URL string under the current options. """
+        if isinstance(item, Image) and item.data is not None:
+            source = 'sha1:%s' % item.digest
+        else:
+            source = 'url:%s' % (item.url if isinstance(item, Image) else item)
+        return json.dumps([source, self.options], sort_keys=True)
+
+    def _extract(self, item, **kwargs):
+        key = None
+        if self.store is not None:
+            key = self.key(item)
+            response = self.store.get(key)
+            if response is not None:
+                return response
+
+        if isinstance(item, Image) and item.data is not None:
+            response = self.request.extract_image_colors_image([item], **dict(self.options, **kwargs))
+        else:
+            url = item.url if isinstance(item, Image) else item
+            response = self.request.extract_image_colors_url([url], **dict(self.options, **kwargs))
+
+        if key is not None and response.get('status') == 'ok':
+            self.store.put(key, response)
+        return response
+
+    def extract(self, images, **kwargs):
+        """
+        Extract the palettes of `images`, yielding results in completion order.
+
+        Arguments:
+
+        - `images`, an iterable of Image objects or URL strings, consumed lazily.
+
+        Returned:
+
+        - a generator of `(image, response, error)` tuples, where `response` is
+          the `extract_image_colors_*` response for that image alone and
+          `error` is the exception raised by the request, if any.
+        """
+        def cost(item):
+            if isinstance(item, Image) and item.data is not None:
+                return len(item.data)
+            return 0
+
+        return imap_unordered(
+            lambda item: self._extract(item, **kwargs), images,
+            max_workers=self.max_workers, max_pending=self.max_pending,
+            cost=cost, max_cost=self.max_bytes)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import gzip
+import threading
+import zlib
+
+from requests.compat import urlencode
+from urllib3.util.request import ACCEPT_ENCODING
+
+# Request body encodings and their compressors
+_ENCODERS = {
+    'gzip': lambda data, level: gzip.compress(data, level),
+    'deflate': lambda data, level: zlib.compress(data, level)}
+
+
+class Compression(object):
+    """
+    Compression settings of a request object, with counters of the bytes
+    saved. Attach it by setting the request's `compression` attribute.
+
+    Responses are compressed by the server when the request offers an
+    encoding it supports: gzip and deflate always, plus brotli and zstd when
+    the brotli and zstandard packages are installed. Request bodies can also
+    be compressed for the methods listed in `compress_requests`; those calls
+    are then sent as a POST with a compressed form body, so the server must
+    accept `Content-Encoding` on requests.
+
+        >>> from tineyeservices import MulticolorEngineRequest, Compression
+        >>> api = MulticolorEngineRequest(api_url='http://localhost/rest/')
+        >>> api.compression = Compression(compress_requests=['update_metadata', 'add'])
+        >>> api.get_metadata(filepaths)
+        >>> api.compression.saved()
+        {'response_bytes_saved': 812034, 'request_bytes_saved': 0}
+
+    Arguments:
+
+    - `compress_responses`, True to ask for compressed responses to every
+      method, False for none, or a list of method names.
+    - `compress_requests`, a list of method names whose request bodies are
+      compressed. Calls uploading images are never compressed.
+    - `request_encoding`, 'gzip' or 'deflate'.
+    - `min_size`, request bodies smaller than this are sent uncompressed.
+    - `level`, compression level from 1 (fastest) to 9 (smallest).
+    """
+
+    def __init__(
+            self, compress_responses=True, compress_requests=(), request_encoding='gzip',
+            min_size=1024, level=6):
+        if request_encoding not in _ENCODERS:
+            raise ValueError('Unknown request encoding %r, expected one of: %s' %
+                             (request_encoding, ', '.join(sorted(_ENCODERS))))
+        self.compress_responses = compress_responses
+        self.compress_requests = set(compress_requests)
+        self.request_encoding = request_encoding
+        self.min_size = min_size
+        self.level = level
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def __repr__(self):
+        return "Compression(compress_responses=%r, compress_requests=%r)" %\
+               (self.compress_responses, sorted(self.compress_requests))
+
+    def accept_encoding(self, method):
+        """ Return the Accept-Encoding header value to send for `method`. """
+        if self.compress_responses is True or \
+                (self.compress_responses and method in self.compress_responses):
+            return ACCEPT_ENCODING
+        return 'identity'
+
+    def encode_params(self, method, params):
+        """
+        Return a compressed form body for the parameters of a `method` call
+        and its headers, or None if the call should be sent as is.
+        """
+        if method not in self.compress_requests:
+            return None
+        body = urlencode(sorted(params.items())).encode('utf-8')
+        if len(body) < self.min_size:
+            return None
+        compressed = _ENCODERS[self.request_encoding](body, self.level)
+        self.record(method, request_bytes=len(body), request_wire_bytes=len(compressed))
+        headers = {'Content-Type': 'application/x-www-form-urlencoded',
+                   'Content-Encoding': self.request_encoding}
+        return compressed, headers
+
+    def record_response(self, method, response):
+        """ Count the bytes received for a response, before and after decoding. """
+        size = len(response.content)
+        try:
+            wire_size = response.raw.tell()
+        except (AttributeError, ValueError):
+            wire_size = size
+        self.record(method, requests=1, response_bytes=size, response_wire_bytes=wire_size or size)
+
+    def record(self, method, **counts):
+        with self.lock:
+            stats = self.stats.setdefault(method, {
+                'requests': 0, 'response_bytes': 0, 'response_wire_bytes': 0,
+                'request_bytes': 0, 'request_wire_bytes': 0})
+            for name, count in counts.items():
+                stats[name] += count
+
+    def saved(self, method=None):
+        """ Return the number of response and request bytes saved, for one method or all. """
+        with self.lock:
+            stats = [self.stats.get(method)] if method is not None else list(self.stats.values())
+            stats = [s for s in stats if s]
+            return {
+                'response_bytes_saved': sum(s['response_bytes'] - s['response_wire_bytes'] for s in stats),
+                'request_bytes_saved': sum(s['request_bytes'] - s['request_wire_bytes'] for s in stats)}
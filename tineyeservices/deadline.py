@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import time
+
+from .exception import TinEyeServiceDeadlineExceeded
+
+
+class Deadline(object):
+    """
+    A time budget shared by every HTTP call of a logical operation, such as
+    a bulk add, a paged listing or a scatter-gather of searches.
+
+    Attach it to a request with `with_deadline`. Each call made through that
+    request then gets a connect timeout and a read timeout bounded by the
+    time left, and calls made once the budget is spent fail at once with
+    TinEyeServiceDeadlineExceeded instead of reaching the engine. Helpers
+    making many calls at once return partial results at the deadline, as
+    described by each helper.
+
+    The read timeout bounds the wait for each read from the socket, not the
+    whole response, so a single call whose response keeps trickling in can
+    end after the deadline. The helpers making many calls at once do not
+    wait for such calls.
+
+        >>> from tineyeservices import MatchEngineRequest, Deadline
+        >>> api = MatchEngineRequest(api_url='http://localhost/rest/')
+        >>> scores = api.with_deadline(Deadline(30, connect_timeout=2)).compare_matrix(images)
+
+    Arguments:
+
+    - `budget`, number of seconds from now until the deadline.
+    - `connect_timeout`, maximum number of seconds to wait for a connection
+      to the engine, or None to allow all the time left.
+    """
+
+    def __init__(self, budget, connect_timeout=None):
+        self.budget = budget
+        self.connect_timeout = connect_timeout
+        self.expires = time.monotonic() + budget
+
+    def __repr__(self):
+        return "Deadline(budget=%r, remaining=%.3f)" % (self.budget, self.remaining())
+
+    def remaining(self):
+        """ Return the number of seconds left, 0 once the deadline has passed. """
+        return max(self.expires - time.monotonic(), 0)
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self):
+        """ Raise TinEyeServiceDeadlineExceeded if the deadline has passed. """
+        if self.expired:
+            raise TinEyeServiceDeadlineExceeded('Deadline of %ss exceeded' % self.budget)
+
+    def timeout(self, timeout=None):
+        """
+        Return the `(connect, read)` timeout to pass to requests for the
+        next call: the read timeout is the time left, or `timeout` if it is
+        shorter, and the connect timeout is also bounded by `connect_timeout`.
+
+        `timeout` may also be a `(connect, read)` tuple as taken by requests,
+        each bounded by the time left, with None for no limit.
+
+        Raises TinEyeServiceDeadlineExceeded if no time is left.
+        """
+        self.check()
+        remaining = self.remaining()
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        read = remaining if read is None else min(float(read), remaining)
+        connect = remaining if connect is None else min(float(connect), remaining)
+        if self.connect_timeout is not None:
+            connect = min(self.connect_timeout, connect)
+        return connect, read
+
+
+def deadline_response(method):
+    """ The response standing in for a call cancelled or cut short by a deadline. """
+    return {'status': 'fail', 'error': ['Deadline exceeded'], 'method': method, 'result': [],
+            'deadline_exceeded': True}
@@ -13,3 +13,8 @@ class TinEyeServiceError(TinEyeServiceException):
 
 class TinEyeServiceWarning(TinEyeServiceException):
     pass
+
+
+class TinEyeServiceDeadlineExceeded(TinEyeServiceException):
+    """ Raised when a call is made, or cut short, after its request's deadline expired. """
+    pass
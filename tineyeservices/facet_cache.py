@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import collections
+import copy
+import json
+import threading
+import time
+
+
+def _normalize_param(name, value):
+    """ Normalize metadata query parameters so equivalent JSON gives the same key. """
+    if (name == 'metadata' or name.startswith('count_metadata[')) and isinstance(value, str):
+        try:
+            return json.dumps(json.loads(value), separators=(',', ':'), sort_keys=True)
+        except ValueError:
+            return value
+    return value if isinstance(value, (str, int, float, bool)) or value is None else repr(value)
+
+
+class FacetCache(object):
+    """
+    Cache of count responses for faceted browsing, attached to a
+    MulticolorEngineRequest with `facet_cache=`.
+
+    Responses of the `count_metadata_*` and `count_collection_colors_*`
+    calls are cached on their normalized filter and count list, expire after
+    `ttl` seconds, and the whole cache is cleared whenever the attached
+    request adds, updates or deletes images. Writes made by other clients
+    are only seen once cached responses expire.
+
+        >>> from tineyeservices import MulticolorEngineRequest, FacetCache
+        >>> cache = FacetCache(ttl=60)
+        >>> api = MulticolorEngineRequest(api_url='http://localhost/rest/', facet_cache=cache)
+        >>> api.count_metadata_metadata('{"keywords": "whale"}', ['{"color": "red"}'])
+        >>> cache.stats
+        {'hits': 0, 'misses': 1}
+
+    Arguments:
+
+    - `ttl`, number of seconds a response stays valid.
+    - `max_entries`, maximum number of responses kept, least recently used
+      responses are dropped first.
+    """
+
+    def __init__(self, ttl=60, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.generation = 0
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def __repr__(self):
+        return "FacetCache(ttl=%r, max_entries=%r)" % (self.ttl, self.max_entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, method, params, kwargs):
+        """ Return the cache key of an API call. """
+        items = [(name, _normalize_param(name, value)) for name, value in params.items()]
+        items += [(name, _normalize_param(name, value)) for name, value in kwargs.items()]
+        return method, tuple(sorted(items))
+
+    def get(self, key):
+        """ Return a copy of the cached response for `key`, or None if it is missing or expired. """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self.entries[key]
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return copy.deepcopy(entry[1])
+
+    def put(self, key, response, generation=None):
+        """
+        Cache a copy of `response` for `key`. Pass the `generation` read before
+        making the request so a response racing with a write is not cached.
+        """
+        response = copy.deepcopy(response)
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (time.time(), response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self):
+        """ Drop every cached response, called after any write to the collection. """
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
@@ -2,7 +2,53 @@
 # Copyright (c) 2018 TinEye. All rights reserved worldwide.
 
 import contextlib
+import hashlib
+import io
 import os
+import struct
+import zlib
+
+from .image_header import sniff_header
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# PNG color types by number of channels
+_PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+
+def encode_png(array, compression=1):
+    """
+    Encode a uint8 numpy array of shape (height, width) or
+    (height, width, channels), with 1 to 4 channels, as PNG bytes.
+    Requires numpy.
+    """
+    if numpy is None:
+        raise ImportError('Encoding arrays requires numpy')
+
+    array = numpy.asarray(array)
+    if array.dtype != numpy.uint8:
+        raise ValueError('Need a uint8 array to encode, got %s' % array.dtype)
+    if array.ndim == 2:
+        array = array[:, :, numpy.newaxis]
+    if array.ndim != 3 or array.shape[2] not in _PNG_COLOR_TYPES:
+        raise ValueError('Need an array of shape (height, width) or (height, width, 1-4)')
+
+    height, width, channels = array.shape
+    # Each row starts with a filter type byte, 0 for none
+    rows = numpy.zeros((height, width * channels + 1), dtype=numpy.uint8)
+    rows[:, 1:] = array.reshape(height, width * channels)
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, _PNG_COLOR_TYPES[channels], 0, 0, 0)
+    return b''.join([b'\x89PNG\r\n\x1a\n', chunk(b'IHDR', header),
+                     chunk(b'IDAT', zlib.compress(rows.tobytes(), compression)),
+                     chunk(b'IEND', b'')])
 
 
 class Image(object):
@@ -24,24 +70,44 @@ class Image(object):
         >>> metadata = json.dumps({"keywords": ["dolphin"]})
         >>> image = Image(filepath='/path/to/image.jpg', metadata=metadata)
 
+    Image on filesystem, read only when its data is first used:
+
+        >>> image = Image(filepath='/path/to/image.jpg', lazy=True)
+
+    Image already in memory, from bytes, a bytearray or memoryview, an open
+    file, or a numpy array encoded as PNG when its data is first used:
+
+        >>> image = Image.from_bytes(response.content, collection_filepath='download.jpg')
+        >>> image = Image.from_file(open('/path/to/image.jpg', 'rb'))
+        >>> image = Image.from_array(pixels, collection_filepath='generated.png')
+
+    The SHA-1 digest of the image bytes is computed once, on first use:
+
+        >>> image.digest
+        'e3c6a8bd2d3c43bd0a3c5f6e0d2a3d3e1f1c2b4a'
+
     """
 
-    def __init__(self, filepath='', url='', collection_filepath='', metadata=None):
-        self.data = None
+    __slots__ = ('_data', '_array', '_digest', 'filepath', 'url', 'collection_filepath', 'metadata')
+
+    def __init__(self, filepath='', url='', collection_filepath='', metadata=None, lazy=False):
+        self._data = None
+        self._array = None
+        self._digest = None
         self.filepath = filepath
         self.url = url
         self.collection_filepath = ''
 
         # If a filepath is specified, read the image and use that as the collection filepath
         if filepath != '':
-            with contextlib.closing(open(filepath, 'rb')) as fp:
-                self.data = fp.read()
+            if not lazy:
+                self._read()
             self.collection_filepath = filepath
 
         # If no filepath but a URL is specified, use the basename of the URL
         # as the collection filepath
         self.url = url
-        if self.data is None and self.url != '':
+        if self.filepath == '' and self.url != '':
             self.collection_filepath = os.path.basename(self.url)
 
         # If user specified their own filepath, then use that instead
@@ -49,7 +115,7 @@ class Image(object):
             self.collection_filepath = collection_filepath
 
         # Need to make sure there is at least data or a URL
-        if self.data is None and self.url == '':
+        if self.filepath == '' and self.url == '':
             raise ValueError('Image object needs either data or a URL.')
 
         self.metadata = metadata
@@ -57,3 +123,203 @@ class Image(object):
     def __repr__(self):
         return "Image(filepath=%r, url=%r, collection_filepath=%r, metadata=%r)" %\
                (self.filepath, self.url, self.collection_filepath, self.metadata)
+
+    @classmethod
+    def _in_memory(cls, data, array, collection_filepath, metadata):
+        image = cls.__new__(cls)
+        image._data = data
+        image._array = array
+        image._digest = None
+        image.filepath = ''
+        image.url = ''
+        image.collection_filepath = collection_filepath
+        image.metadata = metadata
+        return image
+
+    @classmethod
+    def from_bytes(cls, data, collection_filepath='', metadata=None):
+        """
+        Make an Image from encoded image bytes already in memory: bytes, a
+        bytearray or a memoryview, which is used as is without a copy.
+
+        Images added to a collection need a `collection_filepath`, as there
+        is no file name to take it from.
+        """
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise TypeError('Need bytes, a bytearray or a memoryview, got %s' % type(data).__name__)
+        return cls._in_memory(data, None, collection_filepath, metadata)
+
+    @classmethod
+    def from_file(cls, fp, collection_filepath='', metadata=None):
+        """
+        Make an Image from a binary file object opened for reading, such as
+        an open file or a BytesIO, read from its current position to the
+        end. The collection filepath defaults to the basename of the file's
+        name, when it has one.
+
+        To share the buffer of a BytesIO rather than copy it, pass
+        `fp.getbuffer()` to `from_bytes`; the BytesIO cannot be resized
+        while the image holds it.
+        """
+        data = fp.read()
+        if collection_filepath == '' and isinstance(getattr(fp, 'name', None), str):
+            collection_filepath = os.path.basename(fp.name)
+        return cls._in_memory(data, None, collection_filepath, metadata)
+
+    @classmethod
+    def from_array(cls, array, collection_filepath='', metadata=None):
+        """
+        Make an Image from a uint8 numpy array of pixels, of shape
+        (height, width) or (height, width, channels). The array is encoded as
+        PNG only when the image data is first used, see `encode_png`.
+        """
+        if numpy is None:
+            raise ImportError('Image.from_array requires numpy')
+        return cls._in_memory(None, numpy.asarray(array), collection_filepath, metadata)
+
+    def check(self):
+        """
+        Check the image from its header alone, without decoding it, so files
+        that are empty, truncated or not images can be dropped before upload.
+
+        For lazy images only the header and the end of the file are read.
+
+        Returned:
+
+        - an ImageInfo with `format`, `width` and `height`, or None for an
+          image given by URL only.
+
+        Raises ValueError if the image is invalid, see
+        `tineyeservices.image_header.sniff_header`.
+        """
+        if self._data is not None or self._array is not None:
+            return sniff_header(io.BytesIO(self.data))
+        if self.filepath == '':
+            return None
+        with contextlib.closing(open(self.filepath, 'rb')) as fp:
+            return sniff_header(fp)
+
+    def _read(self):
+        with contextlib.closing(open(self.filepath, 'rb')) as fp:
+            self._data = fp.read()
+
+    @property
+    def data(self):
+        """
+        The image bytes, read from `filepath` on first use for lazy images
+        and encoded on first use for images made with `from_array`.
+        """
+        if self._data is None:
+            if self._array is not None:
+                self._data = encode_png(self._array)
+                self._array = None
+            elif self.filepath != '':
+                self._read()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._array = None
+        self._digest = None
+
+    @property
+    def digest(self):
+        """ The SHA-1 hex digest of the image bytes, or None for an image given by URL only. """
+        if self._digest is None:
+            data = self.data
+            if data is not None:
+                self._digest = hashlib.sha1(data).hexdigest()
+        return self._digest
+
+
+class ImageBatch(object):
+    """
+    Many images whose bytes are kept in one contiguous buffer, for uploading
+    large batches without one bytes object per image.
+
+    Each Image of the batch holds a memoryview slice of the buffer as its
+    data, so the bytes are not copied again when the batch is uploaded.
+
+        >>> from tineyeservices import MatchEngineRequest, ImageBatch
+        >>> api = MatchEngineRequest(api_url='http://localhost/rest/')
+        >>> batch = ImageBatch.from_files(['/path/to/a.jpg', '/path/to/b.jpg'])
+        >>> api.add_image(batch.images)
+
+    Arguments:
+
+    - `images`, a list of Image objects with data. Their bytes are copied
+      into the buffer and new Image objects sharing it are made; the given
+      images are left unchanged.
+    """
+
+    def __init__(self, images=()):
+        images = list(images)
+        sizes = []
+        for image in images:
+            if image.data is None:
+                raise ValueError('ImageBatch needs images with data')
+            sizes.append(len(image.data))
+        self._allocate(sizes)
+        for i, image in enumerate(images):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            self.buffer[start:end] = image.data
+        self.images = [self._image(i, image.filepath, image.url, image.collection_filepath,
+                                   image.metadata) for i, image in enumerate(images)]
+
+    def __repr__(self):
+        return "ImageBatch(images=%r, nbytes=%r)" % (len(self), self.nbytes)
+
+    def __len__(self):
+        return len(self.images)
+
+    def __iter__(self):
+        return iter(self.images)
+
+    def __getitem__(self, index):
+        return self.images[index]
+
+    @property
+    def nbytes(self):
+        """ Total size of the image bytes. """
+        return self.offsets[-1]
+
+    def _allocate(self, sizes):
+        self.offsets = [0]
+        for size in sizes:
+            self.offsets.append(self.offsets[-1] + size)
+        self.buffer = bytearray(self.offsets[-1])
+        self.view = memoryview(self.buffer)
+
+    def _image(self, index, filepath, url, collection_filepath, metadata):
+        image = Image._in_memory(self.view[self.offsets[index]:self.offsets[index + 1]], None,
+                                 collection_filepath or filepath, metadata)
+        image.filepath = filepath
+        image.url = url
+        return image
+
+    @classmethod
+    def from_files(cls, filepaths, collection_filepaths=None, metadata=None):
+        """
+        Read image files straight into a new batch's buffer.
+
+        Arguments:
+
+        - `filepaths`, a list of paths to image files.
+        - `collection_filepaths`, an optional list of collection filepaths,
+          one per file, defaulting to the file paths.
+        - `metadata`, an optional list of metadata, one per file.
+        """
+        filepaths = list(filepaths)
+        batch = cls.__new__(cls)
+        batch._allocate([os.path.getsize(filepath) for filepath in filepaths])
+        batch.images = []
+        for i, filepath in enumerate(filepaths):
+            start, end = batch.offsets[i], batch.offsets[i + 1]
+            with contextlib.closing(open(filepath, 'rb')) as fp:
+                if fp.readinto(batch.view[start:end]) != end - start:
+                    raise IOError('%s changed size while being read' % filepath)
+            batch.images.append(batch._image(
+                i, filepath, '', collection_filepaths[i] if collection_filepaths else filepath,
+                metadata[i] if metadata else None))
+        return batch
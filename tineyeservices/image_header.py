@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import collections
+import io
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+from .parallel import iter_batches
+
+ImageInfo = collections.namedtuple('ImageInfo', ['format', 'width', 'height'])
+
+# JPEG start of frame markers, which hold the image dimensions
+_JPEG_SOF = set(range(0xC0, 0xD0)) - set([0xC4, 0xC8, 0xCC])
+
+# Number of bytes at the end of a file searched for its end marker, as
+# cameras and editors often append data after it
+_TAIL_SIZE = 4096
+
+
+def _read(fp, size):
+    data = fp.read(size)
+    if len(data) < size:
+        raise ValueError('Image is truncated')
+    return data
+
+
+def _tail(fp, start):
+    """ Return the last `_TAIL_SIZE` bytes of the file, from `start` at most. """
+    fp.seek(0, os.SEEK_END)
+    end = fp.tell()
+    fp.seek(max(end - _TAIL_SIZE, start))
+    return fp.read()
+
+
+def _jpeg(fp):
+    fp.seek(2)
+    while True:
+        marker = _read(fp, 2)
+        # Skip fill bytes before a marker
+        while marker[0] != 0xFF or marker[1] == 0xFF:
+            marker = marker[1:] + _read(fp, 1)
+        code = marker[1]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        if code == 0xD9:
+            raise ValueError('JPEG image has no frame')
+        length = struct.unpack('>H', _read(fp, 2))[0]
+        if length < 2:
+            raise ValueError('JPEG image is corrupt')
+        if code in _JPEG_SOF:
+            height, width = struct.unpack('>xHH', _read(fp, 5))
+            break
+        fp.seek(length - 2, os.SEEK_CUR)
+
+    # A complete JPEG has an end of image marker near its end. Only look
+    # after the frame header, as an EXIF thumbnail before it has one too
+    if b'\xff\xd9' not in _tail(fp, fp.tell()):
+        raise ValueError('Image is truncated')
+    return ImageInfo('jpeg', width, height)
+
+
+def _png(fp):
+    fp.seek(8)
+    length, chunk = struct.unpack('>I4s', _read(fp, 8))
+    if chunk != b'IHDR':
+        raise ValueError('PNG image is corrupt')
+    width, height = struct.unpack('>II', _read(fp, 8))
+    if b'IEND\xaeB`\x82' not in _tail(fp, fp.tell()):
+        raise ValueError('Image is truncated')
+    return ImageInfo('png', width, height)
+
+
+def _gif(fp):
+    fp.seek(6)
+    width, height = struct.unpack('<HH', _read(fp, 4))
+    if b'\x3b' not in _tail(fp, fp.tell()):
+        raise ValueError('Image is truncated')
+    return ImageInfo('gif', width, height)
+
+
+def _bmp(fp):
+    fp.seek(2)
+    size = struct.unpack('<I', _read(fp, 4))[0]
+    fp.seek(14)
+    header_size = struct.unpack('<I', _read(fp, 4))[0]
+    if header_size == 12:
+        width, height = struct.unpack('<HH', _read(fp, 4))
+    else:
+        width, height = struct.unpack('<ii', _read(fp, 8))
+    fp.seek(0, os.SEEK_END)
+    if fp.tell() < size:
+        raise ValueError('Image is truncated')
+    return ImageInfo('bmp', width, abs(height))
+
+
+def _tiff(fp):
+    fp.seek(0)
+    order = '<' if _read(fp, 2) == b'II' else '>'
+    fp.seek(4)
+    offset = struct.unpack(order + 'I', _read(fp, 4))[0]
+    fp.seek(offset)
+    count = struct.unpack(order + 'H', _read(fp, 2))[0]
+    width = height = None
+    for _ in range(count):
+        tag, kind, _, value = struct.unpack(order + 'HHI4s', _read(fp, 12))
+        # Dimensions are SHORT (3) or LONG (4) values
+        number = struct.unpack(order + ('H2x' if kind == 3 else 'I'), value)[0]
+        if tag == 256:
+            width = number
+        elif tag == 257:
+            height = number
+    if width is None or height is None:
+        raise ValueError('TIFF image has no dimensions')
+    return ImageInfo('tiff', width, height)
+
+
+def _webp(fp):
+    fp.seek(4)
+    size = struct.unpack('<I', _read(fp, 4))[0]
+    fp.seek(12)
+    chunk = _read(fp, 4)
+    fp.seek(20)
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<6xHH', _read(fp, 10))
+        width, height = width & 0x3FFF, height & 0x3FFF
+    elif chunk == b'VP8L':
+        bits = struct.unpack('<xI', _read(fp, 5))[0]
+        width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    elif chunk == b'VP8X':
+        data = _read(fp, 10)[4:]
+        width = struct.unpack('<I', data[0:3] + b'\0')[0] + 1
+        height = struct.unpack('<I', data[3:6] + b'\0')[0] + 1
+    else:
+        raise ValueError('WebP image is corrupt')
+    fp.seek(0, os.SEEK_END)
+    if fp.tell() < size + 8:
+        raise ValueError('Image is truncated')
+    return ImageInfo('webp', width, height)
+
+
+def sniff_header(fp):
+    """
+    Identify an image from its header without decoding it.
+
+    Only the header and the last few kilobytes are read, to find the format,
+    the dimensions and whether the file was cut short.
+
+    Arguments:
+
+    - `fp`, a seekable binary file object.
+
+    Returned:
+
+    - an ImageInfo with `format` ('jpeg', 'png', 'gif', 'bmp', 'tiff' or
+      'webp'), `width` and `height`.
+
+    Raises ValueError if the file is empty, truncated, corrupt or not in a
+    supported format.
+    """
+    fp.seek(0)
+    magic = fp.read(12)
+    if not magic:
+        raise ValueError('Image is empty')
+    try:
+        if magic.startswith(b'\xff\xd8'):
+            info = _jpeg(fp)
+        elif magic.startswith(b'\x89PNG\r\n\x1a\n'):
+            info = _png(fp)
+        elif magic[:6] in (b'GIF87a', b'GIF89a'):
+            info = _gif(fp)
+        elif magic.startswith(b'BM'):
+            info = _bmp(fp)
+        elif magic[:4] in (b'II*\x00', b'MM\x00*'):
+            info = _tiff(fp)
+        elif magic.startswith(b'RIFF') and magic[8:12] == b'WEBP':
+            info = _webp(fp)
+        else:
+            raise ValueError('Image format is not supported')
+    except struct.error:
+        raise ValueError('Image is corrupt')
+    if info.width <= 0 or info.height <= 0:
+        raise ValueError('Image has no pixels')
+    return info
+
+
+def sniff_file(source):
+    """ Run `sniff_header` on a file path or on image bytes. """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return sniff_header(io.BytesIO(source))
+    with open(source, 'rb') as fp:
+        return sniff_header(fp)
+
+
+def _sniff_many(sources):
+    """ Sniff a chunk of sources in a worker process, returning (info, error) pairs. """
+    results = []
+    for source in sources:
+        try:
+            results.append((sniff_file(source), None))
+        except (IOError, ValueError) as e:
+            results.append((None, e))
+    return results
+
+
+def check_images(images, max_workers=None, chunk_size=64):
+    """
+    Check many images with `Image.check` on a pool of worker processes,
+    yielding `(image, info, error)` tuples in the order of `images`.
+
+    Images whose bytes are not loaded yet are checked by path in the worker
+    processes, so their files are never fully read. Images already in memory
+    are checked in this process. URL images are not checked and yield
+    `(image, None, None)`.
+
+        >>> from tineyeservices.image_header import check_images
+        >>> valid = [image for image, info, error in check_images(images) if error is None]
+
+    Arguments:
+
+    - `images`, an iterable of Image objects, consumed a chunk at a time.
+    - `max_workers`, number of worker processes, by default one per CPU.
+    - `chunk_size`, number of images sent to a worker at once.
+    """
+    def submit(executor, chunk):
+        # Images already in memory are cheap to check here, without copying
+        # their bytes to a worker process
+        sources = [image._data if image._data is not None else image.filepath or image.data
+                   for image in chunk]
+        paths = [source for source in sources if isinstance(source, str)]
+        return chunk, sources, executor.submit(_sniff_many, paths)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = collections.deque()
+        workers = max_workers or os.cpu_count() or 1
+        for chunk in iter_batches(images, max_count=chunk_size):
+            futures.append(submit(executor, chunk))
+            # Keep a bounded number of chunks in flight
+            while len(futures) > 2 * workers:
+                for item in _chunk_results(*futures.popleft()):
+                    yield item
+        while futures:
+            for item in _chunk_results(*futures.popleft()):
+                yield item
+
+
+def _chunk_results(chunk, sources, future):
+    results = iter(future.result())
+    for image, source in zip(chunk, sources):
+        if source is None:
+            yield image, None, None
+        elif isinstance(source, str):
+            info, error = next(results)
+            yield image, info, error
+        else:
+            try:
+                yield image, sniff_header(io.BytesIO(source)), None
+            except ValueError as e:
+                yield image, None, e
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import contextlib
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class HostLimiter(object):
+    """
+    Limit of the requests in flight to one engine across every process on
+    this host, such as the workers of a web server that each have their own
+    request object.
+
+    The limit is a set of `max_in_flight` slot files, one of which is locked
+    with `flock` for the duration of each request. The operating system
+    releases the lock of a process that dies, so a crashed worker never
+    holds on to a slot. Processes share the limit when they use the same
+    `api_url`, `max_in_flight` and `directory`. Requires a POSIX system.
+
+        >>> from tineyeservices import MatchEngineRequest, HostLimiter
+        >>> api = MatchEngineRequest(api_url='http://localhost/rest/')
+        >>> api.limiter = HostLimiter(api.api_url, max_in_flight=16)
+        >>> api.limiter.stats
+        {'requests': 0, 'waits': 0, 'wait_time': 0.0}
+
+    Arguments:
+
+    - `api_url`, the API URL of the engine, which names the set of slots.
+    - `max_in_flight`, maximum number of requests in flight on this host.
+    - `directory`, where the slot files are kept, by default a
+      `tineyeservices-limits` directory in the system temporary directory.
+    - `poll_interval`, longest time to sleep between attempts to take a slot.
+    """
+
+    def __init__(self, api_url, max_in_flight=16, directory=None, poll_interval=0.05):
+        if fcntl is None:
+            raise ImportError('HostLimiter requires fcntl, which is only available on POSIX systems')
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1')
+        if directory is None:
+            directory = os.path.join(tempfile.gettempdir(), 'tineyeservices-limits')
+        self.api_url = api_url
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.directory = os.path.join(directory, hashlib.sha1(api_url.encode('utf-8')).hexdigest()[:16])
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Slots held by this process, as flock does not exclude other threads
+        # using the same file descriptor
+        self.lock = threading.Lock()
+        self.files = {}
+        self.held = set()
+        self.pid = os.getpid()
+        self.stats = {'requests': 0, 'waits': 0, 'wait_time': 0.0}
+
+    def __repr__(self):
+        return "HostLimiter(api_url=%r, max_in_flight=%r)" % (self.api_url, self.max_in_flight)
+
+    def _check_fork(self):
+        """ Reopen the slot files after a fork. Call with the lock held. """
+        if self.pid != os.getpid():
+            # Locks on inherited descriptors are shared with the parent
+            # process, so a forked process opens its own
+            for fd in self.files.values():
+                os.close(fd)
+            self.files = {}
+            self.held = set()
+            self.pid = os.getpid()
+
+    def _file(self, slot):
+        if slot not in self.files:
+            path = os.path.join(self.directory, 'slot-%i' % slot)
+            self.files[slot] = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        return self.files[slot]
+
+    def _try_acquire(self):
+        """ Take a free slot without waiting, returning its number or None. """
+        with self.lock:
+            self._check_fork()
+            for slot in range(self.max_in_flight):
+                if slot in self.held:
+                    continue
+                try:
+                    fcntl.flock(self._file(slot), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (BlockingIOError, PermissionError):
+                    continue
+                self.held.add(slot)
+                return slot
+        return None
+
+    def acquire(self, timeout=None):
+        """
+        Take a slot, waiting up to `timeout` seconds, or for as long as it
+        takes if None. Returns the slot number, or None on timeout.
+        """
+        start = time.monotonic()
+        slot = self._try_acquire()
+        delay = 0.001
+        waited = slot is None
+        while slot is None:
+            remaining = None if timeout is None else timeout - (time.monotonic() - start)
+            if remaining is not None and remaining <= 0:
+                break
+            time.sleep(min(delay, remaining) if remaining is not None else delay)
+            delay = min(delay * 2, self.poll_interval)
+            slot = self._try_acquire()
+
+        with self.lock:
+            if waited:
+                self.stats['waits'] += 1
+                self.stats['wait_time'] += time.monotonic() - start
+            if slot is not None:
+                self.stats['requests'] += 1
+        return slot
+
+    def release(self, slot):
+        """ Give back a slot taken with `acquire`. """
+        with self.lock:
+            fcntl.flock(self.files[slot], fcntl.LOCK_UN)
+            self.held.discard(slot)
+
+    @contextlib.contextmanager
+    def slot(self, timeout=None):
+        """
+        Context manager holding a slot for the duration of a request.
+        Raises TimeoutError if no slot was free within `timeout` seconds.
+        """
+        slot = self.acquire(timeout)
+        if slot is None:
+            raise TimeoutError('No free slot for %s within %ss' % (self.api_url, timeout))
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def in_flight(self):
+        """ Return the number of requests in flight on this host, across processes. """
+        busy = 0
+        with self.lock:
+            self._check_fork()
+            for slot in range(self.max_in_flight):
+                if slot in self.held:
+                    busy += 1
+                    continue
+                try:
+                    fcntl.flock(self._file(slot), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (BlockingIOError, PermissionError):
+                    busy += 1
+                    continue
+                fcntl.flock(self._file(slot), fcntl.LOCK_UN)
+        return busy
+
+    def close(self):
+        """ Close the slot files. Slots still held are released. """
+        with self.lock:
+            for fd in self.files.values():
+                os.close(fd)
+            self.files = {}
+            self.held = set()
@@ -1,9 +1,21 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2018 TinEye. All rights reserved worldwide.
 
+import copy
 import time
+import uuid
+from .arrays import SEARCH_RESULT_FORMATS, check_result_format, format_search_response
 from .image import Image
+from .parallel import map_with_deadline
+from .results import CompareResult
 from .tineye_service_request import TinEyeServiceRequest
+from .tuner import tuned
+from .write_queue import split_response
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class MatchEngineRequest(TinEyeServiceRequest):
@@ -56,6 +68,8 @@ class MatchEngineRequest(TinEyeServiceRequest):
         for image in images:
             if not isinstance(image, Image):
                 raise TypeError('Need to pass a list of Image objects')
+            if image.collection_filepath == '':
+                raise ValueError('Need a collection filepath for every image')
             # Put dummy filename here, we are going to use the API's filepath params instead
             file_params['images[%i]' % counter] = ('%s.%i' % (time.time(), counter), image.data)
             params['filepaths[%i]' % counter] = image.collection_filepath
@@ -91,7 +105,9 @@ class MatchEngineRequest(TinEyeServiceRequest):
 
         return self._request('add', params, **kwargs)
 
-    def search_image(self, image, min_score=0, offset=0, limit=10, check_horizontal_flip=False, **kwargs):
+    def search_image(
+            self, image, min_score=0, offset=0, limit=10,
+            check_horizontal_flip=False, result_format='json', **kwargs):
         """
         Search against the collection using image data and return any matches
         with corresponding scores.
@@ -103,6 +119,9 @@ class MatchEngineRequest(TinEyeServiceRequest):
         - `offset`, offset of results from the start.
         - `limit`, maximum number of matches that should be returned.
         - `check_horizontal_flip`, whether to incorporate a horizontal flip check.
+        - `result_format`, 'json' to return the response as sent by the API,
+          'objects' for a SearchResult, 'numpy' for a structured array, 'pandas'
+          for a DataFrame or 'arrow' for a pyarrow Table.
 
         Returned:
 
@@ -114,6 +133,8 @@ class MatchEngineRequest(TinEyeServiceRequest):
           + `overlay`, URL pointing to overlay image.
           + `filepath`, match image path.
         """
+        check_result_format(result_format, SEARCH_RESULT_FORMATS)
+
         params = {
             'min_score': min_score,
             'offset': offset,
@@ -125,11 +146,13 @@ class MatchEngineRequest(TinEyeServiceRequest):
 
         file_params = {'image': (image.collection_filepath, image.data)}
 
-        return self._request('search', params, file_params, **kwargs)
+        response = self._request('search', params, file_params, **kwargs)
+
+        return format_search_response(response, result_format)
 
     def search_filepath(
             self, filepath, min_score=0, offset=0, limit=10,
-            check_horizontal_flip=False, **kwargs):
+            check_horizontal_flip=False, result_format='json', **kwargs):
         """
         Search against the collection using an image already in the
         collection and return any matches with corresponding scores.
@@ -142,6 +165,9 @@ class MatchEngineRequest(TinEyeServiceRequest):
         - `offset`, offset of results from the start.
         - `limit`, maximum number of matches that should be returned.
         - `check_horizontal_flip`, whether to incorporate a horizontal flip check.
+        - `result_format`, 'json' to return the response as sent by the API,
+          'objects' for a SearchResult, 'numpy' for a structured array, 'pandas'
+          for a DataFrame or 'arrow' for a pyarrow Table.
 
         Returned:
 
@@ -153,6 +179,8 @@ class MatchEngineRequest(TinEyeServiceRequest):
           + `overlay`, URL pointing to overlay image.
           + `filepath`, match image path.
         """
+        check_result_format(result_format, SEARCH_RESULT_FORMATS)
+
         params = {
             'filepath': filepath,
             'min_score': min_score,
@@ -160,11 +188,13 @@ class MatchEngineRequest(TinEyeServiceRequest):
             'limit': limit,
             'check_horizontal_flip': check_horizontal_flip}
 
-        return self._request('search', params, **kwargs)
+        response = self._request('search', params, **kwargs)
+
+        return format_search_response(response, result_format)
 
     def search_url(
             self, url, min_score=0, offset=0, limit=10,
-            check_horizontal_flip=False, **kwargs):
+            check_horizontal_flip=False, result_format='json', **kwargs):
         """
         Search against the collection using an image URL
         and return any matches with corresponding scores.
@@ -176,6 +206,9 @@ class MatchEngineRequest(TinEyeServiceRequest):
         - `offset`, offset of results from the start.
         - `limit`, maximum number of matches that should be returned.
         - `check_horizontal_flip`, whether to incorporate a horizontal flip check.
+        - `result_format`, 'json' to return the response as sent by the API,
+          'objects' for a SearchResult, 'numpy' for a structured array, 'pandas'
+          for a DataFrame or 'arrow' for a pyarrow Table.
 
         Returned:
 
@@ -187,6 +220,8 @@ class MatchEngineRequest(TinEyeServiceRequest):
           + `overlay`, URL pointing to overlay image.
           + `filepath`, match image path.
         """
+        check_result_format(result_format, SEARCH_RESULT_FORMATS)
+
         params = {
             'url': url,
             'min_score': min_score,
@@ -194,9 +229,13 @@ class MatchEngineRequest(TinEyeServiceRequest):
             'limit': limit,
             'check_horizontal_flip': check_horizontal_flip}
 
-        return self._request('search', params, **kwargs)
+        response = self._request('search', params, **kwargs)
 
-    def compare_image(self, image_1, image_2, min_score=0, check_horizontal_flip=False, **kwargs):
+        return format_search_response(response, result_format)
+
+    def compare_image(
+            self, image_1, image_2, min_score=0, check_horizontal_flip=False,
+            result_format='json', **kwargs):
         """
         Given two images, compare them and return the match score if there
         is a match.
@@ -207,6 +246,9 @@ class MatchEngineRequest(TinEyeServiceRequest):
         - `image_2`, an Image object representing the second image.
         - `min_score`, minimum score that should be returned.
         - `check_horizontal_flip`, whether to incorporate a horizontal flip check.
+        - `result_format`, 'json' to return the response as sent by the API,
+          'objects' for a CompareResult, 'numpy' for a structured array, 'pandas'
+          for a DataFrame or 'arrow' for a pyarrow Table.
 
         Returned:
 
@@ -217,6 +259,8 @@ class MatchEngineRequest(TinEyeServiceRequest):
           + `score`, relevance score.
           + `match_percent`, percent of image matching.
         """
+        check_result_format(result_format, SEARCH_RESULT_FORMATS)
+
         params = {
             'min_score': min_score,
             'check_horizontal_flip': check_horizontal_flip}
@@ -225,9 +269,13 @@ class MatchEngineRequest(TinEyeServiceRequest):
             'image1': (image_1.collection_filepath, image_1.data),
             'image2': (image_2.collection_filepath, image_2.data)}
 
-        return self._request('compare', params, image_params, **kwargs)
+        response = self._request('compare', params, image_params, **kwargs)
 
-    def compare_url(self, url_1, url_2, min_score=0, check_horizontal_flip=False, **kwargs):
+        return format_search_response(response, result_format, response_class=CompareResult)
+
+    def compare_url(
+            self, url_1, url_2, min_score=0, check_horizontal_flip=False,
+            result_format='json', **kwargs):
         """
         Given two images, compare them and return the match score if there
         is a match.
@@ -240,6 +288,9 @@ class MatchEngineRequest(TinEyeServiceRequest):
         - `offset`, offset of results from the start.
         - `limit`, maximum number of matches that should be returned.
         - `check_horizontal_flip`, whether to incorporate a horizontal flip check.
+        - `result_format`, 'json' to return the response as sent by the API,
+          'objects' for a CompareResult, 'numpy' for a structured array, 'pandas'
+          for a DataFrame or 'arrow' for a pyarrow Table.
 
         Returned:
 
@@ -250,10 +301,167 @@ class MatchEngineRequest(TinEyeServiceRequest):
           + `score`, relevance score.
           + `match_percent`, percent of image matching.
         """
+        check_result_format(result_format, SEARCH_RESULT_FORMATS)
+
         params = {
             'url1': url_1,
             'url2': url_2,
             'min_score': min_score,
             'check_horizontal_flip': check_horizontal_flip}
 
-        return self._request('compare', params, **kwargs)
+        response = self._request('compare', params, **kwargs)
+
+        return format_search_response(response, result_format, response_class=CompareResult)
+
+    def compare_matrix(
+            self, images, min_score=0, check_horizontal_flip=False,
+            method='compare', max_workers=None, **kwargs):
+        """
+        Compare every pair of images in a set and return a symmetric matrix
+        of match scores. Requires numpy.
+
+        Arguments:
+
+        - `images`, a list of Image objects with data.
+        - `min_score`, minimum score that should be returned.
+        - `check_horizontal_flip`, whether to incorporate a horizontal flip check.
+        - `method`, how the scores are computed, one of:
+
+          + `compare`, one compare call per unordered pair of images.
+          + `collection`, add the images to the collection under a temporary
+            prefix, search each one by filepath, then delete them again.
+            This makes fewer calls for large sets, but writes to the
+            collection and searches all of it, so it is only used when asked
+            for. Images the engine fails to add get NaN scores.
+          + `auto`, `collection` when the compare calls for every pair would
+            outnumber the add, search and delete calls it makes, otherwise
+            `compare`.
+
+        - `max_workers`, maximum number of requests in flight at once, by
+          default the `search_image` workers tuned for the engine by a
+          Tuner, or 8.
+
+        Returned:
+
+        - a `numpy.float32` array of shape (n, n) where entry (i, j) is the
+          score between `images[i]` and `images[j]`, or 0 if they do not match.
+          The diagonal is set to 100. If the request has a deadline, pairs
+          that were not compared before it passed are set to NaN.
+        """
+        if numpy is None:
+            raise ImportError('compare_matrix requires numpy')
+
+        if not isinstance(images, list):
+            raise TypeError('Need to pass a list of Image objects')
+
+        for image in images:
+            if not isinstance(image, Image):
+                raise TypeError('Need to pass a list of Image objects')
+            if image.data is None:
+                raise ValueError('compare_matrix needs Image objects with data')
+
+        if method not in ('compare', 'collection', 'auto'):
+            raise ValueError('method must be one of compare, collection or auto')
+
+        if max_workers is None:
+            max_workers = tuned(self, 'search_image', 'workers', 8)
+
+        n = len(images)
+        pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+
+        # One compare call per pair against one add, one count, a search per
+        # image and one delete
+        if method == 'auto':
+            method = 'collection' if len(pairs) > n + 3 else 'compare'
+
+        scores = numpy.zeros((n, n), dtype=numpy.float32)
+        numpy.fill_diagonal(scores, 100)
+
+        if method == 'compare':
+            def compare(pair):
+                i, j = pair
+                response = self.compare_image(
+                    images[i], images[j], min_score=min_score,
+                    check_horizontal_flip=check_horizontal_flip, **kwargs)
+                return pair, _best_score(response)
+
+            results = map_with_deadline(
+                compare, pairs, self.deadline, max_workers=max_workers,
+                expired=lambda pair: (pair, numpy.nan))
+            for (i, j), score in results:
+                scores[i, j] = scores[j, i] = score
+        elif n > 1:
+            self._compare_matrix_collection(
+                images, scores, min_score, check_horizontal_flip, max_workers, **kwargs)
+
+        return scores
+
+    def _compare_matrix_collection(
+            self, images, scores, min_score, check_horizontal_flip, max_workers, **kwargs):
+        """ Fill in `scores` by searching a temporary copy of `images` in the collection. """
+        prefix = 'compare_matrix/%s/' % uuid.uuid4().hex
+        filepaths = ['%s%i' % (prefix, i) for i in range(len(images))]
+        indexes = dict((filepath, i) for i, filepath in enumerate(filepaths))
+
+        try:
+            # Copy the images so the caller's collection filepaths are untouched
+            temporary = []
+            for image, filepath in zip(images, filepaths):
+                image = copy.copy(image)
+                image.collection_filepath = filepath
+                temporary.append(image)
+            response = self.add_image(temporary, **kwargs)
+
+            # Images the engine failed to add have unknown scores
+            responses = split_response(response, filepaths)
+            if responses is None:
+                scores[:] = numpy.nan
+                numpy.fill_diagonal(scores, 100)
+                return
+            added = [i for i, item_response in enumerate(responses) if item_response['status'] != 'fail']
+
+            # Other images in the collection may outrank ours, so ask for everything
+            limit = self.count(**kwargs)['result'][0]
+
+            def search(i):
+                response = self.search_filepath(
+                    filepaths[i], min_score=min_score, limit=limit,
+                    check_horizontal_flip=check_horizontal_flip, **kwargs)
+                return i, response
+
+            results = map_with_deadline(
+                search, added, self.deadline, max_workers=max_workers,
+                expired=lambda i: (i, None))
+            searched = numpy.zeros(len(images), dtype=bool)
+            for i, response in results:
+                if response is None:
+                    continue
+                searched[i] = True
+                for match in response.get('result', []):
+                    j = indexes.get(match['filepath'])
+                    if j is None or j == i:
+                        continue
+                    # Searches are not symmetric, keep the best of both directions
+                    score = float(match['score'])
+                    if score > scores[i, j]:
+                        scores[i, j] = scores[j, i] = score
+
+            # A pair is known if either of its images was searched, and
+            # neither failed to be added
+            unknown = ~(searched[:, None] | searched[None, :])
+            failed = numpy.ones(len(images), dtype=bool)
+            failed[added] = False
+            unknown |= failed[:, None] | failed[None, :]
+            numpy.fill_diagonal(unknown, False)
+            scores[unknown] = numpy.nan
+        finally:
+            # Always remove the temporary images, even once the deadline has passed
+            self.with_deadline(None).delete(filepaths, **kwargs)
+
+
+def _best_score(response):
+    """ Return the highest match score in a response, or 0 if there are none. """
+    result = response.get('result', [])
+    if not result:
+        return 0
+    return max(float(match['score']) for match in result)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+import threading
+
+from .exception import TinEyeServiceDeadlineExceeded
+from .parallel import DeadlineIterator, imap_unordered, iter_batches
+
+
+def metadata_keywords(metadata):
+    """
+    Yield the `(key, value)` pairs that can be filtered on in metadata in the
+    form sent with `add_*` and `update_metadata`, such as
+    `{"keywords": ["whale", "shark"]}`. Nested dictionaries yield dotted keys.
+    """
+    if not isinstance(metadata, dict):
+        return
+    for key, value in metadata.items():
+        if isinstance(value, dict):
+            for nested_key, keyword in metadata_keywords(value):
+                yield '%s.%s' % (key, nested_key), keyword
+        else:
+            for keyword in _values(value):
+                yield key, keyword
+
+
+def metadata_from_tree(tree):
+    """
+    Convert the metadata tree returned by `get_metadata`, such as
+    `{"keywords": {"": ["whale", "shark"], "type": "string"}}`, to the form
+    sent with `add_*` and `update_metadata`, such as
+    `{"keywords": ["whale", "shark"]}`. The type and action of each key are
+    dropped.
+    """
+    metadata = {}
+    if not isinstance(tree, dict):
+        return metadata
+    for key, node in tree.items():
+        if key == '' or not isinstance(node, dict):
+            continue
+        if '' in node:
+            metadata[key] = node['']
+        else:
+            metadata[key] = metadata_from_tree(node)
+    return metadata
+
+
+def _values(value):
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    if value is None:
+        return []
+    return [str(value)]
+
+
+class MetadataMirror(object):
+    """
+    Client side copy of the metadata of a collection, for lookups and keyword
+    filtering without a round trip to the engine.
+
+    Attach it to a MetadataRequest to keep it current with that client's own
+    `add_image`, `add_url`, `update_metadata` and `delete` calls. Writes made
+    by other clients are not seen, so call `populate` again to resync.
+
+        >>> from tineyeservices import MulticolorEngineRequest, MetadataMirror
+        >>> mirror = MetadataMirror()
+        >>> api = MulticolorEngineRequest(api_url='http://localhost/rest/', mirror=mirror)
+        >>> mirror.populate(api)
+        >>> mirror.get('banana.jpg')
+        {'keywords': ['whale', 'shark']}
+        >>> mirror.filter(keywords='whale')
+        {'banana.jpg'}
+
+    Metadata is mirrored in the form sent with `add_*` and
+    `update_metadata`; the trees fetched by `populate` are converted to it.
+    Filepaths whose state is unknown after a failed or partial write are
+    dropped from the mirror, so a missing entry means "ask the engine".
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.metadata = {}
+        self.index = {}
+        self.deadline_exceeded = False
+
+    def __repr__(self):
+        return "MetadataMirror(images=%r)" % len(self)
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def __contains__(self, filepath):
+        return filepath in self.metadata
+
+    def get(self, filepath, default=None):
+        """ Return the mirrored metadata of `filepath`, or `default` if it is not mirrored. """
+        return self.metadata.get(filepath, default)
+
+    def get_many(self, filepaths):
+        """ Return a dictionary of the mirrored metadata of those `filepaths` that are mirrored. """
+        with self.lock:
+            return dict((f, self.metadata[f]) for f in filepaths if f in self.metadata)
+
+    def filter(self, **keywords):
+        """
+        Return the set of mirrored filepaths whose metadata contains every
+        given keyword, such as `filter(keywords='whale', color='red')`. Nested
+        keys are given with dotted names through a dictionary:
+        `filter(**{'product.brand': 'acme'})`.
+        """
+        with self.lock:
+            matches = None
+            for key, value in keywords.items():
+                found = self.index.get((key, str(value)), set())
+                matches = set(found) if matches is None else matches & found
+                if not matches:
+                    return set()
+            return matches if matches is not None else set(self.metadata)
+
+    def set(self, filepath, metadata):
+        """
+        Mirror the metadata of `filepath`, replacing anything mirrored before.
+        `metadata` is a JSON string or dictionary in the form sent with
+        `add_*` and `update_metadata`.
+        """
+        if isinstance(metadata, str):
+            metadata = json.loads(metadata) if metadata else {}
+        elif metadata is None:
+            metadata = {}
+        with self.lock:
+            self.discard(filepath)
+            self.metadata[filepath] = metadata
+            for keyword in metadata_keywords(metadata):
+                self.index.setdefault(keyword, set()).add(filepath)
+
+    def discard(self, filepath):
+        """ Remove `filepath` from the mirror if it is present. """
+        with self.lock:
+            metadata = self.metadata.pop(filepath, None)
+            if metadata is None:
+                return
+            for keyword in metadata_keywords(metadata):
+                filepaths = self.index.get(keyword)
+                if filepaths is not None:
+                    filepaths.discard(filepath)
+                    if not filepaths:
+                        del self.index[keyword]
+
+    def clear(self):
+        with self.lock:
+            self.metadata.clear()
+            self.index.clear()
+
+    def record_write(self, response, filepaths, metadata=None):
+        """
+        Update the mirror after a write call made by the attached request.
+
+        Arguments:
+
+        - `response`, the API response, or None if the call raised.
+        - `filepaths`, the filepaths written.
+        - `metadata`, the metadata sent for each filepath, or None for a delete.
+        """
+        with self.lock:
+            if response is None or response.get('status') != 'ok':
+                # The engine may have applied some of the writes, forget them all
+                for filepath in filepaths:
+                    self.discard(filepath)
+                return
+            if metadata is None:
+                for filepath in filepaths:
+                    self.discard(filepath)
+                return
+            for filepath, m in zip(filepaths, metadata):
+                # Without metadata the engine's state for the image is not known here
+                if m is None:
+                    self.discard(filepath)
+                    continue
+                try:
+                    self.set(filepath, m)
+                except ValueError:
+                    self.discard(filepath)
+
+    def populate(self, request, filepaths=None, batch_size=500, max_workers=4, **kwargs):
+        """
+        Fill the mirror from the engine with `get_metadata`.
+
+        Mirrored filepaths that are no longer in the collection are dropped:
+        every filepath mirrored before the call and not listed by the engine
+        when `filepaths` is None, or every given filepath the engine returned
+        no metadata for.
+
+        Arguments:
+
+        - `request`, a MetadataRequest subclass instance.
+        - `filepaths`, the filepaths to fetch, by default every image listed
+          in the collection.
+        - `batch_size`, number of filepaths per `get_metadata` call.
+        - `max_workers`, maximum number of calls in flight at once.
+
+        With a deadline on `request`, no call starts once it has passed: the
+        metadata fetched by then is mirrored, only the fetched filepaths
+        are checked for removal, and `deadline_exceeded` is set.
+        """
+        self.deadline_exceeded = False
+        with self.lock:
+            stale = set(self.metadata) if filepaths is None else set()
+        if filepaths is None:
+            filepaths = request.iter_list(page_size=batch_size, **kwargs)
+
+        def fetch(batch):
+            return request.get_metadata(batch, **kwargs)
+
+        batches = DeadlineIterator(iter_batches(filepaths, max_count=batch_size), request.deadline)
+        fetched = set()
+        seen = set()
+        for batch, response, error in imap_unordered(fetch, batches, max_workers=max_workers):
+            if isinstance(error, TinEyeServiceDeadlineExceeded):
+                self.deadline_exceeded = True
+                continue
+            if error is not None:
+                raise error
+            fetched.update(batch)
+            result = response.get('result') or []
+            for filepath, item in zip(batch, result):
+                filepath = item.get('filepath', filepath)
+                seen.add(filepath)
+                self.set(filepath, metadata_from_tree(item.get('metadata')))
+
+        if batches.cut_short:
+            self.deadline_exceeded = True
+        # Filepaths not fetched by the deadline may still be in the collection
+        if self.deadline_exceeded:
+            stale = fetched
+        else:
+            stale.update(fetched)
+        for filepath in stale - seen:
+            self.discard(filepath)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+import numbers
+import threading
+import time
+
+# Metadata types whose values must be numbers
+NUMERIC_TYPES = ('uint', 'int', 'float', 'double')
+
+# Engine operators allowed in a query next to metadata keys, each taking a
+# query or a list of queries on the keys at the same level
+QUERY_OPERATORS = ('_and_operator_', '_or_operator_', '_not_operator_')
+
+
+class UnknownMetadataKey(ValueError):
+    """ Raised when a query uses a metadata key the schema does not have. """
+
+
+class CompiledQuery(str):
+    """
+    A validated metadata query, already serialized to JSON.
+
+    It is a string, so it can be passed straight to any method taking
+    `metadata`, `return_metadata` or `count_metadata` without encoding it
+    again.
+    """
+    __slots__ = ()
+
+
+class MetadataSchema(object):
+    """
+    The metadata keys of a collection that can be searched and returned,
+    as reported by `get_search_metadata` and `get_return_metadata`.
+
+    Arguments:
+
+    - `search_metadata`, the `result` of a `get_search_metadata` response.
+    - `return_metadata`, the `result` of a `get_return_metadata` response.
+    """
+
+    def __init__(self, search_metadata=None, return_metadata=None):
+        self.search_keys = {}
+        self.return_keys = {}
+        for item in search_metadata or []:
+            self._add_tree(self.search_keys, item.get('metadata') or {}, ())
+        for item in return_metadata or []:
+            self._add_tree(self.return_keys, item.get('metadata') or {}, ())
+
+    def __repr__(self):
+        return "MetadataSchema(search_keys=%r, return_keys=%r)" %\
+               (sorted(self.search_keys), sorted(self.return_keys))
+
+    def _add_tree(self, keys, tree, path):
+        for key, node in tree.items():
+            if not isinstance(node, dict):
+                continue
+            keys[path + (key,)] = node.get('type')
+            self._add_tree(keys, node, path + (key,))
+
+    def children(self, path):
+        """ Return the names of the searchable keys directly below `path`. """
+        depth = len(path) + 1
+        return set(key[-1] for key in self.search_keys
+                   if len(key) == depth and key[:-1] == path)
+
+
+class MetadataQueryBuilder(object):
+    """
+    Validate and compile metadata queries against the collection's metadata
+    schema before they are sent, so a misspelled key fails immediately rather
+    than as a slow empty search.
+
+    The schema is fetched with `get_search_metadata` and `get_return_metadata`
+    and cached for `ttl` seconds, and compiled queries are memoized.
+
+        >>> from tineyeservices import MulticolorEngineRequest, MetadataQueryBuilder
+        >>> api = MulticolorEngineRequest(api_url='http://localhost/rest/')
+        >>> builder = MetadataQueryBuilder(api)
+        >>> query = builder.query({'keywords': 'whale'})
+        >>> api.search_metadata(metadata=query, return_metadata=builder.return_metadata(['id']))
+        >>> builder.query({'keywrods': 'whale'})
+        Traceback (most recent call last):
+        ...
+        ValueError: Unknown metadata key "keywrods", expected one of: keywords
+
+    Arguments:
+
+    - `request`, a MetadataRequest subclass instance.
+    - `ttl`, number of seconds the schema is cached for.
+    - `refresh_after`, when a query uses an unknown key and the schema is at
+      least this many seconds old, it is fetched again before failing, in
+      case the key was added since.
+    - `max_cached`, maximum number of compiled queries kept.
+    - `operators`, the engine operators allowed in queries alongside the
+      metadata keys.
+    """
+
+    def __init__(self, request, ttl=300, refresh_after=30, max_cached=10000, operators=QUERY_OPERATORS):
+        self.request = request
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self.max_cached = max_cached
+        self.operators = operators
+        self.lock = threading.Lock()
+        self._schema = None
+        self._fetched = 0
+        self._queries = {}
+
+    def __repr__(self):
+        return "MetadataQueryBuilder(request=%r, ttl=%r)" % (self.request, self.ttl)
+
+    @property
+    def schema(self):
+        """ The cached MetadataSchema, fetched again once it is older than `ttl`. """
+        with self.lock:
+            if self._schema is None or time.time() - self._fetched > self.ttl:
+                self._fetch()
+            return self._schema
+
+    def refresh(self):
+        """ Fetch the schema again and forget compiled queries. """
+        with self.lock:
+            self._fetch()
+
+    def _fetch(self):
+        search = self.request.get_search_metadata()
+        returned = self.request.get_return_metadata()
+        # An empty collection has no schema, queries are then passed through unchecked
+        if search.get('status') == 'ok' and returned.get('status') == 'ok':
+            self._schema = MetadataSchema(search.get('result'), returned.get('result'))
+        else:
+            self._schema = MetadataSchema()
+        self._fetched = time.time()
+        self._queries.clear()
+
+    def _memoize(self, key, compile_query):
+        with self.lock:
+            compiled = self._queries.get(key)
+        if compiled is not None:
+            return compiled
+
+        try:
+            compiled = compile_query(self.schema)
+        except UnknownMetadataKey:
+            # The key may have been added since the schema was fetched. Other
+            # errors, such as malformed JSON, are raised as they are
+            if time.time() - self._fetched < self.refresh_after:
+                raise
+            self.refresh()
+            compiled = compile_query(self.schema)
+
+        with self.lock:
+            if len(self._queries) >= self.max_cached:
+                self._queries.clear()
+            self._queries[key] = compiled
+        return compiled
+
+    def query(self, query):
+        """
+        Validate a metadata search query and return it as a CompiledQuery.
+
+        Arguments:
+
+        - `query`, a dictionary or JSON string such as `{"keywords": "whale"}`.
+
+        Raises UnknownMetadataKey, a ValueError, if the query uses a key the
+        collection does not have, and ValueError if it is not a JSON object or
+        has a non-numeric value for a numeric key.
+        """
+        if isinstance(query, CompiledQuery):
+            return query
+        key = query if isinstance(query, str) else json.dumps(query, sort_keys=True)
+
+        def compile_query(schema):
+            tree = json.loads(query) if isinstance(query, str) else query
+            if not isinstance(tree, dict):
+                raise ValueError('A metadata query must be a JSON object')
+            if schema.search_keys:
+                self._check_tree(schema, tree, ())
+            return CompiledQuery(json.dumps(tree, separators=(',', ':'), sort_keys=True))
+
+        return self._memoize(('query', key), compile_query)
+
+    def return_metadata(self, keys):
+        """
+        Validate a list of metadata keys to return with each match and return
+        them as a CompiledQuery.
+        """
+        keys = tuple(keys)
+
+        def compile_query(schema):
+            if schema.return_keys:
+                known = set(key[0] for key in schema.return_keys)
+                for key in keys:
+                    if key not in known:
+                        raise UnknownMetadataKey('Unknown return metadata key "%s", expected one of: %s' %
+                                                 (key, ', '.join(sorted(known))))
+            return CompiledQuery(json.dumps(list(keys), separators=(',', ':')))
+
+        return self._memoize(('return', keys), compile_query)
+
+    def count_metadata(self, queries):
+        """ Validate a list of metadata queries to count, returning a list of CompiledQuery. """
+        return [self.query(query) for query in queries]
+
+    def _check_tree(self, schema, tree, path):
+        children = schema.children(path)
+        for key, value in tree.items():
+            if key in self.operators:
+                for subquery in value if isinstance(value, list) else [value]:
+                    if not isinstance(subquery, dict):
+                        raise ValueError('Metadata operator "%s" takes queries, got %r' % (key, subquery))
+                    self._check_tree(schema, subquery, path)
+                continue
+            if key not in children:
+                raise UnknownMetadataKey('Unknown metadata key "%s", expected one of: %s' %
+                                         ('.'.join(path + (key,)), ', '.join(sorted(children))))
+            key_path = path + (key,)
+            if isinstance(value, dict):
+                # Descend into nested keys, objects on leaf keys are left to the engine
+                if schema.children(key_path):
+                    self._check_tree(schema, value, key_path)
+            else:
+                self._check_values(schema.search_keys[key_path], key_path, value)
+
+    def _check_values(self, key_type, path, value):
+        if key_type not in NUMERIC_TYPES:
+            return
+        for v in value if isinstance(value, list) else [value]:
+            if isinstance(v, bool) or not isinstance(v, (numbers.Number, str)):
+                raise ValueError('Metadata key "%s" is numeric, got %r' % ('.'.join(path), v))
+            try:
+                float(v)
+            except ValueError:
+                raise ValueError('Metadata key "%s" is numeric, got %r' % ('.'.join(path), v))
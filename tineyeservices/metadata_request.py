@@ -7,7 +7,35 @@ from .tineye_service_request import TinEyeServiceRequest
 
 
 class MetadataRequest(TinEyeServiceRequest):
-    """ Class to send requests to a TinEye Services API. """
+    """
+    Class to send requests to a TinEye Services API.
+
+    Pass a MetadataMirror as `mirror` to keep a client side copy of the
+    collection metadata current with this client's writes.
+    """
+
+    def __init__(self, api_url='http://localhost/rest/', username=None, password=None, mirror=None):
+        super(MetadataRequest, self).__init__(api_url=api_url, username=username, password=password)
+        self.mirror = mirror
+
+    def _write(self, method, params, file_params, filepaths, metadata, **kwargs):
+        """ Make a write request and record what changed. """
+        try:
+            response = self._request(method, params, file_params, **kwargs)
+        except Exception:
+            self._record_write(None, filepaths, metadata)
+            raise
+        self._record_write(response, filepaths, metadata)
+        return response
+
+    def _record_write(self, response, filepaths, metadata=None):
+        """
+        Called after every add, update_metadata and delete call with the
+        response (None if the call raised), the filepaths written and the
+        metadata sent for each (None for a delete).
+        """
+        if self.mirror is not None:
+            self.mirror.record_write(response, filepaths, metadata)
 
     def add_image(self, images, ignore_background=True, **kwargs):
         """
@@ -34,6 +62,8 @@ class MetadataRequest(TinEyeServiceRequest):
         for image in images:
             if not isinstance(image, Image):
                 raise TypeError('Need to pass a list of Image objects')
+            if image.collection_filepath == '':
+                raise ValueError('Need a collection filepath for every image')
             # Put dummy filename here, we are going to use the API's filepath params instead
             file_params['images[%i]' % counter] = ('%s.%i' % (time.time(), counter), image.data)
             params['filepaths[%i]' % counter] = image.collection_filepath
@@ -41,7 +71,9 @@ class MetadataRequest(TinEyeServiceRequest):
                 params['metadata[%i]' % counter] = image.metadata
             counter += 1
 
-        return self._request('add', params, file_params, **kwargs)
+        return self._write(
+            'add', params, file_params, [image.collection_filepath for image in images],
+            [image.metadata for image in images], **kwargs)
 
     def add_url(self, images, ignore_background=True, **kwargs):
         """
@@ -73,7 +105,9 @@ class MetadataRequest(TinEyeServiceRequest):
                 params['metadata[%i]' % counter] = image.metadata
             counter += 1
 
-        return self._request('add', params, **kwargs)
+        return self._write(
+            'add', params, None, [image.collection_filepath for image in images],
+            [image.metadata for image in images], **kwargs)
 
     def update_metadata(self, filepaths, metadata, **kwargs):
         """
@@ -83,7 +117,7 @@ class MetadataRequest(TinEyeServiceRequest):
 
         - `filepaths`, a list of filepath strings of an image already in the collection
           as returned by a search or list operation.
-        - `metadata`, the metadata to be stored with the image.
+        - `metadata`, a list of metadata to be stored with the images, one per filepath.
 
         Returned:
 
@@ -99,6 +133,9 @@ class MetadataRequest(TinEyeServiceRequest):
         if not isinstance(metadata, list):
             raise TypeError('Need to pass a list of metadata')
 
+        if len(filepaths) != len(metadata):
+            raise ValueError('Need to pass the same number of filepaths and metadata')
+
         for filepath in filepaths:
             params['filepaths[%i]' % counter] = filepath
             counter += 1
@@ -108,7 +145,29 @@ class MetadataRequest(TinEyeServiceRequest):
             params['metadata[%i]' % counter] = m
             counter += 1
 
-        return self._request('update_metadata', params, **kwargs)
+        return self._write('update_metadata', params, None, filepaths, metadata, **kwargs)
+
+    def delete(self, filepaths, **kwargs):
+        """
+        Delete images from the collection.
+
+        Arguments:
+
+        - `filepaths`, a list of string filepaths as returned by
+          a search or list call.
+
+        Returned:
+
+        - `status`, one of ok, warn, fail.
+        - `error`, describes the error if status is not set to ok.
+        """
+        response = None
+        try:
+            response = super(MetadataRequest, self).delete(filepaths, **kwargs)
+        finally:
+            if isinstance(filepaths, list):
+                self._record_write(response, filepaths)
+        return response
 
     def get_metadata(self, filepaths, **kwargs):
         """
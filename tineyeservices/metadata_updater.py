@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import hashlib
+import json
+
+from .exception import TinEyeServiceDeadlineExceeded
+from .parallel import DeadlineIterator, call_with_retries, imap_unordered, iter_batches
+from .store import SQLiteStore
+
+
+def serialize_metadata(metadata):
+    """
+    Serialize metadata to the compact JSON string sent to the API.
+
+    Strings are assumed to be serialized already and are sent as is; other
+    values are encoded without whitespace and with sorted keys, so equal
+    metadata always produces the same string and hash.
+    """
+    if isinstance(metadata, str):
+        return metadata
+    return json.dumps(metadata, separators=(',', ':'), sort_keys=True)
+
+
+class MetadataHashStore(SQLiteStore):
+    """
+    SQLite backed record of the metadata hash last sent for each filepath.
+
+    Arguments:
+
+    - `path`, the database file, created if missing.
+    """
+
+    table = 'metadata_hashes'
+
+
+class MetadataUpdater(object):
+    """
+    Stream metadata updates for a whole catalog to a MetadataRequest
+    (MulticolorEngine or WineEngine) in concurrent batches.
+
+        >>> from tineyeservices import MulticolorEngineRequest, MetadataUpdater
+        >>> from tineyeservices.metadata_updater import MetadataHashStore
+        >>> api = MulticolorEngineRequest(api_url='http://localhost/rest/')
+        >>> updater = MetadataUpdater(api, store=MetadataHashStore('metadata.db'))
+        >>> rows = ((row['path'], {'keywords': row['tags']}) for row in catalog)
+        >>> for filepaths, response, error in updater.update(rows):
+        ...     if error is not None or response['status'] != 'ok':
+        ...         print('Failed to update %i images' % len(filepaths))
+        >>> updater.stats
+        {'sent': 1000000, 'skipped': 2500000, 'failed': 0}
+
+    Arguments:
+
+    - `request`, a MetadataRequest subclass instance.
+    - `store`, an optional MetadataHashStore. Rows whose metadata hash matches
+      the stored one are skipped, and hashes are stored once a batch succeeds.
+    - `batch_size`, maximum number of rows per request.
+    - `max_bytes`, maximum size of the filepaths and metadata in a request.
+    - `max_workers`, maximum number of requests in flight at once.
+    - `retries`, number of times a batch is retried after a connection
+      error, timeout or server error.
+    - `backoff`, seconds to wait before the first retry, doubled each time.
+    """
+
+    def __init__(
+            self, request, store=None, batch_size=500, max_bytes=4 * 1024 * 1024,
+            max_workers=4, retries=3, backoff=0.5):
+        self.request = request
+        self.store = store
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {'sent': 0, 'skipped': 0, 'failed': 0}
+        self.deadline_exceeded = False
+
+    def __repr__(self):
+        return "MetadataUpdater(request=%r, store=%r, batch_size=%r)" %\
+               (self.request, self.store, self.batch_size)
+
+    def _changed_rows(self, rows):
+        """ Serialize and hash each row, dropping rows whose hash has not changed. """
+        for filepath, metadata in rows:
+            serialized = serialize_metadata(metadata)
+            digest = hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+            if self.store is not None and self.store.get(filepath) == digest:
+                self.stats['skipped'] += 1
+                continue
+            yield filepath, serialized, digest
+
+    def _send(self, batch, **kwargs):
+        filepaths = [row[0] for row in batch]
+        metadata = [row[1] for row in batch]
+        return call_with_retries(
+            lambda: self.request.update_metadata(filepaths, metadata, **kwargs),
+            retries=self.retries, backoff=self.backoff)
+
+    def update(self, rows, **kwargs):
+        """
+        Send metadata updates for `rows`, yielding each batch result as the
+        requests complete.
+
+        Arguments:
+
+        - `rows`, an iterable of `(filepath, metadata)` pairs, consumed lazily.
+          `metadata` is a JSON string or a JSON serializable value.
+
+        Returned:
+
+        - a generator of `(filepaths, response, error)` tuples, one per batch,
+          where `error` is the exception raised once retries ran out, if any.
+
+        With a deadline on the request, no batch is sent once it has passed
+        and `deadline_exceeded` is set. The rows left are not read.
+        """
+        self.deadline_exceeded = False
+        batches = DeadlineIterator(iter_batches(
+            self._changed_rows(rows), max_count=self.batch_size, max_bytes=self.max_bytes,
+            size=lambda row: len(row[0]) + len(row[1])), self.request.deadline)
+
+        results = imap_unordered(
+            lambda batch: self._send(batch, **kwargs), batches,
+            max_workers=self.max_workers)
+
+        for batch, response, error in results:
+            filepaths = [row[0] for row in batch]
+            if error is None and response.get('status') == 'ok':
+                self.stats['sent'] += len(batch)
+                if self.store is not None:
+                    self.store.put_many((row[0], row[2]) for row in batch)
+            else:
+                self.stats['failed'] += len(batch)
+                if isinstance(error, TinEyeServiceDeadlineExceeded):
+                    self.deadline_exceeded = True
+            yield filepaths, response, error
+        if batches.cut_short:
+            self.deadline_exceeded = True
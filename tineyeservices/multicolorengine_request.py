@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2018 TinEye. All rights reserved worldwide.
 
+from .arrays import (
+    COLOR_MATCH_FIELDS, COUNT_COLOR_FIELDS, EXTRACT_COLOR_FIELDS, SEARCH_RESULT_FORMATS,
+    check_result_format, format_color_response, format_search_response)
+from .color import normalize_colors, normalize_weights
+from .deadline import deadline_response
 from .image import Image
 from .metadata_request import MetadataRequest
+from .parallel import map_with_deadline
 
 
 class MulticolorEngineRequest(MetadataRequest):
@@ -27,14 +33,65 @@ class MulticolorEngineRequest(MetadataRequest):
          'status': 'ok'}
     """
 
+    def __init__(
+            self, api_url='http://localhost/rest/', username=None, password=None,
+            mirror=None, facet_cache=None):
+        super(MulticolorEngineRequest, self).__init__(
+            api_url=api_url, username=username, password=password, mirror=mirror)
+        self.facet_cache = facet_cache
+
     def __repr__(self):
         return "MulticolorEngineRequest(api_url=%r, username=%r, password=%r)" %\
                (self.api_url, self.username, self.password)
 
+    def _record_write(self, response, filepaths, metadata=None):
+        super(MulticolorEngineRequest, self)._record_write(response, filepaths, metadata)
+        if self.facet_cache is not None:
+            self.facet_cache.invalidate()
+
+    def _count_request(self, method, params, **kwargs):
+        """ Make a count request, answering it from the facet cache when possible. """
+        if self.facet_cache is None:
+            return self._request(method, params, **kwargs)
+
+        key = self.facet_cache.key(method, params, kwargs)
+        response = self.facet_cache.get(key)
+        if response is None:
+            generation = self.facet_cache.generation
+            response = self._request(method, params, **kwargs)
+            if response.get('status') == 'ok':
+                self.facet_cache.put(key, response, generation)
+        return response
+
+    def count_facets(self, calls, max_workers=8):
+        """
+        Make many count calls at once, for example one per facet of a browse
+        page, running the calls the facet cache cannot answer concurrently.
+
+        Arguments:
+
+        - `calls`, a list of `(method_name, kwargs)` pairs, such as
+          `('count_metadata_metadata', {'metadata': query, 'count_metadata': facets})`.
+        - `max_workers`, maximum number of requests in flight at once.
+
+        Returned:
+
+        - a list of responses in the same order as `calls`. If the request
+          has a deadline, the calls it cancelled or cut short get a failed
+          response with `deadline_exceeded` set.
+        """
+        def call(item):
+            method, kwargs = item
+            return getattr(self, method)(**kwargs)
+
+        return map_with_deadline(
+            call, calls, self.deadline, max_workers=max_workers,
+            expired=lambda item: deadline_response(item[0]))
+
     def search_image(
             self, image, ignore_background=True, ignore_interior_background=True,
             metadata='', return_metadata='', sort_metadata=False, min_score=0,
-            offset=0, limit=5000, **kwargs):
+            offset=0, limit=5000, result_format='json', **kwargs):
         """
         Do a color search against the collection using image data
         and return matches with corresponding scores.
@@ -53,6 +110,9 @@ class MulticolorEngineRequest(MetadataRequest):
         - `min_score`, minimum score that should be returned.
         - `offset`, offset of results from the start.
         - `limit`, maximum number of matches that should be returned.
+        - `result_format`, 'json' to return the response as sent by the API,
+          'objects' for a SearchResult, 'numpy' for a structured array, 'pandas'
+          for a DataFrame or 'arrow' for a pyarrow Table.
 
         Returned:
 
@@ -63,6 +123,8 @@ class MulticolorEngineRequest(MetadataRequest):
           + `score`, relevance score.
           + `filepath`, match image path.
         """
+        check_result_format(result_format, SEARCH_RESULT_FORMATS)
+
         params = {
             'ignore_background': ignore_background,
             'ignore_interior_background': ignore_interior_background,
@@ -78,12 +140,14 @@ class MulticolorEngineRequest(MetadataRequest):
 
         file_params = {'image': (image.collection_filepath, image.data)}
 
-        return self._request('color_search', params, file_params, **kwargs)
+        response = self._request('color_search', params, file_params, **kwargs)
+
+        return format_search_response(response, result_format, COLOR_MATCH_FIELDS)
 
     def search_filepath(
             self, filepath, ignore_background=True, ignore_interior_background=True,
             metadata='', return_metadata='', sort_metadata=False, min_score=0,
-            offset=0, limit=5000, **kwargs):
+            offset=0, limit=5000, result_format='json', **kwargs):
         """
         Do a color search against the collection using an image already in the
         collection and return matches with corresponding scores.
@@ -102,6 +166,9 @@ class MulticolorEngineRequest(MetadataRequest):
         - `min_score`, minimum score that should be returned.
         - `offset`, offset of results from the start.
         - `limit`, maximum number of matches that should be returned.
+        - `result_format`, 'json' to return the response as sent by the API,
+          'objects' for a SearchResult, 'numpy' for a structured array, 'pandas'
+          for a DataFrame or 'arrow' for a pyarrow Table.
 
         Returned:
 
@@ -112,6 +179,8 @@ class MulticolorEngineRequest(MetadataRequest):
           + `score`, relevance score.
           + `filepath`, match image path.
         """
+        check_result_format(result_format, SEARCH_RESULT_FORMATS)
+
         params = {
             'filepath': filepath,
             'ignore_background': ignore_background,
@@ -123,12 +192,14 @@ class MulticolorEngineRequest(MetadataRequest):
             'offset': offset,
             'limit': limit}
 
-        return self._request('color_search', params, **kwargs)
+        response = self._request('color_search', params, **kwargs)
+
+        return format_search_response(response, result_format, COLOR_MATCH_FIELDS)
 
     def search_url(
             self, url, ignore_background=True, ignore_interior_background=True,
             metadata='', return_metadata='', sort_metadata=False, min_score=0,
-            offset=0, limit=5000, **kwargs):
+            offset=0, limit=5000, result_format='json', **kwargs):
         """
         Do a color search against the collection using an image URL
         and return matches with corresponding scores.
@@ -147,6 +218,9 @@ class MulticolorEngineRequest(MetadataRequest):
         - `min_score`, minimum score that should be returned.
         - `offset`, offset of results from the start.
         - `limit`, maximum number of matches that should be returned.
+        - `result_format`, 'json' to return the response as sent by the API,
+          'objects' for a SearchResult, 'numpy' for a structured array, 'pandas'
+          for a DataFrame or 'arrow' for a pyarrow Table.
 
         Returned:
 
@@ -157,6 +231,8 @@ class MulticolorEngineRequest(MetadataRequest):
           + `score`, relevance score.
           + `filepath`, match image path.
         """
+        check_result_format(result_format, SEARCH_RESULT_FORMATS)
+
         params = {
             'url': url,
             'ignore_background': ignore_background,
@@ -168,21 +244,24 @@ class MulticolorEngineRequest(MetadataRequest):
             'offset': offset,
             'limit': limit}
 
-        return self._request('color_search', params, **kwargs)
+        response = self._request('color_search', params, **kwargs)
+
+        return format_search_response(response, result_format, COLOR_MATCH_FIELDS)
 
     def search_color(
             self, colors, weights=[], ignore_background=True,
             ignore_interior_background=True, metadata='',
             return_metadata='', sort_metadata=False, min_score=0,
-            offset=0, limit=5000, **kwargs):
+            offset=0, limit=5000, result_format='json', **kwargs):
         """
         Do a color search against the collection using specified colors
         and return matches with corresponding scores.
 
         Arguments:
 
-        - `colors`, a list of string of colors in RGB ('255,112,223') or hex ('DF4F23') format.
-        - `weights`, a list of weights.
+        - `colors`, a list of string of colors in RGB ('255,112,223') or hex ('DF4F23') format,
+          (R, G, B) tuples or an (N, 3) numpy array.
+        - `weights`, a list of weights, at least one per color if given.
         - `ignore_background`, if true, ignore the background color of the images,
           if false, include the background color of the images.
         - `ignore_interior_background`, if true, ignore regions that have the same
@@ -194,6 +273,9 @@ class MulticolorEngineRequest(MetadataRequest):
         - `min_score`, minimum score that should be returned.
         - `offset`, offset of results from the start.
         - `limit`, maximum number of matches that should be returned.
+        - `result_format`, 'json' to return the response as sent by the API,
+          'objects' for a SearchResult, 'numpy' for a structured array, 'pandas'
+          for a DataFrame or 'arrow' for a pyarrow Table.
 
         Returned:
 
@@ -204,6 +286,8 @@ class MulticolorEngineRequest(MetadataRequest):
           + `score`, relevance score.
           + `filepath`, match image path.
         """
+        check_result_format(result_format, SEARCH_RESULT_FORMATS)
+
         params = {
             'ignore_background': ignore_background,
             'ignore_interior_background': ignore_interior_background,
@@ -214,8 +298,8 @@ class MulticolorEngineRequest(MetadataRequest):
             'offset': offset,
             'limit': limit}
 
-        if not isinstance(colors, list) or not isinstance(weights, list):
-            raise TypeError('Need to pass lists of colors and weights')
+        colors = normalize_colors(colors)
+        weights = normalize_weights(weights, colors)
 
         counter = 0
         for color in colors:
@@ -224,14 +308,16 @@ class MulticolorEngineRequest(MetadataRequest):
 
         counter = 0
         for weight in weights:
-            params['weights[%i]' % counter] = str(weight)
+            params['weights[%i]' % counter] = weight
             counter += 1
 
-        return self._request('color_search', params, **kwargs)
+        response = self._request('color_search', params, **kwargs)
+
+        return format_search_response(response, result_format, COLOR_MATCH_FIELDS)
 
     def search_metadata(
             self, metadata='', return_metadata='', sort_metadata=False,
-            min_score=0, offset=0, limit=5000, **kwargs):
+            min_score=0, offset=0, limit=5000, result_format='json', **kwargs):
         """
         Do a search against the collection using metadata
         and return matches with corresponding scores.
@@ -244,6 +330,9 @@ class MulticolorEngineRequest(MetadataRequest):
         - `min_score`, minimum score that should be returned.
         - `offset`, offset of results from the start.
         - `limit`, maximum number of matches that should be returned.
+        - `result_format`, 'json' to return the response as sent by the API,
+          'objects' for a SearchResult, 'numpy' for a structured array, 'pandas'
+          for a DataFrame or 'arrow' for a pyarrow Table.
 
         Returned:
 
@@ -254,6 +343,8 @@ class MulticolorEngineRequest(MetadataRequest):
           + `score`, relevance score.
           + `filepath`, match image path.
         """
+        check_result_format(result_format, SEARCH_RESULT_FORMATS)
+
         params = {
             'metadata': metadata,
             'return_metadata': return_metadata,
@@ -262,12 +353,14 @@ class MulticolorEngineRequest(MetadataRequest):
             'offset': offset,
             'limit': limit}
 
-        return self._request('color_search', params, **kwargs)
+        response = self._request('color_search', params, **kwargs)
+
+        return format_search_response(response, result_format, COLOR_MATCH_FIELDS)
 
     def extract_image_colors_image(
             self, images, ignore_background=True,
             ignore_interior_background=True, limit=32,
-            color_format='rgb', **kwargs):
+            color_format='rgb', result_format='json', **kwargs):
         """
         Extract the dominant colors given image upload data.
 
@@ -281,6 +374,9 @@ class MulticolorEngineRequest(MetadataRequest):
           regions.
         - `limit`, maximum number of colors that should be returned.
         - `color_format`, RGB or hex formatted colors, can be either 'rgb' or 'hex'.
+        - `result_format`, 'json' to return the result as sent by the API,
+          'objects' for a ColorResponse, 'numpy' for a structured array or
+          'pandas' for a DataFrame.
 
         Returned:
 
@@ -289,6 +385,8 @@ class MulticolorEngineRequest(MetadataRequest):
         - `result`, a list of dictionaries each representing a color with
           associated ranking and weight.
         """
+        check_result_format(result_format)
+
         params = {
             'limit': limit,
             'ignore_background': ignore_background,
@@ -306,12 +404,14 @@ class MulticolorEngineRequest(MetadataRequest):
             file_params['images[%i]' % counter] = (image.collection_filepath, image.data)
             counter += 1
 
-        return self._request('extract_image_colors', params, file_params, **kwargs)
+        response = self._request('extract_image_colors', params, file_params, **kwargs)
+
+        return format_color_response(response, result_format, EXTRACT_COLOR_FIELDS)
 
     def extract_image_colors_url(
             self, urls, ignore_background=True,
             ignore_interior_background=True, limit=32,
-            color_format='rgb', **kwargs):
+            color_format='rgb', result_format='json', **kwargs):
         """
         Extract the dominant colors given image URLs.
 
@@ -325,6 +425,9 @@ class MulticolorEngineRequest(MetadataRequest):
           regions.
         - `limit`, maximum number of colors that should be returned.
         - `color_format`, RGB or hex formatted colors, can be either 'rgb' or 'hex'.
+        - `result_format`, 'json' to return the result as sent by the API,
+          'objects' for a ColorResponse, 'numpy' for a structured array or
+          'pandas' for a DataFrame.
 
         Returned:
 
@@ -333,6 +436,8 @@ class MulticolorEngineRequest(MetadataRequest):
         - `result`, a list of dictionaries each representing a color with
           associated ranking and weight.
         """
+        check_result_format(result_format)
+
         params = {
             'limit': limit,
             'ignore_background': ignore_background,
@@ -347,11 +452,14 @@ class MulticolorEngineRequest(MetadataRequest):
             params['urls[%i]' % counter] = url
             counter += 1
 
-        return self._request('extract_image_colors', params, **kwargs)
+        response = self._request('extract_image_colors', params, **kwargs)
+
+        return format_color_response(response, result_format, EXTRACT_COLOR_FIELDS)
 
     def count_image_colors_image(
             self, images, ignore_background=True,
-            ignore_interior_background=True, count_colors=[], **kwargs):
+            ignore_interior_background=True, count_colors=[],
+            result_format='json', **kwargs):
         """
         Generate a counter for each color from the palette specifying
         how many of the input images contain that color given image upload data.
@@ -365,7 +473,11 @@ class MulticolorEngineRequest(MetadataRequest):
           color as the background region but that are surrounded by non background
           regions.
         - `count_colors`, a list of colors (palette) which you want to count.
-          Can be rgb "255,255,255" or hex format "ffffff".
+          Can be rgb "255,255,255", hex "ffffff", (R, G, B) tuples
+          or an (N, 3) numpy array.
+        - `result_format`, 'json' to return the result as sent by the API,
+          'objects' for a ColorResponse, 'numpy' for a structured array or
+          'pandas' for a DataFrame.
 
         Returned:
 
@@ -377,6 +489,8 @@ class MulticolorEngineRequest(MetadataRequest):
           + `num_images_partial_area`, the number of images that partially matched the color.
           + `num_images_full_area`, the number of images that fully matched the color.
         """
+        check_result_format(result_format)
+
         params = {
             'ignore_background': ignore_background,
             'ignore_interior_background': ignore_interior_background}
@@ -385,8 +499,7 @@ class MulticolorEngineRequest(MetadataRequest):
         if not isinstance(images, list):
             raise TypeError('Need to pass a list of Image objects')
 
-        if not isinstance(count_colors, list):
-            raise TypeError('Need to pass a list of count_colors')
+        count_colors = normalize_colors(count_colors)
 
         counter = 0
         for count_color in count_colors:
@@ -400,11 +513,14 @@ class MulticolorEngineRequest(MetadataRequest):
             file_params['images[%i]' % counter] = (image.collection_filepath, image.data)
             counter += 1
 
-        return self._request('count_image_colors', params, file_params, **kwargs)
+        response = self._request('count_image_colors', params, file_params, **kwargs)
+
+        return format_color_response(response, result_format, COUNT_COLOR_FIELDS)
 
     def count_image_colors_url(
             self, urls, ignore_background=True,
-            ignore_interior_background=True, count_colors=[], **kwargs):
+            ignore_interior_background=True, count_colors=[],
+            result_format='json', **kwargs):
         """
         Generate a counter for each color from the palette specifying
         how many of the input images contain that color given image URLs.
@@ -418,7 +534,11 @@ class MulticolorEngineRequest(MetadataRequest):
           color as the background region but that are surrounded by non background
           regions.
         - `count_colors`, a list of colors (palette) which you want to count.
-          Can be rgb "255,255,255" or hex format "ffffff".
+          Can be rgb "255,255,255", hex "ffffff", (R, G, B) tuples
+          or an (N, 3) numpy array.
+        - `result_format`, 'json' to return the result as sent by the API,
+          'objects' for a ColorResponse, 'numpy' for a structured array or
+          'pandas' for a DataFrame.
 
         Returned:
 
@@ -430,6 +550,8 @@ class MulticolorEngineRequest(MetadataRequest):
           + `num_images_partial_area`, the number of images that partially matched the color.
           + `num_images_full_area`, the number of images that fully matched the color.
         """
+        check_result_format(result_format)
+
         params = {
             'ignore_background': ignore_background,
             'ignore_interior_background': ignore_interior_background}
@@ -437,8 +559,7 @@ class MulticolorEngineRequest(MetadataRequest):
         if not isinstance(urls, list):
             raise TypeError('Need to pass a list of URL strings')
 
-        if not isinstance(count_colors, list):
-            raise TypeError('Need to pass a list of count_colors')
+        count_colors = normalize_colors(count_colors)
 
         counter = 0
         for count_color in count_colors:
@@ -450,9 +571,13 @@ class MulticolorEngineRequest(MetadataRequest):
             params['urls[%i]' % counter] = url
             counter += 1
 
-        return self._request('count_image_colors', params, **kwargs)
+        response = self._request('count_image_colors', params, **kwargs)
+
+        return format_color_response(response, result_format, COUNT_COLOR_FIELDS)
 
-    def extract_collection_colors(self, limit=32, color_format='rgb', **kwargs):
+    def extract_collection_colors(
+            self, limit=32, color_format='rgb',
+            result_format='json', **kwargs):
         """
         Extract the dominant colors of your collection.
 
@@ -460,6 +585,9 @@ class MulticolorEngineRequest(MetadataRequest):
 
         - `limit`, maximum number of colors that should be returned.
         - `color_format`, RGB or hex formatted colors, can be either 'rgb' or 'hex'.
+        - `result_format`, 'json' to return the result as sent by the API,
+          'objects' for a ColorResponse, 'numpy' for a structured array or
+          'pandas' for a DataFrame.
 
         Returned:
 
@@ -468,11 +596,17 @@ class MulticolorEngineRequest(MetadataRequest):
         - `result`, a list of dictionaries each representing a color with
           associated ranking and weight.
         """
+        check_result_format(result_format)
+
         params = {'limit': limit, 'color_format': color_format}
 
-        return self._request('extract_collection_colors', params, **kwargs)
+        response = self._request('extract_collection_colors', params, **kwargs)
 
-    def extract_collection_colors_metadata(self, metadata, limit=32, color_format='rgb', **kwargs):
+        return format_color_response(response, result_format, EXTRACT_COLOR_FIELDS)
+
+    def extract_collection_colors_metadata(
+            self, metadata, limit=32, color_format='rgb',
+            result_format='json', **kwargs):
         """
         Extract the dominant colors of a set of images given a subset of the collection
         filtered using metadata.
@@ -482,6 +616,9 @@ class MulticolorEngineRequest(MetadataRequest):
         - `metadata`, the metadata to be used for filtering.
         - `limit`, maximum number of colors that should be returned.
         - `color_format`, RGB or hex formatted colors, can be either 'rgb' or 'hex'
+        - `result_format`, 'json' to return the result as sent by the API,
+          'objects' for a ColorResponse, 'numpy' for a structured array or
+          'pandas' for a DataFrame.
 
         Returned:
 
@@ -490,16 +627,20 @@ class MulticolorEngineRequest(MetadataRequest):
         - `result`, a list of dictionaries each representing a color with
           associated ranking and weight.
         """
+        check_result_format(result_format)
+
         params = {
             'metadata': metadata,
             'limit': limit,
             'color_format': color_format}
 
-        return self._request('extract_collection_colors', params, **kwargs)
+        response = self._request('extract_collection_colors', params, **kwargs)
+
+        return format_color_response(response, result_format, EXTRACT_COLOR_FIELDS)
 
     def extract_collection_colors_colors(
             self, colors, weights=[],
-            limit=32, color_format='rgb', **kwargs):
+            limit=32, color_format='rgb', result_format='json', **kwargs):
         """
         Extract the dominant colors of a set of images given a subset of the collection
         filtered using colors.
@@ -507,10 +648,14 @@ class MulticolorEngineRequest(MetadataRequest):
         Arguments:
 
         - `colors`, a list of colors to be used for image filtering.
-          Can be rgb "255,255,255" or hex format "ffffff".
+          Can be rgb "255,255,255", hex "ffffff", (R, G, B) tuples
+          or an (N, 3) numpy array.
         - `weights`, a list of weights to be used with the colors.
         - `limit`, maximum number of colors that should be returned.
         - `color_format`, RGB or hex formatted colors, can be either 'rgb' or 'hex'
+        - `result_format`, 'json' to return the result as sent by the API,
+          'objects' for a ColorResponse, 'numpy' for a structured array or
+          'pandas' for a DataFrame.
 
         Returned:
 
@@ -519,13 +664,12 @@ class MulticolorEngineRequest(MetadataRequest):
         - `result`, a list of dictionaries each representing a color with
           associated ranking and weight.
         """
-        params = {'limit': limit, 'color_format': color_format}
+        check_result_format(result_format)
 
-        if not isinstance(colors, list):
-            raise TypeError('Need to pass a list of colors')
+        params = {'limit': limit, 'color_format': color_format}
 
-        if not isinstance(weights, list):
-            raise TypeError('Need to pass a list of weights')
+        colors = normalize_colors(colors)
+        weights = normalize_weights(weights, colors)
 
         counter = 0
         for color in colors:
@@ -534,12 +678,16 @@ class MulticolorEngineRequest(MetadataRequest):
 
         counter = 0
         for weight in weights:
-            params['weights[%i]' % counter] = weights
+            params['weights[%i]' % counter] = weight
             counter += 1
 
-        return self._request('extract_collection_colors', params, **kwargs)
+        response = self._request('extract_collection_colors', params, **kwargs)
+
+        return format_color_response(response, result_format, EXTRACT_COLOR_FIELDS)
 
-    def extract_collection_colors_filepath(self, filepaths, limit=32, color_format='rgb', **kwargs):
+    def extract_collection_colors_filepath(
+            self, filepaths, limit=32, color_format='rgb',
+            result_format='json', **kwargs):
         """
         Extract the dominant colors of a set of images given a list of filepaths
         already in your collection.
@@ -549,6 +697,9 @@ class MulticolorEngineRequest(MetadataRequest):
         - `filepaths`, a list of string filepaths of images already in the collection.
         - `limit`, maximum number of colors that should be returned.
         - `color_format`, RGB or hex formatted colors, can be either 'rgb' or 'hex'.
+        - `result_format`, 'json' to return the result as sent by the API,
+          'objects' for a ColorResponse, 'numpy' for a structured array or
+          'pandas' for a DataFrame.
 
         Returned:
 
@@ -557,6 +708,8 @@ class MulticolorEngineRequest(MetadataRequest):
         - `result`, a list of dictionaries each representing a color with
           associated ranking and weight.
         """
+        check_result_format(result_format)
+
         params = {'limit': limit, 'color_format': color_format}
         counter = 0
 
@@ -567,9 +720,11 @@ class MulticolorEngineRequest(MetadataRequest):
             params['filepaths[%i]' % counter] = filepath
             counter += 1
 
-        return self._request('extract_collection_colors', params, **kwargs)
+        response = self._request('extract_collection_colors', params, **kwargs)
+
+        return format_color_response(response, result_format, EXTRACT_COLOR_FIELDS)
 
-    def count_collection_colors(self, count_colors, **kwargs):
+    def count_collection_colors(self, count_colors, result_format='json', **kwargs):
         """
         Generate a counter for each color from the specified color palette
         representing how many of the collection images contain that color.
@@ -577,7 +732,11 @@ class MulticolorEngineRequest(MetadataRequest):
         Arguments:
 
         - `count_colors`, a list of colors which you want to count.
-          Can be rgb "255,255,255" or hex format "ffffff".
+          Can be rgb "255,255,255", hex "ffffff", (R, G, B) tuples
+          or an (N, 3) numpy array.
+        - `result_format`, 'json' to return the result as sent by the API,
+          'objects' for a ColorResponse, 'numpy' for a structured array or
+          'pandas' for a DataFrame.
 
         Returned:
 
@@ -589,19 +748,24 @@ class MulticolorEngineRequest(MetadataRequest):
           + `num_images_partial_area`, the number of images that partially matched the color.
           + `num_images_full_area`, the number of images that fully matched the color.
         """
+        check_result_format(result_format)
+
         params = {}
 
-        if not isinstance(count_colors, list):
-            raise TypeError('Need to pass a list of count_colors')
+        count_colors = normalize_colors(count_colors)
 
         counter = 0
         for count_color in count_colors:
             params['count_colors[%i]' % counter] = count_color
             counter += 1
 
-        return self._request('count_collection_colors', params, **kwargs)
+        response = self._count_request('count_collection_colors', params, **kwargs)
 
-    def count_collection_colors_metadata(self, metadata, count_colors, **kwargs):
+        return format_color_response(response, result_format, COUNT_COLOR_FIELDS)
+
+    def count_collection_colors_metadata(
+            self, metadata, count_colors,
+            result_format='json', **kwargs):
         """
         Generate a counter for each color from the specified color palette
         representing how many of the collection images contain that color,
@@ -611,7 +775,11 @@ class MulticolorEngineRequest(MetadataRequest):
 
         - `metadata`, metadata to filter the collection.
         - `count_colors`, a list of colors which you want to count.
-          Can be rgb "255,255,255" or hex format "ffffff".
+          Can be rgb "255,255,255", hex "ffffff", (R, G, B) tuples
+          or an (N, 3) numpy array.
+        - `result_format`, 'json' to return the result as sent by the API,
+          'objects' for a ColorResponse, 'numpy' for a structured array or
+          'pandas' for a DataFrame.
 
         Returned:
 
@@ -623,19 +791,24 @@ class MulticolorEngineRequest(MetadataRequest):
           + `num_images_partial_area`, the number of images that partially matched the color.
           + `num_images_full_area`, the number of images that fully matched the color.
         """
+        check_result_format(result_format)
+
         params = {'metadata': metadata}
 
-        if not isinstance(count_colors, list):
-            raise TypeError('Need to pass a list of count_colors')
+        count_colors = normalize_colors(count_colors)
 
         counter = 0
         for color in count_colors:
             params['count_colors[%i]' % counter] = color
             counter += 1
 
-        return self._request('count_collection_colors', params, **kwargs)
+        response = self._count_request('count_collection_colors', params, **kwargs)
+
+        return format_color_response(response, result_format, COUNT_COLOR_FIELDS)
 
-    def count_collection_colors_colors(self, colors, weights=[], count_colors=[], **kwargs):
+    def count_collection_colors_colors(
+            self, colors, weights=[], count_colors=[],
+            result_format='json', **kwargs):
         """
         Generate a counter for each color from the specified color palette
         representing how many of the collection images contain that color,
@@ -644,10 +817,15 @@ class MulticolorEngineRequest(MetadataRequest):
         Arguments:
 
         - `colors`, a list of colors to be used for image filtering.
-          Can be rgb "255,255,255" or hex format "ffffff".
+          Can be rgb "255,255,255", hex "ffffff", (R, G, B) tuples
+          or an (N, 3) numpy array.
         - `weights`, a list of weights to be used with the colors.
         - `count_colors`, a list of colors which you want to count.
-          Can be rgb "255,255,255" or hex format "ffffff".
+          Can be rgb "255,255,255", hex "ffffff", (R, G, B) tuples
+          or an (N, 3) numpy array.
+        - `result_format`, 'json' to return the result as sent by the API,
+          'objects' for a ColorResponse, 'numpy' for a structured array or
+          'pandas' for a DataFrame.
 
         Returned:
 
@@ -659,16 +837,14 @@ class MulticolorEngineRequest(MetadataRequest):
           + `num_images_partial_area`, the number of images that partially matched the color.
           + `num_images_full_area`, the number of images that fully matched the color.
         """
-        params = {}
+        check_result_format(result_format)
 
-        if not isinstance(colors, list):
-            raise TypeError('Need to pass a list of colors')
+        params = {}
 
-        if not isinstance(weights, list):
-            raise TypeError('Need to pass a list of weights')
+        colors = normalize_colors(colors)
+        weights = normalize_weights(weights, colors)
 
-        if not isinstance(count_colors, list):
-            raise TypeError('Need to pass a list of count_colors')
+        count_colors = normalize_colors(count_colors)
 
         counter = 0
         for color in colors:
@@ -677,7 +853,7 @@ class MulticolorEngineRequest(MetadataRequest):
 
         counter = 0
         for weight in weights:
-            params['weights[%i]' % counter] = weights
+            params['weights[%i]' % counter] = weight
             counter += 1
 
         counter = 0
@@ -685,9 +861,13 @@ class MulticolorEngineRequest(MetadataRequest):
             params['count_colors[%i]' % counter] = count_color
             counter += 1
 
-        return self._request('count_collection_colors', params, **kwargs)
+        response = self._count_request('count_collection_colors', params, **kwargs)
+
+        return format_color_response(response, result_format, COUNT_COLOR_FIELDS)
 
-    def count_collection_colors_filepath(self, filepaths, count_colors, **kwargs):
+    def count_collection_colors_filepath(
+            self, filepaths, count_colors,
+            result_format='json', **kwargs):
         """
         Generate a counter for each color from the specified color palette
         representing how many of the collection images contain that color,
@@ -698,7 +878,11 @@ class MulticolorEngineRequest(MetadataRequest):
         - `filepaths`, a list of string filepaths as returned by
           a search or list call.
         - `count_colors`, a list of colors which you want to count.
-          Can be rgb "255,255,255" or hex format "ffffff".
+          Can be rgb "255,255,255", hex "ffffff", (R, G, B) tuples
+          or an (N, 3) numpy array.
+        - `result_format`, 'json' to return the result as sent by the API,
+          'objects' for a ColorResponse, 'numpy' for a structured array or
+          'pandas' for a DataFrame.
 
         Returned:
 
@@ -710,13 +894,14 @@ class MulticolorEngineRequest(MetadataRequest):
           + `num_images_partial_area`, the number of images that partially matched the color.
           + `num_images_full_area`, the number of images that fully matched the color.
         """
+        check_result_format(result_format)
+
         params = {}
 
         if not isinstance(filepaths, list):
             raise TypeError('Need to pass a list of filepaths')
 
-        if not isinstance(count_colors, list):
-            raise TypeError('Need to pass a list of count_colors')
+        count_colors = normalize_colors(count_colors)
 
         counter = 0
         for filepath in filepaths:
@@ -728,7 +913,9 @@ class MulticolorEngineRequest(MetadataRequest):
             params['count_colors[%i]' % counter] = count_color
             counter += 1
 
-        return self._request('count_collection_colors', params, **kwargs)
+        response = self._count_request('count_collection_colors', params, **kwargs)
+
+        return format_color_response(response, result_format, COUNT_COLOR_FIELDS)
 
     def count_metadata(self, count_metadata, **kwargs):
         """
@@ -755,7 +942,7 @@ class MulticolorEngineRequest(MetadataRequest):
             params['count_metadata[%i]' % counter] = metadata
             counter += 1
 
-        return self._request('count_metadata', params, **kwargs)
+        return self._count_request('count_metadata', params, **kwargs)
 
     def count_metadata_metadata(self, metadata, count_metadata, **kwargs):
         """
@@ -783,7 +970,7 @@ class MulticolorEngineRequest(MetadataRequest):
             params['count_metadata[%i]' % counter] = metadata
             counter += 1
 
-        return self._request('count_metadata', params, **kwargs)
+        return self._count_request('count_metadata', params, **kwargs)
 
     def count_metadata_colors(self, colors, weights=[], count_metadata=[], **kwargs):
         """
@@ -793,7 +980,8 @@ class MulticolorEngineRequest(MetadataRequest):
         Arguments:
 
         - `colors`, a list of colors to be used for image filtering.
-          Can be rgb "255,255,255" or hex format "ffffff".
+          Can be rgb "255,255,255", hex "ffffff", (R, G, B) tuples
+          or an (N, 3) numpy array.
         - `weights`, a list of weights to be used with the colors.
         - `count_metadata`, a list of metadata queries which you want to count.
 
@@ -805,11 +993,8 @@ class MulticolorEngineRequest(MetadataRequest):
         """
         params = {}
 
-        if not isinstance(colors, list):
-            raise TypeError('Need to pass a list of colors')
-
-        if not isinstance(weights, list):
-            raise TypeError('Need to pass a list of weights')
+        colors = normalize_colors(colors)
+        weights = normalize_weights(weights, colors)
 
         if not isinstance(count_metadata, list):
             raise TypeError('Need to pass a list of count_metadata')
@@ -821,7 +1006,7 @@ class MulticolorEngineRequest(MetadataRequest):
 
         counter = 0
         for weight in weights:
-            params['weights[%i]' % counter] = weights
+            params['weights[%i]' % counter] = weight
             counter += 1
 
         counter = 0
@@ -829,7 +1014,7 @@ class MulticolorEngineRequest(MetadataRequest):
             params['count_metadata[%i]' % counter] = metadata
             counter += 1
 
-        return self._request('count_metadata', params, **kwargs)
+        return self._count_request('count_metadata', params, **kwargs)
 
     def count_metadata_filepath(self, filepaths, count_metadata, **kwargs):
         """
@@ -866,4 +1051,4 @@ class MulticolorEngineRequest(MetadataRequest):
             params['count_metadata[%i]' % counter] = metadata
             counter += 1
 
-        return self._request('count_metadata', params, **kwargs)
+        return self._count_request('count_metadata', params, **kwargs)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import binascii
+import os
+
+
+def _quote(value):
+    """ Quote a form field name or filename the way browsers do. """
+    return value.replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+class MultipartEncoder(object):
+    """
+    A multipart/form-data request body that is streamed from the image
+    buffers as it is sent, rather than joined into one new bytes object.
+
+    It is a file-like object with a known length, so requests sends it with
+    a Content-Length header and reads it in small chunks; each chunk is a
+    memoryview of a part header or of an image buffer, so no image bytes are
+    copied.
+
+    Arguments:
+
+    - `fields`, a dictionary mapping field names to `(filename, data)`
+      tuples, as passed to requests as `files`, where `data` is bytes, a
+      bytearray, a memoryview or a string.
+    - `boundary`, the part boundary, random by default.
+    """
+
+    def __init__(self, fields, boundary=None):
+        self.boundary = boundary or binascii.hexlify(os.urandom(16)).decode('ascii')
+        self.content_type = 'multipart/form-data; boundary=%s' % self.boundary
+
+        self.segments = []
+        for name, (filename, data) in fields.items():
+            header = '--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\n\r\n' %\
+                     (self.boundary, _quote(name), _quote(filename))
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            self.segments.append(memoryview(header.encode('utf-8')))
+            self.segments.append(memoryview(data).cast('B'))
+            self.segments.append(memoryview(b'\r\n'))
+        self.segments.append(memoryview(('--%s--\r\n' % self.boundary).encode('ascii')))
+
+        self.length = sum(segment.nbytes for segment in self.segments)
+        self.seek(0)
+
+    def __repr__(self):
+        return "MultipartEncoder(parts=%r, length=%r)" % ((len(self.segments) - 1) // 3, self.length)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(64 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """ Move to a position in the body, so requests can rewind it for a retry. """
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.length
+        self.position = 0
+        self.segment = 0
+        self.offset = 0
+        while self.segment < len(self.segments) and \
+                offset - self.position >= self.segments[self.segment].nbytes:
+            self.position += self.segments[self.segment].nbytes
+            self.segment += 1
+        self.offset = offset - self.position if self.segment < len(self.segments) else 0
+        self.position += self.offset
+        return self.position
+
+    def read(self, size=-1):
+        """
+        Return up to `size` bytes of the body as a memoryview, or all the
+        rest of it as bytes when `size` is negative. Reads stop at part
+        boundaries, and an empty result means the end of the body.
+        """
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                chunk = self.read(64 * 1024)
+                if not chunk:
+                    return b''.join(chunks)
+                chunks.append(chunk)
+
+        while self.segment < len(self.segments):
+            segment = self.segments[self.segment]
+            if self.offset < segment.nbytes:
+                chunk = segment[self.offset:self.offset + size]
+                self.offset += chunk.nbytes
+                self.position += chunk.nbytes
+                return chunk
+            self.segment += 1
+            self.offset = 0
+        return b''
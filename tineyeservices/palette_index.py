@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+
+from .arrays import EXTRACT_COLOR_FIELDS, color_result_array
+from .color import colors_to_array, normalize_colors, normalize_weights
+from .parallel import map_with_deadline
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class PaletteIndex(object):
+    """
+    Local index of image palettes for approximate color search without a
+    round trip to the MulticolorEngine. Requires numpy.
+
+    Each image's palette is stored in one padded uint8 color array and one
+    float32 weight array, so a query scores every image with a few array
+    operations.
+
+        >>> from tineyeservices import MulticolorEngineRequest, PaletteIndex
+        >>> api = MulticolorEngineRequest(api_url='http://localhost/rest/')
+        >>> index = PaletteIndex(request=api)
+        >>> index.add_from_collection(['banana.jpg', 'meloncat.jpg'])
+        >>> index.search(['255,235,0'], limit=1)
+        [{'filepath': 'banana.jpg', 'score': 81.52}]
+
+    Arguments:
+
+    - `request`, an optional MulticolorEngineRequest used to fill the index
+      and to run exact searches.
+    - `palette_size`, maximum number of colors kept per image.
+    - `sigma`, color distance (in RGB units) at which two colors are still
+      considered about 60% similar.
+    """
+
+    def __init__(self, request=None, palette_size=32, sigma=30.0):
+        if numpy is None:
+            raise ImportError('PaletteIndex requires numpy')
+
+        self.request = request
+        self.palette_size = palette_size
+        self.sigma = sigma
+        self.filepaths = []
+        self.metadata = []
+        self.positions = {}
+        # Filepaths by (key, value) of their metadata, for dictionary filters
+        self.keywords = {}
+        self.colors = numpy.zeros((0, palette_size, 3), dtype=numpy.uint8)
+        self.weights = numpy.zeros((0, palette_size), dtype=numpy.float32)
+        self.deadline_exceeded = False
+
+    def __repr__(self):
+        return "PaletteIndex(request=%r, palette_size=%r, sigma=%r)" %\
+               (self.request, self.palette_size, self.sigma)
+
+    def __len__(self):
+        return len(self.filepaths)
+
+    def __contains__(self, filepath):
+        return filepath in self.positions
+
+    def _grow(self, size):
+        """ Make room for at least `size` images, doubling the capacity as needed. """
+        capacity = len(self.weights)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 16)
+        colors = numpy.zeros((capacity, self.palette_size, 3), dtype=numpy.uint8)
+        weights = numpy.zeros((capacity, self.palette_size), dtype=numpy.float32)
+        colors[:len(self)] = self.colors[:len(self)]
+        weights[:len(self)] = self.weights[:len(self)]
+        self.colors = colors
+        self.weights = weights
+
+    def add(self, filepath, colors, weights, metadata=None):
+        """
+        Add an image palette to the index, replacing any previous palette for
+        the same filepath.
+
+        Arguments:
+
+        - `filepath`, the collection filepath of the image.
+        - `colors`, the palette colors in any format accepted by
+          `tineyeservices.color.colors_to_array`.
+        - `weights`, the weight of each palette color.
+        - `metadata`, an optional dictionary used to prefilter searches.
+        """
+        colors = colors_to_array(colors)[:self.palette_size]
+        weights = numpy.asarray(weights, dtype=numpy.float32)[:self.palette_size]
+        if len(colors) != len(weights):
+            raise ValueError('Need one weight per palette color')
+
+        position = self.positions.get(filepath)
+        if position is None:
+            position = len(self)
+            self._grow(position + 1)
+            self.filepaths.append(filepath)
+            self.metadata.append(metadata)
+            self.positions[filepath] = position
+            self._index_metadata(filepath, metadata)
+        elif metadata is not None:
+            self._unindex_metadata(filepath, self.metadata[position])
+            self.metadata[position] = metadata
+            self._index_metadata(filepath, metadata)
+
+        total = weights.sum()
+        self.colors[position] = 0
+        self.weights[position] = 0
+        self.colors[position, :len(colors)] = colors
+        self.weights[position, :len(weights)] = weights / total if total > 0 else weights
+
+    def add_result(self, filepath, result, metadata=None):
+        """
+        Add the palette extracted for a single image.
+
+        Arguments:
+
+        - `filepath`, the collection filepath of the image.
+        - `result`, the `result` of an `extract_image_colors_*` or
+          `extract_collection_colors_filepath` response for that image alone,
+          either the JSON list or a numpy structured array.
+        - `metadata`, an optional dictionary used to prefilter searches.
+        """
+        if not isinstance(result, numpy.ndarray):
+            result = color_result_array(result, EXTRACT_COLOR_FIELDS)
+        self.add(filepath, result['color'], result['weight'], metadata)
+
+    def add_from_collection(self, filepaths, metadata=None, max_workers=8, **kwargs):
+        """
+        Extract and add the palettes of images already in the collection,
+        running up to `max_workers` extractions at once.
+
+        Arguments:
+
+        - `filepaths`, a list of collection filepaths.
+        - `metadata`, an optional list of metadata dictionaries, one per filepath.
+
+        With a deadline on the request, extractions not done by the time it
+        passes are dropped, the palettes extracted by then are added and
+        `deadline_exceeded` is set.
+        """
+        if self.request is None:
+            raise ValueError('PaletteIndex needs a request to extract palettes')
+
+        def extract(filepath):
+            return self.request.extract_collection_colors_filepath(
+                [filepath], limit=self.palette_size, result_format='numpy', **kwargs)
+
+        responses = map_with_deadline(extract, filepaths, self.request.deadline, max_workers=max_workers)
+        self.deadline_exceeded = False
+        for i, (filepath, response) in enumerate(zip(filepaths, responses)):
+            if response is None:
+                self.deadline_exceeded = True
+                continue
+            self.add_result(filepath, response['result'],
+                            metadata[i] if metadata is not None else None)
+
+    def remove(self, filepath):
+        """ Remove an image from the index by moving the last image into its slot. """
+        position = self.positions.pop(filepath)
+        self._unindex_metadata(filepath, self.metadata[position])
+        last = len(self) - 1
+        if position != last:
+            moved = self.filepaths[last]
+            self.filepaths[position] = moved
+            self.metadata[position] = self.metadata[last]
+            self.colors[position] = self.colors[last]
+            self.weights[position] = self.weights[last]
+            self.positions[moved] = position
+        self.filepaths.pop()
+        self.metadata.pop()
+        self.colors[last] = 0
+        self.weights[last] = 0
+
+    def _index_metadata(self, filepath, metadata):
+        for keyword in _keywords(metadata):
+            self.keywords.setdefault(keyword, set()).add(filepath)
+
+    def _unindex_metadata(self, filepath, metadata):
+        for keyword in _keywords(metadata):
+            filepaths = self.keywords.get(keyword)
+            if filepaths is not None:
+                filepaths.discard(filepath)
+                if not filepaths:
+                    del self.keywords[keyword]
+
+    def _rows(self, metadata):
+        """ Return the positions of the images whose metadata passes the filter, or None for all. """
+        if metadata is None:
+            return None
+        if callable(metadata) or not all(_indexable(value) for value in metadata.values()):
+            return numpy.flatnonzero(self._mask(metadata))
+
+        matches = None
+        for keyword in metadata.items():
+            found = self.keywords.get(keyword, set())
+            matches = set(found) if matches is None else matches & found
+            if not matches:
+                break
+        if matches is None:
+            # An empty filter passes every image with metadata
+            matches = [f for f, m in zip(self.filepaths, self.metadata) if m is not None]
+        rows = numpy.fromiter((self.positions[f] for f in matches), dtype=numpy.intp, count=len(matches))
+        rows.sort()
+        return rows
+
+    def _mask(self, metadata):
+        """ Return a boolean mask of the images whose metadata passes the filter. """
+        if callable(metadata):
+            match = metadata
+        else:
+            def match(image_metadata):
+                if image_metadata is None:
+                    return False
+                for key, value in metadata.items():
+                    found = image_metadata.get(key)
+                    if isinstance(found, (list, tuple, set)):
+                        if value not in found:
+                            return False
+                    elif found != value:
+                        return False
+                return True
+        return numpy.fromiter((match(m) for m in self.metadata), dtype=bool, count=len(self))
+
+    def scores(self, colors, weights=None, chunk_size=4096, rows=None):
+        """
+        Score the indexed images against a query palette.
+
+        The score is the weighted overlap between the two palettes, where two
+        colors overlap by exp(-d^2 / (2 sigma^2)) of their RGB distance d,
+        scaled to 0-100.
+
+        `rows` is an optional array of the positions of the images to score,
+        by default every image.
+
+        Returned:
+
+        - a float32 array with one score per image in index order, or per
+          position of `rows`.
+        """
+        query = colors_to_array(colors).astype(numpy.float32)
+        if weights is None or len(weights) == 0:
+            query_weights = numpy.ones(len(query), dtype=numpy.float32)
+        else:
+            query_weights = numpy.asarray(
+                normalize_weights(weights, query), dtype=numpy.float32)[:len(query)]
+        total = query_weights.sum()
+        if not total > 0:
+            raise ValueError('Query weights must not all be zero')
+        query_weights = query_weights / total
+
+        count = len(self) if rows is None else len(rows)
+
+        # Work in chunks so the (images, palette, query) distance array stays small
+        scores = numpy.empty(count, dtype=numpy.float32)
+        scale = -1.0 / (2 * self.sigma ** 2)
+        for start in range(0, count, chunk_size):
+            stop = min(start + chunk_size, count)
+            selected = slice(start, stop) if rows is None else rows[start:stop]
+            palette = self.colors[selected].astype(numpy.float32)
+            difference = palette[:, :, numpy.newaxis, :] - query[numpy.newaxis, numpy.newaxis, :, :]
+            similarity = numpy.exp((difference ** 2).sum(axis=3) * scale)
+            overlap = numpy.einsum('ij,ijk,k->i', self.weights[selected], similarity, query_weights)
+            scores[start:stop] = overlap * 100
+        return scores
+
+    def search(self, colors, weights=None, metadata=None, min_score=0, limit=10,
+               exact=False, **kwargs):
+        """
+        Find the images whose palettes are most similar to the given colors.
+
+        Arguments:
+
+        - `colors`, the query colors in any format accepted by
+          `tineyeservices.color.normalize_colors`.
+        - `weights`, an optional list of weights, one per color.
+        - `metadata`, an optional prefilter, either a dictionary of values the
+          image metadata must contain or a callable taking the image metadata
+          and returning True to keep the image.
+        - `min_score`, minimum score that should be returned.
+        - `limit`, maximum number of matches that should be returned.
+        - `exact`, if true, skip the index and run `search_color` on the
+          engine instead; extra keyword arguments are passed through. The
+          `metadata` prefilter must then be a JSON string or dictionary as
+          expected by the engine.
+
+        Returned:
+
+        - a list of dictionaries with `filepath` and `score`, best first. With
+          `exact` set, the engine response is returned as is.
+        """
+        if exact:
+            if self.request is None:
+                raise ValueError('PaletteIndex needs a request for exact searches')
+            if callable(metadata):
+                raise ValueError('Exact searches need metadata as a dictionary or JSON string')
+            if metadata is None:
+                metadata = ''
+            elif not isinstance(metadata, str):
+                metadata = json.dumps(metadata)
+            return self.request.search_color(
+                normalize_colors(colors), weights=[] if weights is None else weights,
+                metadata=metadata, min_score=min_score, limit=limit, **kwargs)
+
+        if len(self) == 0 or limit <= 0:
+            return []
+
+        # Only score the images passing the metadata prefilter
+        rows = self._rows(metadata)
+        scores = self.scores(colors, weights, rows=rows)
+        if rows is None:
+            rows = numpy.arange(len(self))
+        candidates = numpy.flatnonzero(scores >= max(min_score, 0))
+        if len(candidates) > limit:
+            top = numpy.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        candidates = candidates[numpy.argsort(-scores[candidates], kind='stable')]
+        return [{'filepath': self.filepaths[rows[i]], 'score': round(float(scores[i]), 2)}
+                for i in candidates]
+
+    def save(self, path):
+        """ Save the index to a numpy .npz file, with no pickled objects. """
+        size = len(self)
+        numpy.savez_compressed(
+            path, colors=self.colors[:size], weights=self.weights[:size],
+            filepaths=numpy.array(self.filepaths, dtype=str),
+            metadata=numpy.array([json.dumps(m) for m in self.metadata], dtype=str),
+            sigma=numpy.float64(self.sigma))
+
+    @classmethod
+    def load(cls, path, request=None, sigma=None):
+        """ Load an index saved with `save`, with the saved `sigma` unless another is given. """
+        with numpy.load(path, allow_pickle=False) as data:
+            if sigma is None:
+                sigma = float(data['sigma']) if 'sigma' in data else 30.0
+            index = cls(request=request, palette_size=data['colors'].shape[1], sigma=sigma)
+            index.colors = data['colors'].copy()
+            index.weights = data['weights'].copy()
+            index.filepaths = data['filepaths'].tolist()
+            index.metadata = [json.loads(m) for m in data['metadata'].tolist()]
+        index.positions = dict((filepath, i) for i, filepath in enumerate(index.filepaths))
+        for filepath, metadata in zip(index.filepaths, index.metadata):
+            index._index_metadata(filepath, metadata)
+        return index
+
+
+def _keywords(metadata):
+    """ Yield the hashable `(key, value)` pairs of `metadata`, one per value of list values. """
+    if not isinstance(metadata, dict):
+        return
+    for key, value in metadata.items():
+        for item in (value if isinstance(value, (list, tuple, set)) else [value]):
+            try:
+                hash(item)
+            except TypeError:
+                continue
+            yield key, item
+
+
+def _indexable(value):
+    """ Whether a dictionary filter value can be looked up in the keyword index. """
+    if value is None or isinstance(value, (list, tuple, set, dict)):
+        return False
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+
+from .exception import TinEyeServiceDeadlineExceeded
+
+
+def iter_batches(items, max_count=None, max_bytes=None, size=None):
+    """
+    Group an iterable into lists bounded by item count and total byte size.
+
+    An item larger than `max_bytes` on its own is still yielded, alone in
+    its batch.
+
+        >>> from tineyeservices.parallel import iter_batches
+        >>> list(iter_batches(range(5), max_count=2))
+        [[0, 1], [2, 3], [4]]
+
+    Arguments:
+
+    - `items`, any iterable, consumed lazily.
+    - `max_count`, maximum number of items per batch.
+    - `max_bytes`, maximum total size per batch.
+    - `size`, a function returning the size of an item in bytes, required
+      with `max_bytes`.
+    """
+    if max_bytes is not None and size is None:
+        raise ValueError('iter_batches needs a size function with max_bytes')
+
+    batch = []
+    batch_bytes = 0
+    for item in items:
+        item_bytes = size(item) if max_bytes is not None else 0
+        if batch and ((max_count is not None and len(batch) >= max_count) or
+                      (max_bytes is not None and batch_bytes + item_bytes > max_bytes)):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(item)
+        batch_bytes += item_bytes
+    if batch:
+        yield batch
+
+
+def is_retryable(error):
+    """ Whether a request error is worth retrying: connection problems, timeouts and 5xx responses. """
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def call_with_retries(func, retries=3, backoff=0.5, retryable=is_retryable):
+    """
+    Call `func` with no arguments, retrying up to `retries` times when it
+    raises an error accepted by `retryable`, sleeping `backoff` seconds
+    doubled on each attempt in between.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= retries or not retryable(e):
+                raise
+            time.sleep(backoff * 2 ** attempt)
+            attempt += 1
+
+
+def imap_unordered(func, items, max_workers=8, max_pending=None, cost=None, max_cost=None):
+    """
+    Call `func` on every item on a thread pool and yield `(item, result, error)`
+    tuples as the calls complete, in completion order.
+
+    Items are pulled from `items` lazily and only `max_pending` calls (and
+    about `max_cost` total cost, when given) are queued or running at any
+    time, so memory stays bounded when `items` is a large generator.
+
+    Arguments:
+
+    - `func`, a function taking one item.
+    - `items`, any iterable.
+    - `max_workers`, number of threads.
+    - `max_pending`, maximum number of calls queued or running, defaults to
+      twice `max_workers`.
+    - `cost`, a function returning the cost of an item, such as its size.
+    - `max_cost`, new calls are only started while the total cost of the
+      calls queued or running is below this, so it can be exceeded by at
+      most one item.
+
+    `error` is the exception raised by `func`, or None; `result` is None
+    when an error was raised.
+    """
+    if max_pending is None:
+        max_pending = 2 * max_workers
+
+    pending = {}
+    pending_cost = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        items = iter(items)
+        exhausted = False
+        while not exhausted or pending:
+            # Submit as much work as the limits allow
+            while not exhausted:
+                if len(pending) >= max_pending or \
+                        (max_cost is not None and pending and pending_cost >= max_cost):
+                    break
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                item_cost = cost(item) if cost is not None else 0
+                pending[executor.submit(func, item)] = (item, item_cost)
+                pending_cost += item_cost
+
+            if not pending:
+                continue
+
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                item, item_cost = pending.pop(future)
+                pending_cost -= item_cost
+                error = future.exception()
+                yield item, (None if error is not None else future.result()), error
+
+
+def map_with_deadline(func, items, deadline=None, max_workers=8, expired=None):
+    """
+    Call `func` on every item on a thread pool and return the list of
+    results in the order of `items`, stopping at `deadline`.
+
+    Returns once every call is done or the deadline passes, whichever comes
+    first. Calls not started by then are cancelled, calls still running are
+    left to finish in the background, and calls that raised
+    TinEyeServiceDeadlineExceeded were cut short; all of them get
+    `expired(item)` as their result, or None without `expired`. Any other
+    error is raised. With no deadline this is the same as `executor.map`.
+
+    Arguments:
+
+    - `func`, a function taking one item.
+    - `items`, any iterable.
+    - `deadline`, a Deadline or None.
+    - `max_workers`, number of threads.
+    - `expired`, a function returning the result standing in for an item
+      whose call was cancelled or cut short.
+    """
+    items = list(items)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [executor.submit(func, item) for item in items]
+        wait(futures, timeout=deadline.remaining() if deadline is not None else None)
+    finally:
+        # Do not wait for running calls: their read timeout bounds each socket
+        # read rather than the whole call, so they can outlast the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for item, future in zip(items, futures):
+        if not future.done() or future.cancelled() or \
+                isinstance(future.exception(), TinEyeServiceDeadlineExceeded):
+            results.append(expired(item) if expired is not None else None)
+        else:
+            results.append(future.result())
+    return results
+
+
+class DeadlineIterator(object):
+    """
+    Iterate over `items` until `deadline` passes, so helpers feeding work to
+    a thread pool stop scheduling new calls at the deadline.
+
+    An item pulled once the deadline has passed is dropped, and an iterable
+    raising TinEyeServiceDeadlineExceeded, such as `iter_list`, just ends.
+    Either way `cut_short` is set. With no deadline every item is yielded.
+    """
+
+    def __init__(self, items, deadline=None):
+        self.items = iter(items)
+        self.deadline = deadline
+        self.cut_short = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.cut_short:
+            raise StopIteration
+        try:
+            item = next(self.items)
+        except TinEyeServiceDeadlineExceeded:
+            self.cut_short = True
+            raise StopIteration
+        if self.deadline is not None and self.deadline.expired:
+            self.cut_short = True
+            raise StopIteration
+        return item
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import abc
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .image import Image
+from .parallel import iter_batches
+from .tuner import tuned
+
+# Marks the end of the items flowing into a stage
+_DONE = object()
+
+
+class PipelineStopped(Exception):
+    """ Raised inside stage threads once the pipeline is stopping. """
+    pass
+
+
+class Stage(abc.ABC):
+    """
+    One step of a Pipeline with its throughput counters. Subclasses
+    implement `run`.
+
+    - `processed`, number of items the stage has output.
+    - `errors`, number of items the stage failed on.
+    - `busy`, total seconds spent by the workers in the stage function.
+    """
+
+    def __init__(self, name, workers=1, processes=False):
+        self.name = name
+        self.workers = workers
+        self.processes = processes
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.input = None
+
+    def __repr__(self):
+        return "Stage(name=%r, workers=%r, processes=%r)" % (self.name, self.workers, self.processes)
+
+    def record(self, seconds, error=False):
+        with self.lock:
+            self.busy += seconds
+            if error:
+                self.errors += 1
+            else:
+                self.processed += 1
+
+    @abc.abstractmethod
+    def run(self, pipeline, inputs, output):
+        """
+        Return the threads, not yet started, that run the stage.
+
+        The threads consume the `inputs` iterable, hand each output item to
+        `pipeline.put(output, item)` and report failed items with
+        `pipeline.fail`. Once the inputs are exhausted or the pipeline raises
+        PipelineStopped, the last thread to finish calls `pipeline.end(output)`
+        exactly once.
+        """
+
+
+class MapStage(Stage):
+    """ Stage calling a function on each item, on threads or on worker processes. """
+
+    def __init__(self, name, func, workers=1, processes=False):
+        super(MapStage, self).__init__(name, workers, processes)
+        self.func = func
+
+    def run(self, pipeline, inputs, output):
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.processes else None
+        remaining = [self.workers]
+        lock = threading.Lock()
+
+        def work():
+            try:
+                for item in inputs:
+                    start = time.time()
+                    try:
+                        if executor is not None:
+                            result = executor.submit(self.func, item).result()
+                        else:
+                            result = self.func(item)
+                    except Exception as e:
+                        self.record(time.time() - start, error=True)
+                        pipeline.fail(self.name, item, e)
+                        continue
+                    self.record(time.time() - start)
+                    pipeline.put(output, result)
+            except PipelineStopped:
+                pass
+            finally:
+                # The last worker to finish ends the stream for the next stage
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    if executor is not None:
+                        executor.shutdown()
+                    pipeline.end(output)
+
+        return [threading.Thread(target=work, name='%s-%i' % (self.name, i))
+                for i in range(self.workers)]
+
+
+class BatchStage(Stage):
+    """ Stage grouping items into lists bounded by count and size, see `iter_batches`. """
+
+    def __init__(self, name, max_count=None, max_bytes=None, size=None):
+        super(BatchStage, self).__init__(name)
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.size = size
+
+    def run(self, pipeline, inputs, output):
+        def work():
+            try:
+                for batch in iter_batches(inputs, max_count=self.max_count,
+                                          max_bytes=self.max_bytes, size=self.size):
+                    self.record(0)
+                    pipeline.put(output, batch)
+            except PipelineStopped:
+                pass
+            finally:
+                pipeline.end(output)
+
+        return [threading.Thread(target=work, name=self.name)]
+
+
+class Pipeline(object):
+    """
+    Streaming pipeline of stages connected by bounded queues, so a fast stage
+    waits for slower ones instead of filling memory.
+
+    Each stage runs on its own threads, or on worker processes for CPU bound
+    functions, and items flow from the source through every stage to the
+    caller as they are ready; the output order is not guaranteed.
+
+        >>> from tineyeservices import MatchEngineRequest, Pipeline
+        >>> api = MatchEngineRequest(api_url='http://localhost/rest/')
+        >>> pipeline = Pipeline.ingest(api, batch_size=100, upload_workers=4)
+        >>> for batch, response in pipeline.run(paths):
+        ...     if response['status'] != 'ok':
+        ...         print(response['error'])
+        >>> pipeline.metrics()['upload']
+        {'processed': 250, 'errors': 0, 'throughput': 4.1, 'utilization': 0.97, 'queued': 64}
+
+    Stages are added with `map` and `batch`, which return the pipeline so
+    calls can be chained.
+
+    Arguments:
+
+    - `max_queued`, maximum number of items waiting between two stages.
+    """
+
+    def __init__(self, max_queued=64):
+        self.max_queued = max_queued
+        self.stages = []
+        self.started = None
+        self.stopping = threading.Event()
+        self.error = None
+        self.on_error = None
+
+    def __repr__(self):
+        return "Pipeline(stages=%r, max_queued=%r)" % ([s.name for s in self.stages], self.max_queued)
+
+    def map(self, func, workers=1, processes=False, name=None):
+        """
+        Add a stage calling `func` on each item and passing on the result.
+
+        Arguments:
+
+        - `func`, a function taking one item. It must be picklable, as must
+          the items, when `processes` is true.
+        - `workers`, number of threads, or of processes, running the stage.
+        - `processes`, if true, run `func` on worker processes.
+        - `name`, the stage name used in `metrics`.
+        """
+        self.stages.append(MapStage(name or 'stage%i' % len(self.stages), func, workers, processes))
+        return self
+
+    def batch(self, max_count=None, max_bytes=None, size=None, name='batch'):
+        """
+        Add a stage grouping items into lists of at most `max_count` items
+        and `max_bytes` total `size`.
+        """
+        self.stages.append(BatchStage(name, max_count, max_bytes, size))
+        return self
+
+    @classmethod
+    def ingest(
+            cls, request, read_workers=8, batch_size=None, max_bytes=32 * 1024 * 1024,
+            upload_workers=None, max_queued=64, check=False, **kwargs):
+        """
+        Return a pipeline reading image files and adding them to the collection.
+
+        The source items are Image objects, lazy ones included, or paths to
+        image files, and the pipeline yields an `(images, response)` tuple per
+        `add_image` call. Extra keyword arguments are passed to `add_image`.
+
+        With `check` set, each image header is checked with `Image.check`
+        once read, and invalid images are failed in the 'read' stage instead
+        of being uploaded.
+
+        `batch_size` and `upload_workers` default to the `add_image` settings
+        tuned for the engine by a Tuner, or 100 and 4.
+        """
+        if batch_size is None:
+            batch_size = tuned(request, 'add_image', 'batch_size', 100)
+        if upload_workers is None:
+            upload_workers = tuned(request, 'add_image', 'workers', 4)
+
+        def read(item):
+            image = item if isinstance(item, Image) else Image(filepath=item)
+            # Read lazy images here, on the read workers
+            image.data
+            if check:
+                image.check()
+            return image
+
+        def upload(images):
+            return images, request.add_image(images, **kwargs)
+
+        return cls(max_queued=max_queued)\
+            .map(read, workers=read_workers, name='read')\
+            .batch(max_count=batch_size, max_bytes=max_bytes,
+                   size=lambda image: len(image.data or b''))\
+            .map(upload, workers=upload_workers, name='upload')
+
+    def put(self, output, item):
+        """ Put an item on a stage queue, giving up once the pipeline is stopping. """
+        while True:
+            if self.stopping.is_set():
+                raise PipelineStopped()
+            try:
+                output.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def end(self, output):
+        """ Mark the end of the items put on a stage queue. """
+        try:
+            self.put(output, _DONE)
+        except PipelineStopped:
+            pass
+
+    def fail(self, stage, item, error):
+        """ Handle an error raised by a stage function on an item. """
+        if self.on_error is not None:
+            self.on_error(stage, item, error)
+            return
+        if self.error is None:
+            self.error = error
+        self.stopping.set()
+        raise PipelineStopped()
+
+    def _iter_queue(self, items):
+        while True:
+            if self.stopping.is_set():
+                raise PipelineStopped()
+            try:
+                item = items.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    def run(self, source, on_error=None):
+        """
+        Run the pipeline on the items of `source`, yielding the output of
+        the last stage as it is ready.
+
+        Arguments:
+
+        - `source`, any iterable, consumed lazily.
+        - `on_error`, a function called with the stage name, the item and the
+          exception when a stage function raises. The item is then dropped.
+          By default the pipeline stops and the exception is raised here.
+        """
+        if not self.stages:
+            raise ValueError('Pipeline has no stages')
+
+        self.on_error = on_error
+        self.error = None
+        self.stopping.clear()
+        self.started = time.time()
+
+        queues = [queue.Queue(maxsize=self.max_queued) for _ in range(len(self.stages) + 1)]
+
+        def feed():
+            try:
+                for item in source:
+                    self.put(queues[0], item)
+            except PipelineStopped:
+                pass
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+                self.stopping.set()
+            finally:
+                self.end(queues[0])
+
+        threads = [threading.Thread(target=feed, name='source')]
+        for i, stage in enumerate(self.stages):
+            stage.reset()
+            stage.input = queues[i]
+            threads += stage.run(self, _SharedIterator(self, queues[i]), queues[i + 1])
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for item in self._iter_queue(queues[-1]):
+                yield item
+        except PipelineStopped:
+            pass
+        finally:
+            self.stopping.set()
+            for thread in threads:
+                thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def metrics(self):
+        """
+        Return a dictionary of throughput counters per stage name:
+
+        - `processed`, `errors`, number of items output and failed.
+        - `throughput`, items output per second since the pipeline started.
+        - `utilization`, fraction of the stage workers' time spent working.
+          The stage closest to 1 is the bottleneck.
+        - `queued`, number of items waiting in front of the stage.
+        """
+        elapsed = max(time.time() - self.started, 1e-9) if self.started else 1e-9
+        metrics = {}
+        for stage in self.stages:
+            with stage.lock:
+                metrics[stage.name] = {
+                    'processed': stage.processed,
+                    'errors': stage.errors,
+                    'throughput': stage.processed / elapsed,
+                    'utilization': stage.busy / (elapsed * stage.workers),
+                    'queued': stage.input.qsize() if stage.input is not None else 0}
+        return metrics
+
+    def bottleneck(self):
+        """ Return the name of the stage with the highest utilization. """
+        metrics = self.metrics()
+        return max(metrics, key=lambda name: metrics[name]['utilization'])
+
+
+class _SharedIterator(object):
+    """ Iterator over a stage queue shared by several worker threads. """
+
+    def __init__(self, pipeline, items):
+        self.iterator = pipeline._iter_queue(items)
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.lock:
+            return next(self.iterator)
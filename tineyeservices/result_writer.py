@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+import threading
+
+from .arrays import MATCH_FIELDS, match_result_table, numpy, pandas, pyarrow
+from .results import ResultObject
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pass
+
+
+class ParquetResultWriter(object):
+    """
+    Append the matches of many search or compare calls to one Parquet file,
+    for offline analysis of large batches of queries.
+
+    Matches are collected in memory and written as one row group every
+    `row_group_size` rows, so small responses do not make small row groups.
+    The file is complete once the writer is closed, and is only created
+    when the first row group is written.
+
+        >>> from tineyeservices import MatchEngineRequest, ParquetResultWriter
+        >>> api = MatchEngineRequest(api_url='http://localhost/rest/')
+        >>> with ParquetResultWriter('matches.parquet') as writer:
+        ...     for url in urls:
+        ...         writer.append(api.search_url(url, result_format='arrow'), query=url)
+        >>> writer.rows
+        48210
+
+    Arguments:
+
+    - `path`, the Parquet file to write, replaced if it exists.
+    - `row_group_size`, number of rows per row group.
+    - `compression`, the Parquet compression codec.
+    - `fields`, the fields of JSON matches, `MATCH_FIELDS` for MatchEngine,
+      MobileEngine and WineEngine or `COLOR_MATCH_FIELDS` for
+      MulticolorEngine. Responses in the 'arrow' or 'pandas' format keep
+      their own columns.
+
+    Metadata is stored as JSON strings whatever the result format. Every
+    appended response must have the same columns: mixing calls with and
+    without `return_metadata`, or with and without a `query`, raises
+    ValueError and leaves the matches already appended as they were.
+    """
+
+    def __init__(self, path, row_group_size=64 * 1024, compression='snappy', fields=MATCH_FIELDS):
+        if pyarrow is None:
+            raise ImportError('ParquetResultWriter requires pyarrow')
+        self.path = path
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.fields = fields
+        self.lock = threading.Lock()
+        self.writer = None
+        self.tables = []
+        self.schema = None
+        self.buffered = 0
+        self.rows = 0
+        self.closed = False
+
+    def __repr__(self):
+        return "ParquetResultWriter(path=%r, rows=%r)" % (self.path, self.rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _table(self, response):
+        """ Return the matches of a response as a pyarrow Table. """
+        if isinstance(response, ResultObject):
+            response = response.to_dict()
+        result = response.get('result')
+        if isinstance(result, pyarrow.Table):
+            return result
+        if pandas is not None and isinstance(result, pandas.DataFrame):
+            return _dataframe_table(result)
+        if numpy is not None and isinstance(result, numpy.ndarray):
+            result = [dict(zip(result.dtype.names, row)) for row in result.tolist()]
+        return match_result_table(result or [], self.fields)
+
+    def append(self, response, query=None):
+        """
+        Add the matches of a search or compare response, in any search
+        result format, with the same columns as the matches already
+        appended. If `query` is given, it is stored in a first `query` column
+        so the matches of each query can be told apart.
+
+        Returns the number of matches added.
+        """
+        table = self._table(response)
+        if query is not None:
+            table = table.add_column(
+                0, 'query', pyarrow.array([query] * table.num_rows, type=pyarrow.string()))
+        if not table.num_rows:
+            return 0
+
+        with self.lock:
+            if self.closed:
+                raise ValueError('ParquetResultWriter is closed')
+            if self.schema is None:
+                self.schema = table.schema
+            elif not table.schema.equals(self.schema):
+                raise ValueError('Matches have columns %s, not %s' %
+                                 (table.schema.names, self.schema.names))
+            self.tables.append(table)
+            self.buffered += table.num_rows
+            self.rows += table.num_rows
+            if self.buffered >= self.row_group_size:
+                self._write(full_only=True)
+        return table.num_rows
+
+    def extend(self, responses):
+        """ Add the matches of an iterable of `(query, response)` pairs. """
+        for query, response in responses:
+            self.append(response, query=query)
+
+    def _write(self, full_only=False):
+        """ Write the buffered matches, keeping back a last partial row group if `full_only`. """
+        if not self.tables:
+            return
+        table = pyarrow.concat_tables(self.tables)
+        size = table.num_rows
+        if full_only:
+            size -= size % self.row_group_size
+        if self.writer is None:
+            self.writer = pyarrow.parquet.ParquetWriter(
+                self.path, table.schema, compression=self.compression)
+        self.writer.write_table(table.slice(0, size), row_group_size=self.row_group_size)
+        rest = table.slice(size)
+        self.tables = [rest] if rest.num_rows else []
+        self.buffered = rest.num_rows
+
+    def flush(self):
+        """ Write the buffered matches as a row group. """
+        with self.lock:
+            self._write()
+
+    def close(self):
+        """ Write the buffered matches and close the file. """
+        with self.lock:
+            try:
+                self._write()
+            finally:
+                self.closed = True
+                if self.writer is not None:
+                    self.writer.close()
+                    self.writer = None
+
+
+def _dataframe_table(frame):
+    """ Convert a DataFrame of matches to a Table with the columns `match_result_table` makes. """
+    arrays = []
+    for name in frame.columns:
+        column = frame[name]
+        if name == 'metadata':
+            values = [json.dumps(value) if value is not None and not isinstance(value, str) else value
+                      for value in column.tolist()]
+            arrays.append(pyarrow.array(values, type=pyarrow.string()))
+        elif column.dtype == object:
+            arrays.append(pyarrow.array(column.tolist(), type=pyarrow.string()))
+        else:
+            arrays.append(pyarrow.array(column.to_numpy()))
+    return pyarrow.Table.from_arrays(arrays, names=[str(name) for name in frame.columns])
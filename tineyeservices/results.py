@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+from collections.abc import Mapping
+
+from .color import _parse_string
+
+
+def _color(value):
+    """ Convert a color as sent by the engine to an (R, G, B) tuple. """
+    if isinstance(value, str):
+        return _parse_string(value)[1]
+    return tuple(int(c) for c in value)
+
+
+def _float(value):
+    return float(value) if value is not None and value != '' else None
+
+
+def _int(value):
+    return int(value) if value is not None and value != '' else None
+
+
+class ResultObject(Mapping):
+    """
+    Read-only view of a dictionary from an API response.
+
+    Item access returns the values exactly as sent by the engine, so code
+    written for the JSON responses keeps working, while attribute access
+    converts the value to its Python type when it is read:
+
+        >>> match['score']
+        '97.2'
+        >>> match.score
+        97.2
+
+    Missing fields read as None through attributes. Use `to_dict` to get the
+    underlying JSON, for example to serialize it.
+    """
+
+    __slots__ = ('_raw',)
+
+    # Field name -> function converting the JSON value, for attribute access
+    _types = {}
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self._raw)
+
+    def __getitem__(self, key):
+        return self._raw[key]
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __getattr__(self, name):
+        try:
+            convert = self._types[name]
+        except KeyError:
+            raise AttributeError('%s has no field %r' % (type(self).__name__, name))
+        # `class` is a keyword, it is read as `class_`
+        value = self._raw.get(name.rstrip('_'))
+        return convert(value) if value is not None else None
+
+    def to_dict(self):
+        """ Return the underlying JSON dictionary. """
+        return self._raw
+
+
+class Match(ResultObject):
+    """
+    A search or compare match: `filepath`, `score`, `overlay` and, depending
+    on the engine, `match_percent`, `query_overlap_percent`,
+    `target_overlap_percent` and `metadata`.
+    """
+
+    __slots__ = ()
+
+    _types = {
+        'filepath': str,
+        'score': _float,
+        'overlay': str,
+        'match_percent': _float,
+        'query_overlap_percent': _float,
+        'target_overlap_percent': _float,
+        'metadata': lambda value: value}
+
+
+class ColorResult(ResultObject):
+    """ A color from a color extraction or counting response, with `color` as an (R, G, B) tuple. """
+
+    __slots__ = ()
+
+    _types = {
+        'color': _color,
+        'rank': _int,
+        'weight': _float,
+        'name': str,
+        'class_': str,
+        'num_images_partial_area': _float,
+        'num_images_full_area': _float}
+
+
+class Response(ResultObject):
+    """
+    An API response: `status`, `error`, `method` and `result`, whose items
+    are wrapped in `item_class` objects when the result is first read.
+    """
+
+    __slots__ = ('_result',)
+
+    _types = {'status': str, 'error': list, 'method': str}
+
+    # Class wrapping each item of `result`
+    item_class = ResultObject
+
+    def __init__(self, raw):
+        super(Response, self).__init__(raw)
+        self._result = None
+
+    def __getitem__(self, key):
+        if key == 'result':
+            return self.result
+        return self._raw[key]
+
+    @property
+    def result(self):
+        """ The items of the response, wrapped once on first access. """
+        if self._result is None:
+            item_class = self.item_class
+            self._result = [item_class(item) for item in self._raw.get('result') or []]
+        return self._result
+
+
+class SearchResult(Response):
+    """ A search response, whose `result` is a list of Match objects. """
+
+    __slots__ = ()
+    item_class = Match
+
+
+class CompareResult(Response):
+    """ A compare response, whose `result` is a list of Match objects. """
+
+    __slots__ = ()
+    item_class = Match
+
+
+class ColorResponse(Response):
+    """ A color extraction or counting response, whose `result` is a list of ColorResult objects. """
+
+    __slots__ = ()
+    item_class = ColorResult
+
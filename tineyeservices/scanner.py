@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .image import Image
+
+# File extensions of the image formats the engines accept
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp')
+
+
+class DirectoryScanner(object):
+    """
+    Find the image files under one or more directories, listing several
+    directories at once, and yield lazy Image objects whose bytes are only
+    read when their data is first used.
+
+    Listing is done with `os.scandir`, so files are only stat'ed when a size
+    or modification time filter needs it, which matters on network file systems.
+
+        >>> from tineyeservices import DirectoryScanner, Pipeline, MatchEngineRequest
+        >>> api = MatchEngineRequest(api_url='http://localhost/rest/')
+        >>> scanner = DirectoryScanner(min_size=1024, collection_filepath='relative')
+        >>> for images, response in Pipeline.ingest(api).run(scanner.scan('/data/photos')):
+        ...     pass
+        >>> scanner.stats
+        {'directories': 1200, 'files': 250000, 'images': 248000}
+
+    Arguments:
+
+    - `extensions`, file extensions to keep, compared case insensitively, or
+      None to keep every file.
+    - `min_size`, `max_size`, bounds on the file size in bytes.
+    - `modified_after`, `modified_before`, bounds on the file modification
+      time as a Unix timestamp.
+    - `collection_filepath`, how the collection filepath of each image is
+      derived: None for the file path as found, 'relative' for the path
+      relative to the scanned directory with '/' separators, or a function
+      taking the file path and the scanned directory.
+    - `follow_symlinks`, whether to follow symbolic links to directories.
+    - `max_workers`, maximum number of directories listed at once.
+    """
+
+    def __init__(
+            self, extensions=IMAGE_EXTENSIONS, min_size=None, max_size=None,
+            modified_after=None, modified_before=None, collection_filepath=None,
+            follow_symlinks=False, max_workers=8):
+        self.extensions = tuple(e.lower() for e in extensions) if extensions is not None else None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.modified_after = modified_after
+        self.modified_before = modified_before
+        self.collection_filepath = collection_filepath
+        self.follow_symlinks = follow_symlinks
+        self.max_workers = max_workers
+        self.stats = {'directories': 0, 'files': 0, 'images': 0}
+
+    def __repr__(self):
+        return "DirectoryScanner(extensions=%r, max_workers=%r)" % (self.extensions, self.max_workers)
+
+    def _needs_stat(self):
+        return (self.min_size is not None or self.max_size is not None or
+                self.modified_after is not None or self.modified_before is not None)
+
+    def _keep(self, entry):
+        """ Whether a directory entry for a file passes the filters. """
+        if self.extensions is not None and \
+                not entry.name.lower().endswith(self.extensions):
+            return False
+        if not self._needs_stat():
+            return True
+        stat = entry.stat(follow_symlinks=True)
+        if self.min_size is not None and stat.st_size < self.min_size:
+            return False
+        if self.max_size is not None and stat.st_size > self.max_size:
+            return False
+        if self.modified_after is not None and stat.st_mtime < self.modified_after:
+            return False
+        if self.modified_before is not None and stat.st_mtime >= self.modified_before:
+            return False
+        return True
+
+    def _list(self, path):
+        """ List one directory, returning its kept file paths and its subdirectories. """
+        files = []
+        directories = []
+        seen = 0
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                            directories.append(entry.path)
+                        elif entry.is_file():
+                            seen += 1
+                            if self._keep(entry):
+                                files.append(entry.path)
+                    except OSError:
+                        # The entry vanished or cannot be read, skip it
+                        continue
+        except OSError:
+            pass
+        return files, directories, seen
+
+    def _image(self, path, root):
+        if self.collection_filepath is None:
+            collection_filepath = path
+        elif self.collection_filepath == 'relative':
+            collection_filepath = os.path.relpath(path, root).replace(os.sep, '/')
+        else:
+            collection_filepath = self.collection_filepath(path, root)
+        return Image(filepath=path, collection_filepath=collection_filepath, lazy=True)
+
+    def scan(self, *roots):
+        """
+        Yield a lazy Image for every matching file under the given
+        directories. Files are yielded in no particular order.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            waiting = [(root, root) for root in roots]
+            pending = {}
+            # Real paths listed so far, to avoid loops through symbolic links
+            visited = set()
+            while waiting or pending:
+                # Keep a bounded number of listings queued
+                while waiting and len(pending) < 2 * self.max_workers:
+                    path, root = waiting.pop()
+                    if self.follow_symlinks:
+                        real = os.path.realpath(path)
+                        if real in visited:
+                            continue
+                        visited.add(real)
+                    pending[executor.submit(self._list, path)] = root
+
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    root = pending.pop(future)
+                    files, directories, seen = future.result()
+                    self.stats['directories'] += 1
+                    self.stats['files'] += seen
+                    self.stats['images'] += len(files)
+                    waiting.extend((directory, root) for directory in directories)
+                    for path in files:
+                        yield self._image(path, root)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .exception import TinEyeServiceDeadlineExceeded
+
+# Priority classes, most urgent first
+PRIORITIES = ('interactive', 'batch')
+
+
+def _session(pool_size):
+    """ Return a requests Session keeping up to `pool_size` connections per host. """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RequestScheduler(object):
+    """
+    Share an API between interactive requests, such as user-facing searches,
+    and batch requests, such as a bulk ingest, without the batch requests
+    delaying the interactive ones.
+
+    Each priority class gets its own connection pool and its own limit on
+    requests in flight. Batch requests waiting to start give way to any
+    waiting interactive request, and fewer batch requests run while
+    interactive requests are in flight. A batch request already uploading is
+    not interrupted.
+
+    Get a request object bound to a priority class with `with_priority`:
+
+        >>> from tineyeservices import MatchEngineRequest, RequestScheduler
+        >>> scheduler = RequestScheduler(interactive_workers=8, batch_workers=4)
+        >>> api = MatchEngineRequest(api_url='http://localhost/rest/')
+        >>> search_api = api.with_priority(scheduler, 'interactive')
+        >>> ingest_api = api.with_priority(scheduler, 'batch')
+        >>> ingest_api.add_image(images)  # in a background thread
+        >>> search_api.search_image(image)
+
+    Arguments:
+
+    - `interactive_workers`, maximum number of interactive requests in flight.
+    - `batch_workers`, maximum number of batch requests in flight.
+    - `busy_batch_workers`, maximum number of batch requests in flight while
+      interactive requests are in flight.
+    """
+
+    def __init__(self, interactive_workers=8, batch_workers=2, busy_batch_workers=1):
+        self.limits = {'interactive': interactive_workers, 'batch': batch_workers}
+        self.busy_batch_workers = busy_batch_workers
+        self.sessions = dict((priority, _session(limit)) for priority, limit in self.limits.items())
+        self.condition = threading.Condition()
+        self.running = dict((priority, 0) for priority in PRIORITIES)
+        self.waiting = dict((priority, 0) for priority in PRIORITIES)
+        self.stats = {'interactive': 0, 'batch': 0, 'batch_waits': 0}
+
+    def __repr__(self):
+        return "RequestScheduler(interactive_workers=%r, batch_workers=%r)" %\
+               (self.limits['interactive'], self.limits['batch'])
+
+    def _can_start(self, priority):
+        """ Whether a request of `priority` may start now. Call with the lock held. """
+        if self.running[priority] >= self.limits[priority]:
+            return False
+        if priority == 'batch':
+            if self.waiting['interactive']:
+                return False
+            if self.running['interactive'] and self.running['batch'] >= self.busy_batch_workers:
+                return False
+        return True
+
+    def call(self, priority, func, *args, deadline=None, **kwargs):
+        """
+        Call `func` with the connection pool of `priority` followed by `args`
+        and `kwargs` once a request of that priority class may start, and
+        return its result.
+
+        With a `deadline`, raises TinEyeServiceDeadlineExceeded if the
+        request is still waiting to start when it passes.
+        """
+        if priority not in self.limits:
+            raise ValueError('Unknown priority %r, expected one of: %s' %
+                             (priority, ', '.join(PRIORITIES)))
+
+        with self.condition:
+            if not self._can_start(priority):
+                if priority == 'batch':
+                    self.stats['batch_waits'] += 1
+                self.waiting[priority] += 1
+                try:
+                    while not self._can_start(priority):
+                        if deadline is None:
+                            self.condition.wait()
+                            continue
+                        remaining = deadline.remaining()
+                        if remaining <= 0:
+                            raise TinEyeServiceDeadlineExceeded(
+                                'Deadline of %ss exceeded waiting for a %s request to start' %
+                                (deadline.budget, priority))
+                        self.condition.wait(remaining)
+                finally:
+                    self.waiting[priority] -= 1
+            self.running[priority] += 1
+            self.stats[priority] += 1
+
+        try:
+            return func(self.sessions[priority], *args, **kwargs)
+        finally:
+            with self.condition:
+                self.running[priority] -= 1
+                self.condition.notify_all()
+
+    def close(self):
+        """ Close the connection pools. """
+        for session in self.sessions.values():
+            session.close()
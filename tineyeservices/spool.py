@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .image import Image
+from .parallel import is_retryable
+from .tuner import tuned
+from .write_queue import split_response
+
+
+def spooled_response(method):
+    """ The response returned for a write kept in the spool to be sent later. """
+    return {'status': 'warn', 'error': ['Spooled until the engine is available'],
+            'method': method, 'result': [], 'spooled': True}
+
+
+class WriteSpool(object):
+    """
+    Durable on-disk queue of `add_image`, `add_url`, `delete` and
+    `update_metadata` calls, so producers keep going while the engine is
+    restarted or reindexed.
+
+    Writes are sent to the engine directly while it is available. A write
+    that fails with a connection error, a timeout or a 5xx response is
+    appended to the spool instead, image bytes included, and so is every
+    later write until the spool is empty again, so writes are applied in the
+    order they were made. A background thread pings the engine every
+    `retry_interval` seconds and, once it answers, replays the spool in
+    batches of `batch_size` items with `max_workers` requests in flight.
+    Writes to the same filepath are never in flight at once.
+
+        >>> from tineyeservices import MatchEngineRequest, WriteSpool
+        >>> api = MatchEngineRequest(api_url='http://localhost/rest/')
+        >>> spool = WriteSpool(api, '/var/spool/matchengine.db')
+        >>> spool.add_image([Image(filepath='/path/to/image.jpg')])
+        {'status': 'warn', 'error': ['Spooled until the engine is available'], 'method': 'add_image',
+         'result': [], 'spooled': True}
+        >>> len(spool)
+        1
+
+    Spooled writes survive a restart of the process: a new WriteSpool on the
+    same file replays them.
+
+    Arguments:
+
+    - `request`, a request class instance. `update_metadata` needs a
+      MetadataRequest subclass.
+    - `path`, the SQLite file holding the spool, created if missing.
+    - `batch_size`, maximum number of items per replayed request. By
+      default, the `add_image` and `delete` batch sizes tuned for the engine
+      by a Tuner, or 100.
+    - `max_workers`, maximum number of replayed requests in flight at once,
+      by default the tuned `add_image` workers, or 4.
+    - `retry_interval`, number of seconds between pings while the engine is
+      unavailable.
+    - `defer`, if true, every write goes to the spool and is only sent by the
+      background thread, so producers never wait on the engine.
+    - `on_error`, a function called with the method, the arguments of the
+      call for one item and its response when a replayed item gets an error,
+      or the exception when it fails for a reason other than the engine
+      being unavailable. Such items are dropped from the spool. Errors are
+      matched to items by the filepath they name; the items of a batch that
+      failed as a whole are sent again one by one.
+    """
+
+    def __init__(
+            self, request, path, batch_size=None, max_workers=None, retry_interval=5.0,
+            defer=False, on_error=None):
+        self.request = request
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_sizes = {
+            'add_image': batch_size or tuned(request, 'add_image', 'batch_size', 100),
+            'add_url': batch_size or tuned(request, 'add_image', 'batch_size', 100),
+            'delete': batch_size or tuned(request, 'delete', 'batch_size', 100),
+            'update_metadata': batch_size or 100}
+        self.max_workers = max_workers or tuned(request, 'add_image', 'workers', 4)
+        self.retry_interval = retry_interval
+        self.defer = defer
+        self.on_error = on_error
+        self.stats = {'sent': 0, 'spooled': 0, 'replayed': 0, 'failed': 0}
+
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.replaying = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'method TEXT, filepath TEXT, url TEXT, data BLOB, metadata TEXT, options TEXT)')
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name='WriteSpool')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __repr__(self):
+        return "WriteSpool(request=%r, path=%r)" % (self.request, self.path)
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM spool').fetchone()[0]
+
+    def _empty(self):
+        with self.lock:
+            return not self.connection.execute('SELECT EXISTS (SELECT 1 FROM spool)').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_image(self, images, **kwargs):
+        """ Add a list of Image objects with data, as `add_image` does. """
+        rows = [(image.collection_filepath, None, image.data, image.metadata) for image in images]
+        return self._write('add_image', rows, images, kwargs)
+
+    def add_url(self, images, **kwargs):
+        """ Add a list of Image objects with URLs, as `add_url` does. """
+        rows = [(image.collection_filepath, image.url, None, image.metadata) for image in images]
+        return self._write('add_url', rows, images, kwargs)
+
+    def delete(self, filepaths, **kwargs):
+        """ Delete a list of collection filepaths, as `delete` does. """
+        rows = [(filepath, None, None, None) for filepath in filepaths]
+        return self._write('delete', rows, filepaths, kwargs)
+
+    def update_metadata(self, filepaths, metadata, **kwargs):
+        """ Update the metadata of a list of collection filepaths, as `update_metadata` does. """
+        if len(filepaths) != len(metadata):
+            raise ValueError('Need to pass the same number of filepaths and metadata')
+        rows = [(filepath, None, None, item) for filepath, item in zip(filepaths, metadata)]
+        return self._write('update_metadata', rows, (filepaths, metadata), kwargs)
+
+    def _write(self, method, rows, args, kwargs):
+        """ Send a write directly if nothing is spooled, otherwise spool it. """
+        if not self.defer and self._empty():
+            try:
+                response = self._call(method, args, kwargs)
+                self._count('sent', len(rows))
+                return response
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+        self._spool(method, rows, kwargs)
+        return spooled_response(method)
+
+    def _spool(self, method, rows, kwargs):
+        options = json.dumps(kwargs, sort_keys=True)
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT INTO spool (method, filepath, url, data, metadata, options) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(method, filepath, url, data, json.dumps(metadata), options)
+                 for filepath, url, data, metadata in rows])
+        with self.condition:
+            self.stats['spooled'] += len(rows)
+            self.condition.notify_all()
+
+    def _count(self, name, count):
+        with self.condition:
+            self.stats[name] += count
+
+    def _call(self, method, args, kwargs):
+        if method == 'update_metadata':
+            return self.request.update_metadata(args[0], args[1], **kwargs)
+        return getattr(self.request, method)(list(args), **kwargs)
+
+    def _rows(self, limit):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT id, method, filepath, url, data, metadata, options FROM spool '
+                'ORDER BY id LIMIT ?', (limit,)).fetchall()
+
+    def _remove(self, ids):
+        with self.lock, self.connection:
+            self.connection.executemany('DELETE FROM spool WHERE id = ?', [(i,) for i in ids])
+
+    def _args(self, method, rows):
+        """ Return the arguments of the call replaying spooled rows. """
+        metadata = [json.loads(row[5]) for row in rows]
+        if method == 'add_image':
+            return [Image.from_bytes(row[4], collection_filepath=row[2], metadata=item)
+                    for row, item in zip(rows, metadata)]
+        if method == 'add_url':
+            return [Image(url=row[3], collection_filepath=row[2], metadata=item)
+                    for row, item in zip(rows, metadata)]
+        if method == 'update_metadata':
+            return [row[2] for row in rows], metadata
+        return [row[2] for row in rows]
+
+    def _replay_batch(self, method, options, rows):
+        """ Send one batch of spooled rows, removing them unless the engine was unavailable. """
+        kwargs = json.loads(options)
+        try:
+            response = self._call(method, self._args(method, rows), kwargs)
+        except Exception as e:
+            if is_retryable(e):
+                raise
+            response = e
+
+        if isinstance(response, Exception):
+            responses = None
+        else:
+            responses = split_response(response, [row[2] for row in rows])
+        if responses is None:
+            if len(rows) > 1:
+                # Send the items again one by one so only the failing ones are dropped
+                for row in rows:
+                    self._replay_batch(method, options, [row])
+                return
+            responses = [response]
+
+        for row, item_response in zip(rows, responses):
+            if isinstance(item_response, Exception) or item_response.get('status') != 'ok':
+                self._count('failed', 1)
+                if self.on_error is not None:
+                    self.on_error(method, self._args(method, [row]), item_response)
+        self._remove([row[0] for row in rows])
+        self._count('replayed', len(rows))
+
+    def replay(self):
+        """
+        Send the spooled writes, oldest first, until the spool is empty or
+        the engine becomes unavailable. Consecutive writes of the same kind
+        to distinct filepaths are sent in concurrent batches, so a later
+        write to a filepath is only sent once the earlier one was applied.
+
+        Returns True if the spool was emptied.
+        """
+        with self.replaying, ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                rows = self._rows(max(self.batch_sizes.values()) * self.max_workers)
+                if not rows:
+                    return True
+                # Only the first run of writes of one kind can be sent at once,
+                # so a delete is never sent before an earlier add, and it stops
+                # at a filepath written twice so the two writes stay in order
+                key = (rows[0][1], rows[0][6])
+                run = []
+                filepaths = set()
+                for row in rows:
+                    if (row[1], row[6]) != key or row[2] in filepaths:
+                        break
+                    filepaths.add(row[2])
+                    run.append(row)
+                batch_size = self.batch_sizes[key[0]]
+                batches = [run[i:i + batch_size] for i in range(0, len(run), batch_size)]
+                futures = [executor.submit(self._replay_batch, key[0], key[1], batch)
+                           for batch in batches]
+                if any(future.exception() is not None for future in futures):
+                    return False
+
+    def _available(self):
+        try:
+            return self.request.ping().get('status') == 'ok'
+        except Exception:
+            return False
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed and self._empty():
+                    self.condition.wait()
+                if self.closed:
+                    return
+            if not (self._available() and self.replay()):
+                with self.condition:
+                    self.condition.wait(self.retry_interval)
+
+    def flush(self):
+        """
+        Replay the spool now if the engine is available. Returns True if the
+        spool is empty afterwards.
+        """
+        return self._available() and self.replay()
+
+    def close(self):
+        """ Stop the background thread. Spooled writes stay on disk for the next WriteSpool. """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        with self.lock:
+            self.connection.close()
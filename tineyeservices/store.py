@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import json
+import sqlite3
+import threading
+
+
+class SQLiteStore(object):
+    """
+    Thread safe key-value store of JSON values in a single SQLite table.
+
+    Arguments:
+
+    - `path`, the database file, created if missing. Use ':memory:' for a
+      store that only lives as long as the object.
+    - `table`, the table holding the values, so several stores can share
+      one database file.
+    """
+
+    table = 'store'
+
+    def __init__(self, path, table=None):
+        self.path = path
+        if table is not None:
+            self.table = table
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, value TEXT)' % self.table)
+
+    def __repr__(self):
+        return "%s(path=%r)" % (self.__class__.__name__, self.path)
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM %s' % self.table).fetchone()[0]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key):
+        """ Return the stored value for `key`, or None. """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT value FROM %s WHERE key = ?' % self.table, (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key, value):
+        """ Store the value for `key`, replacing any previous one. """
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        """ Store many `(key, value)` pairs in a single transaction. """
+        rows = [(key, json.dumps(value)) for key, value in items]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)' % self.table, rows)
+
+    def delete_many(self, keys):
+        """ Remove the values for `keys`, ignoring keys that are not stored. """
+        rows = [(key,) for key in keys]
+        with self.lock, self.connection:
+            self.connection.executemany('DELETE FROM %s WHERE key = ?' % self.table, rows)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
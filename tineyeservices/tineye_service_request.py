@@ -1,14 +1,33 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2018 TinEye. All rights reserved worldwide.
 
+import copy
+
 import requests
-from .exception import TinEyeServiceError, TinEyeServiceWarning
+from .deadline import Deadline
+from .exception import TinEyeServiceDeadlineExceeded, TinEyeServiceError, TinEyeServiceWarning
+from .multipart import MultipartEncoder
+from .spool import WriteSpool
+from .write_queue import WriteQueue
 from requests.auth import HTTPBasicAuth
 
 
 class TinEyeServiceRequest(object):
     """ Class to send requests to a TinEye servies API. """
 
+    # Set with `with_priority`
+    scheduler = None
+    priority = 'interactive'
+
+    # Set to a Compression to compress requests and responses
+    compression = None
+
+    # Set with `with_deadline`
+    deadline = None
+
+    # Set to a HostLimiter to share a limit on requests in flight with other processes
+    limiter = None
+
     def __init__(self, api_url='http://localhost/rest/', username=None, password=None):
 
         # The API URL must end in /rest/, if it does not, suggest a URL
@@ -38,13 +57,19 @@ class TinEyeServiceRequest(object):
         # Pass the extra arguments as parameters to the call
         params.update(kwargs)
 
-        response = None
-        url = self.api_url + method + '/'
-        if file_params is None:
-            response = requests.get(url, params=params, auth=auth, timeout=timeout)
-        else:
-            response = requests.post(
-                url, params=params, files=file_params, auth=auth, timeout=timeout)
+        try:
+            if self.scheduler is None:
+                response = self._send(requests, method, params, file_params, auth, timeout)
+            else:
+                response = self.scheduler.call(
+                    self.priority, self._send, method, params, file_params, auth, timeout,
+                    deadline=self.deadline)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            # A call cut short by the deadline is reported as such
+            if self.deadline is not None and self.deadline.expired:
+                raise TinEyeServiceDeadlineExceeded('Deadline of %ss exceeded during %s: %s' %
+                                                    (self.deadline.budget, method, e))
+            raise
 
         # Handle any HTTP errors
         if response.status_code != requests.codes.ok:
@@ -60,6 +85,78 @@ class TinEyeServiceRequest(object):
 
         return response_json
 
+    def _send(self, session, method, params, file_params, auth, timeout):
+        """ Send an HTTP request with `session`, a requests Session or the requests module. """
+        if self.limiter is None:
+            return self._send_request(session, method, params, file_params, auth, timeout)
+
+        # Waiting for a slot counts against the deadline
+        wait = self.deadline.remaining() if self.deadline is not None else None
+        slot = self.limiter.acquire(wait)
+        if slot is None:
+            raise TinEyeServiceDeadlineExceeded(
+                'Deadline of %ss exceeded waiting for a free slot for %s' % (self.deadline.budget, method))
+        try:
+            return self._send_request(session, method, params, file_params, auth, timeout)
+        finally:
+            self.limiter.release(slot)
+
+    def _send_request(self, session, method, params, file_params, auth, timeout):
+        url = self.api_url + method + '/'
+        if self.deadline is not None:
+            # Bound the call by the time left, which also counts any wait in a scheduler
+            timeout = self.deadline.timeout(timeout)
+        headers = {}
+        compressed = None
+        if self.compression is not None:
+            headers['Accept-Encoding'] = self.compression.accept_encoding(method)
+            if file_params is None:
+                compressed = self.compression.encode_params(method, params)
+
+        if compressed is not None:
+            body, body_headers = compressed
+            headers.update(body_headers)
+            response = session.post(url, data=body, headers=headers, auth=auth, timeout=timeout)
+        elif file_params is None:
+            response = session.get(url, params=params, headers=headers, auth=auth, timeout=timeout)
+        else:
+            # Stream the images from their buffers instead of joining them into one body
+            body = MultipartEncoder(file_params)
+            headers['Content-Type'] = body.content_type
+            response = session.post(url, params=params, data=body, headers=headers,
+                                    auth=auth, timeout=timeout)
+
+        if self.compression is not None:
+            self.compression.record_response(method, response)
+        return response
+
+    def with_priority(self, scheduler, priority='interactive'):
+        """
+        Return a copy of this request whose calls are run by a
+        RequestScheduler in the given priority class, 'interactive' or 'batch'.
+        """
+        request = copy.copy(self)
+        request.scheduler = scheduler
+        request.priority = priority
+        return request
+
+    def with_deadline(self, deadline, connect_timeout=None):
+        """
+        Return a copy of this request whose calls all share one time budget.
+
+        Arguments:
+
+        - `deadline`, a Deadline, a number of seconds from now, or None to
+          remove the deadline.
+        - `connect_timeout`, maximum number of seconds to wait for a
+          connection, when `deadline` is a number of seconds.
+        """
+        if deadline is not None and not isinstance(deadline, Deadline):
+            deadline = Deadline(deadline, connect_timeout=connect_timeout)
+        request = copy.copy(self)
+        request.deadline = deadline
+        return request
+
     def delete(self, filepaths, **kwargs):
         """
         Delete images from the collection.
@@ -115,6 +212,40 @@ class TinEyeServiceRequest(object):
         """
         return self._request('list', {'offset': offset, 'limit': limit}, **kwargs)
 
+    def iter_list(self, page_size=1000, **kwargs):
+        """
+        Iterate over the filepaths of every image in the collection, calling
+        `list` for `page_size` images at a time.
+
+        With a deadline, the filepaths listed before it passed are yielded
+        and TinEyeServiceDeadlineExceeded is then raised.
+        """
+        offset = 0
+        while True:
+            page = self.list(offset=offset, limit=page_size, **kwargs)['result']
+            for filepath in page:
+                yield filepath
+            if len(page) < page_size:
+                return
+            offset += len(page)
+
+    def write_queue(self, max_count=None, max_bytes=16 * 1024 * 1024, linger=0.1, split_failed=True):
+        """
+        Return a WriteQueue that batches single `add_image`, `add_url`,
+        `delete` and `update_metadata` calls to this API in the background.
+        """
+        return WriteQueue(self, max_count=max_count, max_bytes=max_bytes, linger=linger,
+                          split_failed=split_failed)
+
+    def write_spool(self, path, batch_size=None, max_workers=None, retry_interval=5.0, defer=False):
+        """
+        Return a WriteSpool that keeps the writes made through it in the
+        SQLite file `path` while this API is unavailable, and replays them
+        once it answers again.
+        """
+        return WriteSpool(self, path, batch_size=batch_size, max_workers=max_workers,
+                          retry_interval=retry_interval, defer=defer)
+
     def ping(self, **kwargs):
         """
         Check whether the API search server is running.
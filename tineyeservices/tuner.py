@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import copy
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Methods the tuner measures and the settings it finds for each
+TUNED_SETTINGS = {
+    'add_image': ('batch_size', 'workers'),
+    'search_image': ('workers',),
+    'delete': ('batch_size', 'workers')}
+
+# Profiles read by `tuned`, by file path, with the file modification time
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def default_profile_path():
+    """
+    Return the file holding the tuning profiles: the `TINEYESERVICES_PROFILES`
+    environment variable if set, otherwise `~/.tineyeservices/profiles.json`.
+    """
+    return os.environ.get('TINEYESERVICES_PROFILES') or \
+        os.path.join(os.path.expanduser('~'), '.tineyeservices', 'profiles.json')
+
+
+def _read_profiles(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def tuned(request, method, name, default):
+    """
+    Return the tuned `name` setting of `method` for the engine of `request`
+    from the saved profiles, or `default` if it was never tuned.
+
+    The profile file is only read again when it changes.
+    """
+    path = default_profile_path()
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return default
+    with _profiles_lock:
+        cached = _profiles.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = _profiles[path] = (mtime, _read_profiles(path))
+    profile = cached[1].get(getattr(request, 'api_url', None)) or {}
+    return profile.get('settings', {}).get(method, {}).get(name, default)
+
+
+class TuningProfile(object):
+    """
+    Batch sizes and worker counts tuned for one engine, as found by a Tuner.
+
+    Profiles are saved in one JSON file, keyed by API URL. Pipeline.ingest,
+    WriteQueue, WriteSpool and compare_matrix use the saved settings of
+    their request's engine when their batch size or worker count is not
+    given.
+
+    Arguments:
+
+    - `api_url`, the API URL of the engine.
+    - `settings`, a dictionary of `{method: {setting: value}}`, such as
+      `{'add_image': {'batch_size': 50, 'workers': 8}}`.
+    - `measurements`, the Tuner measurements the settings were chosen from.
+    """
+
+    def __init__(self, api_url, settings=None, measurements=None):
+        self.api_url = api_url
+        self.settings = settings or {}
+        self.measurements = measurements or {}
+
+    def __repr__(self):
+        return "TuningProfile(api_url=%r, settings=%r)" % (self.api_url, self.settings)
+
+    def get(self, method, name, default=None):
+        """ Return a tuned setting of a method, or `default`. """
+        return self.settings.get(method, {}).get(name, default)
+
+    def to_dict(self):
+        return {'settings': self.settings, 'measurements': self.measurements}
+
+    def save(self, path=None):
+        """ Save the profile, replacing the previous one for the same engine. """
+        path = path or default_profile_path()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        profiles = _read_profiles(path)
+        profiles[self.api_url] = self.to_dict()
+        # Write a new file and move it in place so readers never see half a file
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(profiles, f, indent=2, sort_keys=True)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, api_url, path=None):
+        """ Return the saved profile of an engine, or None. """
+        profile = _read_profiles(path or default_profile_path()).get(api_url)
+        if profile is None:
+            return None
+        return cls(api_url, profile.get('settings'), profile.get('measurements'))
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class Tuner(object):
+    """
+    Find the batch sizes and worker counts giving the best throughput on an
+    engine, by sweeping them for `add_image`, `search_image` and `delete`.
+
+    Each setting is measured on the sample images, added to the collection
+    under a temporary prefix and deleted afterwards. The setting kept for a
+    method is the knee of the curve: the one with the fewest workers, then
+    the smallest batches, that reaches `knee` of the best throughput
+    measured, among the settings with no failed calls and, with
+    `max_latency`, a 95th percentile call latency within it.
+
+        >>> from tineyeservices import MatchEngineRequest, Tuner
+        >>> api = MatchEngineRequest(api_url='http://localhost/rest/')
+        >>> profile = Tuner(api, images).tune()
+        >>> profile.settings
+        {'add_image': {'batch_size': 50, 'workers': 4}, 'delete': {'batch_size': 200, 'workers': 2},
+         'search_image': {'workers': 8}}
+
+    Run it against a test collection: the sample images are briefly part of
+    the collection, and the sweep puts the engine under full load.
+
+    Arguments:
+
+    - `request`, a request class instance.
+    - `images`, a list of sample Image objects with data, such as a few
+      hundred typical images.
+    - `batch_sizes`, the batch sizes to try for `add_image` and `delete`.
+    - `workers`, the numbers of requests in flight to try.
+    - `knee`, fraction of the best throughput a setting must reach.
+    - `max_latency`, maximum 95th percentile latency of a call in seconds.
+    """
+
+    def __init__(
+            self, request, images, batch_sizes=(1, 10, 25, 50, 100, 200),
+            workers=(1, 2, 4, 8, 16), knee=0.9, max_latency=None):
+        self.request = request
+        self.images = list(images)
+        self.batch_sizes = batch_sizes
+        self.workers = workers
+        self.knee = knee
+        self.max_latency = max_latency
+
+    def __repr__(self):
+        return "Tuner(request=%r, images=%r)" % (self.request, len(self.images))
+
+    def _samples(self):
+        """ Return copies of the sample images under a temporary prefix. """
+        prefix = 'tuning/%s/' % uuid.uuid4().hex
+        samples = []
+        for i, image in enumerate(self.images):
+            image = copy.copy(image)
+            image.collection_filepath = '%s%i' % (prefix, i)
+            samples.append(image)
+        return samples
+
+    def measure(self, func, batches, workers):
+        """
+        Call `func` on every batch with `workers` calls in flight and return
+        the throughput in items per second, the 50th and 95th percentile
+        latencies of the calls in seconds, and the number of failed calls.
+        """
+        def call(batch):
+            start = time.monotonic()
+            try:
+                ok = func(batch).get('status') == 'ok'
+            except Exception:
+                ok = False
+            return len(batch), time.monotonic() - start, ok
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            calls = list(executor.map(call, batches))
+        seconds = time.monotonic() - start
+
+        latencies = sorted(latency for _, latency, _ in calls)
+        items = sum(count for count, _, _ in calls)
+        return {
+            'throughput': items / seconds if seconds > 0 else 0.0,
+            'latency_p50': latencies[len(latencies) // 2] if latencies else 0.0,
+            'latency_p95': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+            if latencies else 0.0,
+            'failures': sum(1 for _, _, ok in calls if not ok)}
+
+    def sweep(self, method):
+        """
+        Measure every setting for one of `add_image`, `search_image` or
+        `delete`, returning a list of measurements with their `batch_size`
+        and `workers`.
+        """
+        if method not in TUNED_SETTINGS:
+            raise ValueError('method must be one of %s' % ', '.join(sorted(TUNED_SETTINGS)))
+
+        samples = self._samples()
+        filepaths = [image.collection_filepath for image in samples]
+        largest = max(self.batch_sizes)
+        measurements = []
+        try:
+            if method == 'search_image':
+                for batch in _chunks(samples, largest):
+                    self.request.add_image(batch)
+                search = lambda batch: self.request.search_image(batch[0])
+                for workers in self.workers:
+                    measurement = self.measure(search, _chunks(samples, 1), workers)
+                    measurement.update(batch_size=1, workers=workers)
+                    measurements.append(measurement)
+                return measurements
+
+            for batch_size in self.batch_sizes:
+                for workers in self.workers:
+                    if method == 'add_image':
+                        measurement = self.measure(
+                            self.request.add_image, _chunks(samples, batch_size), workers)
+                        # Remove the samples so the next setting adds rather than overwrites
+                        self._delete(filepaths)
+                    else:
+                        for batch in _chunks(samples, largest):
+                            self.request.add_image(batch)
+                        measurement = self.measure(
+                            self.request.delete, _chunks(filepaths, batch_size), workers)
+                    measurement.update(batch_size=batch_size, workers=workers)
+                    measurements.append(measurement)
+            return measurements
+        finally:
+            self._delete(filepaths)
+
+    def _delete(self, filepaths):
+        """ Remove the sample images from the collection. """
+        for batch in _chunks(filepaths, max(self.batch_sizes)):
+            self.request.delete(batch)
+
+    def choose(self, measurements):
+        """ Return the measurement at the knee of the throughput curve, or None. """
+        candidates = [m for m in measurements if not m['failures'] and
+                      (self.max_latency is None or m['latency_p95'] <= self.max_latency)]
+        if not candidates:
+            return None
+        best = max(m['throughput'] for m in candidates)
+        good = [m for m in candidates if m['throughput'] >= self.knee * best]
+        return min(good, key=lambda m: (m['workers'], m['batch_size']))
+
+    def tune(self, methods=('add_image', 'search_image', 'delete'), save=True, path=None):
+        """
+        Sweep each method and return a TuningProfile of the chosen
+        settings, saved to `path` (the default profile file if None) when
+        `save` is true. Methods with no usable setting are left out.
+        """
+        profile = TuningProfile(self.request.api_url)
+        for method in methods:
+            measurements = self.sweep(method)
+            profile.measurements[method] = measurements
+            chosen = self.choose(measurements)
+            if chosen is not None:
+                profile.settings[method] = dict((name, chosen[name]) for name in TUNED_SETTINGS[method])
+        if save:
+            profile.save(path)
+        return profile
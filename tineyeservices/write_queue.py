@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 TinEye. All rights reserved worldwide.
+
+import atexit
+import threading
+import time
+from concurrent.futures import Future
+
+from .tuner import tuned
+
+
+class WriteQueue(object):
+    """
+    Write-behind queue that collects single image writes and sends them to
+    the engine in batches from a background thread.
+
+    Each call returns a Future resolved with the API response for that item.
+    Pending writes are sent once `max_count` items or `max_bytes` bytes are
+    queued, or `linger` seconds after the first one was queued. Batches are
+    sent one at a time in the order the writes were made, so a delete queued
+    after an add of the same filepath is applied after it.
+
+        >>> from tineyeservices import MatchEngineRequest, Image, WriteQueue
+        >>> api = MatchEngineRequest(api_url='http://localhost/rest/')
+        >>> with WriteQueue(api, max_count=100, linger=0.5) as queue:
+        ...     future = queue.add_image(Image(filepath='/path/to/image.jpg'))
+        >>> future.result()
+        {'status': 'ok', 'error': [], 'method': 'add', 'result': []}
+
+    Arguments:
+
+    - `request`, a request class instance. `update_metadata` needs a
+      MetadataRequest subclass.
+    - `max_count`, maximum number of items per request. By default, the
+      `add_image` and `delete` batch sizes tuned for the engine by a Tuner,
+      or 100.
+    - `max_bytes`, maximum total size of the images and metadata per request.
+    - `linger`, maximum number of seconds a write waits for more writes to
+      batch with.
+    - `split_failed`, if true, the items of a batch that failed as a whole,
+      with no error naming an item, are sent again one by one so each future
+      gets the response for its own item.
+
+    Each future gets a response of its own: the errors the engine reports for
+    the filepath of its item, with status ok if there are none. Queued writes
+    are sent when the interpreter exits, so a WriteQueue that is never closed
+    is only released then.
+    """
+
+    def __init__(
+            self, request, max_count=None, max_bytes=16 * 1024 * 1024, linger=0.1,
+            split_failed=True):
+        self.request = request
+        self.max_count = max_count
+        self.max_counts = {
+            'add_image': max_count or tuned(request, 'add_image', 'batch_size', 100),
+            'add_url': max_count or tuned(request, 'add_image', 'batch_size', 100),
+            'delete': max_count or tuned(request, 'delete', 'batch_size', 100),
+            'update_metadata': max_count or 100}
+        self.max_bytes = max_bytes
+        self.linger = linger
+        self.split_failed = split_failed
+        self.condition = threading.Condition()
+        self.pending = []
+        self.pending_method = None
+        self.pending_bytes = 0
+        self.pending_since = None
+        self.batches = []
+        self.sending = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name='WriteQueue')
+        self.thread.daemon = True
+        self.thread.start()
+        # The background thread is a daemon, so queued writes are sent at exit
+        atexit.register(self.close)
+
+    def __repr__(self):
+        return "WriteQueue(request=%r, max_count=%r, linger=%r)" %\
+               (self.request, self.max_count, self.linger)
+
+    def __len__(self):
+        with self.condition:
+            return len(self.pending) + sum(len(batch[1]) for batch in self.batches) + self.sending
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_image(self, image):
+        """ Queue an Image with data to be added with `add_image`, returning a Future. """
+        if image.data is None:
+            raise ValueError('add_image needs an Image with data, use add_url for URLs')
+        return self._put('add_image', image, len(image.data) + _metadata_size(image.metadata))
+
+    def add_url(self, image):
+        """ Queue an Image with a URL to be added with `add_url`, returning a Future. """
+        return self._put('add_url', image, len(image.url) + _metadata_size(image.metadata))
+
+    def delete(self, filepath):
+        """ Queue a collection filepath to be deleted, returning a Future. """
+        return self._put('delete', filepath, len(filepath))
+
+    def update_metadata(self, filepath, metadata):
+        """ Queue a metadata update for a collection filepath, returning a Future. """
+        return self._put('update_metadata', (filepath, metadata),
+                         len(filepath) + _metadata_size(metadata))
+
+    def _put(self, method, item, size):
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise ValueError('WriteQueue is closed')
+            # A batch only holds one kind of write
+            if self.pending and (method != self.pending_method or
+                                 self.pending_bytes + size > self.max_bytes):
+                self._seal()
+            if not self.pending:
+                self.pending_method = method
+                self.pending_since = time.time()
+            self.pending.append((item, future))
+            self.pending_bytes += size
+            if len(self.pending) >= self.max_counts[method] or self.pending_bytes >= self.max_bytes:
+                self._seal()
+            self.condition.notify_all()
+        return future
+
+    def _seal(self):
+        """ Move the pending writes to the batches ready to send. Call with the lock held. """
+        if self.pending:
+            self.batches.append((self.pending_method, self.pending))
+        self.pending = []
+        self.pending_method = None
+        self.pending_bytes = 0
+        self.pending_since = None
+
+    def flush(self):
+        """ Send every queued write and wait until all of them are resolved. """
+        with self.condition:
+            self._seal()
+            self.condition.notify_all()
+            while self.batches or self.sending:
+                self.condition.wait()
+
+    def close(self):
+        """ Send every queued write, then stop the background thread. """
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self._seal()
+            self.condition.notify_all()
+        self.thread.join()
+        atexit.unregister(self.close)
+
+    def _next_batch(self):
+        """ Wait for a batch to send, returning None once closed and drained. """
+        with self.condition:
+            while True:
+                if not self.batches and self.pending and \
+                        time.time() - self.pending_since >= self.linger:
+                    self._seal()
+                if self.batches:
+                    method, batch = self.batches.pop(0)
+                    self.sending = len(batch)
+                    return method, batch
+                if self.closed:
+                    return None
+                if self.pending:
+                    self.condition.wait(self.pending_since + self.linger - time.time())
+                else:
+                    self.condition.wait()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            method, items = batch
+            try:
+                self._send(method, items)
+            finally:
+                with self.condition:
+                    self.sending = 0
+                    self.condition.notify_all()
+
+    def _call(self, method, items):
+        if method == 'update_metadata':
+            return self.request.update_metadata(
+                [item[0] for item in items], [item[1] for item in items])
+        return getattr(self.request, method)(items)
+
+    def _send(self, method, items):
+        # Writes whose future was cancelled while queued are dropped
+        items = [(item, future) for item, future in items if future.set_running_or_notify_cancel()]
+        if not items:
+            return
+        try:
+            response = self._call(method, [item for item, future in items])
+        except Exception as e:
+            for item, future in items:
+                future.set_exception(e)
+            return
+
+        responses = split_response(response, [_filepath(method, item) for item, future in items])
+        if responses is None:
+            if self.split_failed and len(items) > 1:
+                return self._send_each(method, items)
+            responses = [dict(response) for item in items]
+        for (item, future), item_response in zip(items, responses):
+            future.set_result(item_response)
+
+    def _send_each(self, method, items):
+        for item, future in items:
+            try:
+                future.set_result(self._call(method, [item]))
+            except Exception as e:
+                future.set_exception(e)
+
+
+def split_response(response, filepaths):
+    """
+    Split the response of a batched write into one response per filepath.
+
+    The engine names the item of each error, as in `'folder/banana.jpg:
+    Failed to remove from index.'`, so each filepath gets its own errors and
+    status ok if it has none. Errors naming no filepath of the batch are
+    given to every filepath. Returns None if the call failed as a whole,
+    with no error naming a filepath.
+    """
+    errors = dict((filepath, []) for filepath in filepaths)
+    shared = []
+    for error in response.get('error') or []:
+        owner = None
+        if isinstance(error, str):
+            # The longest prefix wins, as filepaths may contain ': ' too
+            for i in range(len(error) - 1, 0, -1):
+                if error[i] == ':' and error[:i] in errors:
+                    owner = error[:i]
+                    break
+        if owner is None:
+            shared.append(error)
+        else:
+            errors[owner].append(error)
+
+    if response.get('status') == 'fail' and not any(errors.values()):
+        return None
+    responses = []
+    for filepath in filepaths:
+        item_response = dict(response)
+        item_response['error'] = errors[filepath] + shared
+        if errors[filepath]:
+            item_response['status'] = 'fail'
+        elif not shared:
+            item_response['status'] = 'ok'
+        responses.append(item_response)
+    return responses
+
+
+def _filepath(method, item):
+    """ Return the collection filepath a queued write is for. """
+    if method == 'delete':
+        return item
+    if method == 'update_metadata':
+        return item[0]
+    return item.collection_filepath
+
+
+def _metadata_size(metadata):
+    return len(metadata) if isinstance(metadata, str) else 0